@@ -0,0 +1,503 @@
+"""
+네이버 금융, 디시인사이드(PC/모바일) 페이지를 흉내 내는 로컬 mock 서버
+크롤러를 실제 사이트에 보내지 않고 최대 속도로 돌려볼 때 쓴다.
+응답 지연, 에러율, 429 응답 비율, 게시판 페이지 수 등을 조절할 수 있고
+ilgaminati API 대신 post를 받아주는 endpoint도 있다.
+
+    python -m benchmarks.mock_site --port 8080 --latency 0.05
+    python -m benchmarks.mock_site --throttle-rate 0.01 --error-rate 0.01
+
+실행하면 크롤러에 넘길 환경변수가 출력된다. GET /_mock/stats로
+경로별 요청 수와 받은 post 수를 볼 수 있다.
+MockProxy는 받은 요청을 그대로 전달하는 HTTP proxy로, ProxyPool을
+실제 proxy 없이 확인할 때 쓴다.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import threading
+from collections import namedtuple
+
+import aiohttp
+from aiohttp import web
+
+MockConfig = namedtuple(
+    "MockConfig",
+    "latency, error_rate, throttle_rate, retry_after, boards, pages,"
+    " posts_per_page, comments, hot_ratio, seed",
+    defaults=(0.0, 0.0, 0.0, 1, 30, 10, 20, 30, 0.3, 0),
+)
+# 네이버 cbox, 디시 모바일 댓글 한 페이지의 댓글 수
+CBOX_PAGE_SIZE = 100
+MOBILE_COMMENT_PAGE_SIZE = 20
+# 게시판 별 가장 최근 글 번호
+FIRST_POST_ID = 5_000_000
+# 인기글의 공감(추천) 수, 나머지 글은 이보다 작은 값이 나온다
+HOT_AGREE = 50
+
+# MockProxy가 전달하지 않는 header (연결마다 따로 정해지는 것들)
+HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+    "content-length",
+    "content-encoding",
+}
+
+Listing = namedtuple("Listing", "post_id, agree, disagree, views, comments")
+
+
+def env(url: str):
+    """
+    크롤러들을 url의 mock 서버로 보내는 환경변수
+    """
+    return {
+        "ILGAMINATI_NAVER_URL": url,
+        "ILGAMINATI_NAVER_COMMENT_URL": url,
+        "ILGAMINATI_DC_URL": url,
+        "ILGAMINATI_DC_MOBILE_URL": url,
+        "ILGAMINATI_API_URL": url + "/api/crawling/posts",
+    }
+
+
+class MockSite:
+    """
+    mock 서버 하나
+    같은 event loop에서 쓸 때는 async with, 크롤러와 loop를 나누고 싶을
+    때는 with를 쓴다. (with는 서버를 별도 thread에서 돌린다)
+    페이지 내용은 글 번호로 정해지므로 같은 요청에는 늘 같은 응답이 나온다.
+    """
+
+    def __init__(
+        self, config: MockConfig = None, host="127.0.0.1", port: int = 0
+    ):
+        """
+        :param config: 지연, 에러율, 페이지 수 등
+        :param port: 0이면 빈 port를 골라서 쓴다
+        """
+        self.config = config or MockConfig()
+        self.host = host
+        self.port = port
+        self.stats = collections.Counter()
+        self.posts = 0
+        self._random = random.Random(self.config.seed)
+        self._runner = None
+        self._thread = None
+        self._loop = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def env(self):
+        return env(self.url)
+
+    # --- 글 목록 ------------------------------------------------------
+
+    def _listing(self, page: int):
+        """
+        page 번째 목록 페이지의 글들, 마지막 페이지를 넘으면 빈 list
+        """
+        config = self.config
+        if not 1 <= page <= config.pages:
+            return []
+        start = FIRST_POST_ID - (page - 1) * config.posts_per_page
+        rows = []
+        for post_id in range(start, start - config.posts_per_page, -1):
+            # 글 번호로 정해지는 값이라 페이지를 다시 받아도 같은 값이 나온다
+            h = post_id * 2654435761 % 2**32
+            hot = h % 1000 < config.hot_ratio * 1000
+            rows.append(
+                Listing(
+                    post_id=post_id,
+                    agree=HOT_AGREE + h % 50 if hot else h % 5,
+                    disagree=h % 7,
+                    views=100 + h % 900,
+                    comments=config.comments,
+                )
+            )
+        return rows
+
+    # --- finance.naver.com ------------------------------------------
+
+    async def naver_trend(self, request):
+        rows = "".join(
+            f'<tr><td class="no">{n}</td><td><a href="/item/main.naver'
+            f'?code={n:06d}" class="tltle">종목{n}</a></td>'
+            f'<td class="number">1.00</td></tr>'
+            for n in range(1, self.config.boards + 1)
+        )
+        return _html(f'<table class="type_5"><tbody>{rows}</tbody></table>')
+
+    async def naver_board(self, request):
+        code = request.query["code"]
+        page = int(request.query.get("page", 1))
+        rows = "".join(
+            f'<tr><td><span class="tah p10 gray03">2022.10.17 12:00</span>'
+            f'</td><td class="title"><a href="/item/board_read.naver?'
+            f"code={code}&amp;nid={row.post_id}&amp;st=&amp;sw=&amp;page="
+            f'{page}" title="글 {row.post_id}">글 {row.post_id}</a></td>'
+            f'<td class="p11"><span class="gray03">abcd****</span></td>'
+            f'<td><span class="tah p10 gray03">{row.views}</span></td>'
+            f'<td><strong class="tah p10 red01">{row.agree}</strong></td>'
+            f'<td><strong class="tah p10 blue01">{row.disagree}</strong>'
+            f"</td></tr>"
+            for row in self._listing(page)
+        )
+        return _html(f'<table class="type2"><tbody>{rows}</tbody></table>')
+
+    async def naver_post(self, request):
+        nid = int(request.query["nid"])
+        return _html(
+            '<table class="view"><tbody><tr>'
+            '<th class="gray03 p9 tah">2022.10.17 12:00</th>'
+            '<th class="tah gray03 p9"><span>조회</span> <span>812</span>'
+            " <span>공감</span><strong>25</strong> <span>비공감</span>"
+            "<strong>3</strong></th></tr><tr><th><span class="
+            '"gray03"><strong>abcd ****</strong></span></th></tr>'
+            f'</tbody></table><div id="body">글 {nid}의 본문입니다.'
+            "<br>두 번째 줄</div>"
+        )
+
+    async def naver_comments(self, request):
+        nid = int(request.query["objectId"])
+        page = int(request.query.get("page", 1))
+        size = int(request.query.get("pageSize", CBOX_PAGE_SIZE))
+        total = self.config.comments
+        first = (page - 1) * size
+        comments = [
+            {
+                "commentNo": nid * 1000 + total - n,
+                "contents": f"댓글 {total - n}",
+                "replyAllCount": 0,
+                "userName": "abcd****",
+                "modTime": "2022-10-17T12:00:00+0900",
+                "sympathyCount": n % 5,
+                "antipathyCount": n % 3,
+            }
+            for n in range(first, min(first + size, total))
+        ]
+        result = {
+            "commentList": comments,
+            "pageModel": {"page": page, "totalPages": -(-total // size)},
+        }
+        body = json.dumps({"success": True, "result": result})
+        return web.Response(
+            text=f"_callback({body});", content_type="application/javascript"
+        )
+
+    # --- gall.dcinside.com ------------------------------------------
+
+    async def dc_list(self, request):
+        gallery = request.query["id"]
+        page = int(request.query.get("page", 1))
+        rows = "".join(
+            f'<tr class="ub-content us-post" data-no="{row.post_id}">'
+            f'<td class="gall_num">{row.post_id}</td>'
+            f'<td class="gall_subject">일반</td>'
+            f'<td class="gall_tit ub-word"><a href="/mgallery/board/view/'
+            f'?id={gallery}&amp;no={row.post_id}&amp;page={page}">'
+            f"글 {row.post_id}</a></td>"
+            f'<td class="gall_recommend">{row.agree}</td></tr>'
+            for row in self._listing(page)
+        )
+        return _html(f'<table class="gall_list"><tbody>{rows}</tbody></table>')
+
+    async def dc_view(self, request):
+        no = request.query["no"]
+        return _html(
+            f'<span class="title_subject">글 {no}</span>'
+            '<span class="nickname" title="ㅇㅇ"></span>'
+            '<span class="gall_date" title="2022-10-17 12:00:00"></span>'
+            f'<div class="write_div"><p>글 {no}의 본문입니다.</p></div>'
+            '<div class="up_num_box"><p>15</p></div>'
+            '<div class="down_num_box"><p>1</p></div>'
+        )
+
+    # --- m.dcinside.com ---------------------------------------------
+
+    async def mobile_board(self, request):
+        board_id = request.match_info["board_id"]
+        page = int(request.query.get("page", 1))
+        rows = "".join(
+            f'<li><div class="gall-detail-lnktb"><a href="/board/{board_id}/'
+            f'{row.post_id}" class="lt"><span class="subject-add">'
+            f'<span class="sp-lst sp-lst-txt">텍스트</span>'
+            f'<span class="subjectin">글 {row.post_id}</span></span>'
+            f'<ul class="ginfo"><li>일반</li><li>ㅇㅇ</li><li>12:00</li>'
+            f"<li>조회 {row.views}</li><li>추천 <span>{row.agree}</span>"
+            f'</li></ul></a><a href="/board/{board_id}/{row.post_id}'
+            f'#comment_box" class="rt"><span class="ct">{row.comments}'
+            f"</span></a></div></li>"
+            for row in self._listing(page)
+        )
+        return _html(f'<ul class="gall-detail-lst">{rows}</ul>')
+
+    async def mobile_document(self, request):
+        board_id = request.match_info["board_id"]
+        document_id = request.match_info["document_id"]
+        return _html(
+            '<div class="gallview-tit-box"><span class="tit">'
+            f'글 {document_id}</span><div class="btm">'
+            '<ul class="ginfo2"><li>ㅇㅇ</li><li>2022.10.17 12:00</li></ul>'
+            "</div></div>"
+            '<ul class="ginfo2"><li>조회수 812</li></ul>'
+            f'<div class="thum-txtin"><p>{board_id} 글 {document_id}의 '
+            "본문입니다.</p></div>"
+            '<span id="recomm_btn">15</span>'
+            '<span id="nonrecomm_btn">1</span>'
+            '<span id="recomm_btn_member">2</span>'
+        )
+
+    async def mobile_comments(self, request):
+        form = await request.post()
+        no = int(form["no"])
+        page = int(form.get("cpage", 1))
+        total = self.config.comments
+        first = (page - 1) * MOBILE_COMMENT_PAGE_SIZE
+        last = min(first + MOBILE_COMMENT_PAGE_SIZE, total)
+        rows = "".join(
+            f'<li class="comment" no="{no * 1000 + n}"><a class="nick">ㅇㅇ'
+            '<span class="blockCommentId">(1.2)</span></a>'
+            f'<p class="txt">댓글 {n}</p><span class="date">12:00</span></li>'
+            for n in range(first, last)
+        )
+        pages = max(1, -(-total // MOBILE_COMMENT_PAGE_SIZE))
+        return web.Response(
+            text=f'<div class="all-comment-tit"></div>'
+            f'<ul class="all-comment-lst">{rows}</ul>'
+            f'<span class="pgnum">{page}<span>/{pages}</span></span>',
+            content_type="text/html",
+        )
+
+    # --- ilgaminati API ---------------------------------------------
+
+    async def ingest(self, request):
+        await request.json()
+        self.posts += 1
+        return web.json_response({"ok": True})
+
+    async def show_stats(self, request):
+        return web.json_response({"posts": self.posts, **self.stats})
+
+    @web.middleware
+    async def faults(self, request, handler):
+        """
+        설정에 따라 응답을 늦추거나 429/503으로 대신한다.
+        """
+        if request.path.startswith("/_mock/"):
+            return await handler(request)
+        config = self.config
+        route = request.match_info.route.name or request.path
+        self.stats[route] += 1
+        if config.latency > 0:
+            await asyncio.sleep(self._random.expovariate(1 / config.latency))
+        if self._random.random() < config.throttle_rate:
+            self.stats["429"] += 1
+            return web.Response(
+                status=429, headers={"Retry-After": str(config.retry_after)}
+            )
+        if self._random.random() < config.error_rate:
+            self.stats["503"] += 1
+            return web.Response(status=503)
+        return await handler(request)
+
+    def app(self):
+        app = web.Application(middlewares=[self.faults])
+        routes = [
+            ("GET", "/sise/lastsearch2.naver", self.naver_trend),
+            ("GET", "/item/board.naver", self.naver_board),
+            ("GET", "/item/board_read.naver", self.naver_post),
+            (
+                "GET",
+                "/commentBox/cbox/web_naver_list_jsonp.json",
+                self.naver_comments,
+            ),
+            ("GET", "/mgallery/board/lists/", self.dc_list),
+            ("GET", "/mgallery/board/view/", self.dc_view),
+            ("GET", "/board/{board_id}", self.mobile_board),
+            ("GET", "/board/{board_id}/{document_id}", self.mobile_document),
+            ("POST", "/ajax/response-comment", self.mobile_comments),
+            ("POST", "/api/crawling/posts", self.ingest),
+            ("GET", "/_mock/stats", self.show_stats),
+        ]
+        for method, path, handler in routes:
+            app.router.add_route(method, path, handler, name=handler.__name__)
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *err):
+        await self.close()
+
+    def _serve(self, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self.start())
+        ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self.close())
+        self._loop.close()
+
+    def __enter__(self):
+        ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._serve, args=(ready,), daemon=True
+        )
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def __exit__(self, *err):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class MockProxy:
+    """
+    받은 요청을 그대로 전달하는 로컬 HTTP proxy (http:// 주소만)
+    forwarded로 전달한 요청 수를 센다.
+    """
+
+    def __init__(self, host="127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.forwarded = 0
+        self._runner = None
+        self._session = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def forward(self, request):
+        headers = {
+            name: value
+            for name, value in request.headers.items()
+            if name.lower() not in HOP_HEADERS
+        }
+        async with self._session.request(
+            request.method,
+            request.url,
+            headers=headers,
+            data=await request.read() or None,
+            allow_redirects=False,
+        ) as response:
+            body = await response.read()
+            headers = {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() not in HOP_HEADERS
+            }
+        self.forwarded += 1
+        return web.Response(status=response.status, body=body, headers=headers)
+
+    async def start(self):
+        self._session = aiohttp.ClientSession()
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self.forward)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *err):
+        await self.close()
+
+
+def _html(body: str):
+    return web.Response(
+        text=f"<!DOCTYPE html><html><body>{body}</body></html>",
+        content_type="text/html",
+    )
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """
+    MockConfig를 조절하는 인자들을 parser에 추가한다.
+    """
+    default = MockConfig()
+    parser.add_argument(
+        "--latency", type=float, default=default.latency, help="평균 지연(초)"
+    )
+    parser.add_argument("--error-rate", type=float, default=default.error_rate)
+    parser.add_argument(
+        "--throttle-rate", type=float, default=default.throttle_rate
+    )
+    parser.add_argument("--retry-after", type=int, default=default.retry_after)
+    parser.add_argument(
+        "--boards", type=int, default=default.boards, help="검색상위 종목 수"
+    )
+    parser.add_argument(
+        "--pages", type=int, default=default.pages, help="게시판 당 페이지 수"
+    )
+    parser.add_argument(
+        "--posts-per-page", type=int, default=default.posts_per_page
+    )
+    parser.add_argument(
+        "--comments", type=int, default=default.comments, help="글 당 댓글 수"
+    )
+    parser.add_argument("--hot-ratio", type=float, default=default.hot_ratio)
+    parser.add_argument("--seed", type=int, default=default.seed)
+
+
+def config_from_args(args):
+    return MockConfig(
+        **{field: getattr(args, field) for field in MockConfig._fields}
+    )
+
+
+async def serve(config: MockConfig, host: str, port: int):
+    async with MockSite(config, host, port) as site:
+        for name, value in site.env().items():
+            print(f"export {name}={value}", flush=True)
+        await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(config_from_args(args), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+저장해 둔 fixture 페이지로 각 파서의 속도와 메모리 사용량을 잰다.
+네트워크 없이 돌아가므로 파서를 고칠 때마다 돌려서 느려지지 않았는지 본다.
+
+    python -m benchmarks.parsers                  # 전체 파서
+    python -m benchmarks.parsers dc_m             # 이름에 dc_m이 들어간 파서만
+    python -m benchmarks.parsers --save base.json # 결과 저장
+    python -m benchmarks.parsers --baseline base.json
+                                                  # 저장한 결과보다 느려지면 실패
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+from crawler import extract, temp
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+# 파서 하나를 반복해서 돌릴 최소 시간(초)
+MIN_TIME = 1.0
+# baseline보다 이 비율 이상 느려지면 회귀로 본다
+TOLERANCE = 0.2
+
+Case = namedtuple("Case", "name, func, fixture")
+Result = namedtuple(
+    "Result", "name, pages_per_sec, mb_per_sec, peak_kib, blocks"
+)
+
+CASES = [
+    Case(
+        "naver_lastsearch2",
+        extract.naver_trend_stocks,
+        "naver_lastsearch2.html",
+    ),
+    Case("naver_board", extract.naver_listing, "naver_board.html"),
+    Case("naver_board_read", extract.naver_post, "naver_board_read.html"),
+    Case("naver_cbox", extract.naver_comments, "naver_cbox.jsonp"),
+    Case("dc_list", extract.dc_listing, "dc_list.html"),
+    Case("dc_view", extract.dc_post, "dc_view.html"),
+    Case("dc_m_list", temp._parse_board, "dc_m_list.html"),
+    Case("dc_m_document", temp._parse_document, "dc_m_document.html"),
+    Case("dc_m_comments", temp._parse_comments, "dc_m_comments.html"),
+]
+
+
+def load_fixture(name: str):
+    with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def measure_speed(func, text: str, min_time: float = MIN_TIME):
+    """
+    min_time 동안 func(text)를 반복해서 돌린다.
+    :return: 초당 처리한 페이지 수
+    """
+    func(text)
+    count = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        func(text)
+        count += 1
+        elapsed = time.perf_counter() - start
+    return count / elapsed
+
+
+def measure_memory(func, text: str):
+    """
+    func(text) 한 번에 쓰는 메모리
+    :return: (최대 사용량 byte, 결과가 붙잡고 있는 할당 block 수)
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = func(text)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(
+        stat.count_diff for stat in after.compare_to(before, "filename")
+    )
+    del result
+    return peak, blocks
+
+
+def run(cases=CASES, min_time: float = MIN_TIME):
+    results = []
+    for case in cases:
+        text = load_fixture(case.fixture)
+        speed = measure_speed(case.func, text, min_time)
+        peak, blocks = measure_memory(case.func, text)
+        results.append(
+            Result(
+                name=case.name,
+                pages_per_sec=speed,
+                mb_per_sec=speed * len(text.encode()) / 1e6,
+                peak_kib=peak / 1024,
+                blocks=blocks,
+            )
+        )
+    return results
+
+
+def report(results, baseline: dict = None):
+    """
+    결과를 표로 출력한다.
+    :param baseline: {이름: 저장해 둔 결과 dict}, 있으면 변화율도 출력
+    :return: baseline보다 TOLERANCE 이상 느려진 파서 이름의 list
+    """
+    print(
+        f"{'parser':<20}{'pages/s':>10}{'MB/s':>8}"
+        f"{'peak KiB':>10}{'blocks':>8}{'change':>9}"
+    )
+    regressions = []
+    for r in results:
+        change = ""
+        if baseline and r.name in baseline:
+            ratio = r.pages_per_sec / baseline[r.name]["pages_per_sec"] - 1
+            change = f"{ratio:+.1%}"
+            if ratio < -TOLERANCE:
+                regressions.append(r.name)
+        print(
+            f"{r.name:<20}{r.pages_per_sec:>10.1f}{r.mb_per_sec:>8.2f}"
+            f"{r.peak_kib:>10.1f}{r.blocks:>8}{change:>9}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("names", nargs="*", help="돌릴 파서 이름(의 일부)")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME)
+    parser.add_argument("--save", help="결과를 저장할 json 파일")
+    parser.add_argument("--baseline", help="비교할 json 파일")
+    args = parser.parse_args(argv)
+
+    cases = [
+        case
+        for case in CASES
+        if not args.names or any(name in case.name for name in args.names)
+    ]
+    results = run(cases, args.min_time)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({r.name: r._asdict() for r in results}, f, indent=2)
+    if regressions:
+        print(f"Slower than baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+mock 서버(benchmarks.mock_site)에 크롤러 pipeline 전체를 돌려서
+초당 처리하는 글 수와 요청 수, 요청 latency 분포를 잰다.
+rate limit은 풀어두므로 mock 서버의 지연/에러 설정이 없으면 파싱, queue,
+state 기록 등 크롤러 자체의 처리량이 나온다.
+
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline dc_mobile --boards 8 --pages 5
+    python -m benchmarks.pipeline --latency 0.05 --throttle-rate 0.01
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+import aiohttp
+
+from benchmarks import mock_site
+from crawler import dcinside_async_v1, naver_finance_async, temp
+from utils.frontier import Frontier
+from utils.limiter import HostLimit, RateLimiter
+from utils.metrics import METRICS
+from utils.parse_pool import ParsePool
+from utils.session import shared_session
+
+
+def unlimited(workers: int):
+    """
+    host 별 rate limit 없이 동시 요청 수만 제한하는 RateLimiter
+    """
+    return RateLimiter(
+        limits={},
+        default=HostLimit(concurrency=workers * 2, rate=1e9, burst=10**9),
+    )
+
+
+def point_at(url: str):
+    """
+    이미 import된 크롤러들이 url의 mock 서버로 요청을 보내게 한다.
+    (환경변수는 import 시점에만 읽히므로 module 변수를 직접 바꾼다)
+    """
+    dcinside_async_v1.BASE_URL = url
+    naver_finance_async.COMMENT_URL = naver_finance_async.COMMENT_URL.replace(
+        naver_finance_async.COMMENT_BASE_URL, url
+    )
+    naver_finance_async.COMMENT_BASE_URL = url
+    naver_finance_async.BASE_URL = url
+    temp.MOBILE_URL = url
+
+
+def latency_tracer(latencies: list):
+    """
+    요청 하나가 끝날 때마다 걸린 시간(초)을 latencies에 모으는 TraceConfig
+    """
+
+    async def on_start(session, context, params):
+        context.start = time.perf_counter()
+
+    async def on_end(session, context, params):
+        latencies.append(time.perf_counter() - context.start)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+    return trace
+
+
+def percentile(values: list, q: float):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def bench_dcinside(session, boards, pages, workers, parser):
+    crawler = dcinside_async_v1.DCInsideCrawler(
+        10, limiter=unlimited(workers), max_pages=pages, parser=parser
+    )
+    frontier = Frontier(
+        lambda frontier, item: crawler.crawl(session, frontier, item),
+        workers=workers,
+    )
+    for n in range(boards):
+        crawler.push_page(frontier, f"bench{n}", page=1)
+    return [post async for post in crawler.stream(session, frontier, workers)]
+
+
+async def bench_naver(session, boards, pages, workers, parser):
+    crawler = naver_finance_async.NaverFinanceCrawler(
+        limiter=unlimited(workers), max_pages=pages, parser=parser
+    )
+    trends = naver_finance_async.TrendStocks(crawler.limiter, parser=parser)
+    frontier = Frontier(
+        lambda frontier, item: crawler.crawl(session, frontier, item),
+        workers=workers,
+    )
+    for stock in (await trends.refresh(session))[:boards]:
+        crawler.push_page(frontier, stock.symbol, stock.code, page=1)
+    return [post async for post in crawler.stream(session, frontier, workers)]
+
+
+async def bench_dc_mobile(session, boards, pages, workers, parser):
+    api = temp.API(session, limiter=unlimited(workers), parser=parser)
+    semaphore = asyncio.Semaphore(workers)
+
+    async def comments(document):
+        async with semaphore:
+            try:
+                return [comment async for comment in document.comments()]
+            except Exception as e:
+                logging.warning(
+                    "Failed to fetch comments of %s: %r", document.id, e
+                )
+
+    documents = []
+    for n in range(boards):
+        indexes = [index async for index in api.board(f"bench{n}")]
+        resolved = await api.resolve_documents(indexes, workers)
+        documents += [document for document in resolved if document]
+    await asyncio.gather(*[comments(document) for document in documents])
+    return documents
+
+
+BENCHES = {
+    "dcinside": bench_dcinside,
+    "naver": bench_naver,
+    "dc_mobile": bench_dc_mobile,
+}
+
+
+async def run(names, config, workers, parse_workers, metrics=False):
+    latencies = []
+    with mock_site.MockSite(config) as site, ParsePool(
+        parse_workers
+    ) as parser:
+        point_at(site.url)
+        async with shared_session(
+            limit_per_host=workers * 2,
+            trace_configs=[latency_tracer(latencies)],
+        ) as session:
+            for name in names:
+                latencies.clear()
+                start = time.perf_counter()
+                posts = await BENCHES[name](
+                    session, config.boards, config.pages, workers, parser
+                )
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{name:<10} {len(posts):>6} posts {len(latencies):>6}"
+                    f" requests in {elapsed:6.2f}s"
+                    f" {len(posts) / elapsed:8.1f} posts/s"
+                    f" {len(latencies) / elapsed:8.1f} req/s"
+                    f"  p50 {percentile(latencies, 0.5) * 1000:6.1f}ms"
+                    f"  p99 {percentile(latencies, 0.99) * 1000:6.1f}ms"
+                )
+        print(f"mock server: {dict(site.stats)}")
+    if metrics:
+        print(METRICS.render(), end="")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("names", nargs="*", help=", ".join(BENCHES))
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument(
+        "--metrics", action="store_true", help="끝나고 수집한 metric 출력"
+    )
+    mock_site.add_arguments(parser)
+    parser.set_defaults(boards=4, pages=5)
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(BENCHES)
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.ERROR)
+    asyncio.run(
+        run(
+            args.names or list(BENCHES),
+            mock_site.config_from_args(args),
+            args.workers,
+            args.parse_workers,
+            args.metrics,
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+main을 import하는 데 걸리는 시간을 python -X importtime으로 잰다.
+daemon/shard mode에서는 worker 프로세스마다 이 시간을 치르므로,
+예산을 넘기거나 무거운 module이 다시 import되기 시작하면 실패한다.
+
+    python -m benchmarks.startup                  # main import 시간
+    python -m benchmarks.startup --top 20         # 오래 걸린 module 20개
+    python -m benchmarks.startup crawler.naver_finance_async
+                                                  # 다른 module을 잴 때
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import namedtuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# import 시간 예산(ms), 대부분은 aiohttp가 차지한다
+IMPORT_BUDGET = 500
+# 재는 횟수 (가장 빠른 값을 쓴다)
+REPEAT = 5
+# 크롤러를 import할 때 끌려오면 안 되는 module
+# (필요한 곳에서만 import하도록 미뤄둔 것들)
+FORBIDDEN = (
+    "fake_useragent",
+    "pandas",
+    "numpy",
+    "requests",
+    "multiprocessing",
+    "aiohttp.web",
+)
+
+Entry = namedtuple("Entry", "module, self_us, cumulative_us")
+
+
+def import_time(module: str = "main"):
+    """
+    새 interpreter에서 module을 import하고 -X importtime 출력을 읽는다.
+    :return: module마다 Entry의 list (import된 순서)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        entries.append(Entry(name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def run(module: str = "main", repeat: int = REPEAT):
+    """
+    :return: repeat번 잰 것 중 가장 빨랐던 회차의 Entry들
+    """
+    runs = [import_time(module) for _ in range(repeat)]
+    return min(runs, key=lambda entries: entries[-1].cumulative_us)
+
+
+def report(entries, top: int = 10):
+    total = entries[-1].cumulative_us / 1000
+    print(f"import {entries[-1].module}: {total:.1f}ms")
+    print(f"{'module':<40} {'self ms':>9} {'cum ms':>9}")
+    slowest = sorted(entries, key=lambda entry: entry.self_us, reverse=True)
+    for entry in slowest[:top]:
+        print(
+            f"{entry.module:<40} {entry.self_us / 1000:>9.1f} "
+            f"{entry.cumulative_us / 1000:>9.1f}"
+        )
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--budget", type=float, default=IMPORT_BUDGET, help="예산(ms)"
+    )
+    args = parser.parse_args(argv)
+
+    entries = run(args.module, args.repeat)
+    total = report(entries, args.top)
+    imported = {entry.module for entry in entries}
+    forbidden = [name for name in FORBIDDEN if name in imported]
+    failed = False
+    if forbidden:
+        print(f"Imported at startup: {', '.join(forbidden)}")
+        failed = True
+    if total > args.budget:
+        print(f"Over budget: {total:.1f}ms > {args.budget:.0f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
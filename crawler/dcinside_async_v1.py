@@ -1,16 +1,31 @@
 import asyncio
-import aiohttp
-from bs4 import BeautifulSoup
-from fake_useragent import UserAgent
-from itertools import chain
+import contextlib
+import logging
+import os
+from crawler import extract
+from db_manager import Post, PostBatch
+from utils import pipeline
+from utils.frontier import Frontier, HighWaterMarks
+from utils.http_cache import HTTPCache, fetch_text
+from utils.limiter import RateLimiter
+from utils.parse_pool import ParsePool
+from utils.poller import Poller
+from utils.session import shared_session
+from utils.state import NEW, STALE, CrawlState
+from utils.user_agent import random_user_agent
 
+log = logging.getLogger(__name__)
 
-UA = UserAgent()
 HEADERS = {
-    "User-Agent": UA.random,
+    "User-Agent": random_user_agent(),
 }
 
-BASE_URL = "https://gall.dcinside.com"
+PLATFORM = "dcinside"
+# 부하 테스트에서는 mock 서버 주소로 바꾼다
+BASE_URL = os.environ.get("ILGAMINATI_DC_URL", "https://gall.dcinside.com")
+# 본문을 못 가져왔을 때 다시 시도하는 횟수와 간격(초)
+RETRIES = 3
+RETRY_DELAY = 60
 GALLERIES = [
     "stockus",
     "neostock",
@@ -25,99 +40,345 @@ GALLERIES = [
 ]
 
 
+def page_url(gallery, page):
+    return BASE_URL + "/mgallery/board/lists/?id=" + gallery + f"&page={page}"
+
+
 class DCInsideCrawler:
-    def __init__(self, standard: int):
-        print("Init Crawler..!")
+    def __init__(
+        self,
+        standard: int,
+        limiter: RateLimiter = None,
+        max_pages: int = 30,
+        max_cold_pages: int = 3,
+        marks: HighWaterMarks = None,
+        state: CrawlState = None,
+        cache: HTTPCache = None,
+        parser: ParsePool = None,
+    ):
+        """
+        :param standard: 인기글로 볼 최소 추천 수
+        :param max_pages: 갤러리 당 최대로 넘길 페이지 수
+        :param max_cold_pages: 인기글 없는 페이지가 이만큼 이어지면 멈춤
+        :param marks: 갤러리 별 지난 실행의 high-water mark
+        :param state: 이미 가져온 글을 기록하는 state (없으면 메모리에만 기록)
+        :param cache: 목록/글 페이지를 보관할 HTTPCache (없으면 사용 안 함)
+        :param parser: html을 파싱할 ParsePool (없으면 event loop에서 파싱)
+        """
+        log.debug("Init Crawler..!")
         self.standard = standard
-        return None
+        self.limiter = limiter or RateLimiter()
+        self.max_pages = max_pages
+        self.max_cold_pages = max_cold_pages
+        self.state = state or CrawlState(":memory:")
+        self.marks = marks or self.state.high_water_marks(PLATFORM)
+        self.cache = cache
+        self.parser = parser or ParsePool(workers=0)
+        # 가져와서 올리는 중인 (갤러리, 글 번호), 다른 페이지에 또 나와도 넘긴다
+        self.in_flight = set()
 
     @staticmethod
     def announcement_checker(posts: list):
-        print("Removing Announcement..!")
-        posts = [
-            post
-            for post in posts
-            if post.select("td.gall_subject")[0].text != "공지"
-        ]
+        log.debug("Removing Announcement..!")
+        posts = [post for post in posts if post.subject != "공지"]
         return posts
 
     def top_post_checker(self, posts: list):
-        print("Checking Top Posts..")
-        posts_href = [
-            post.select("a")[0].get("href")
-            for post in posts
-            if int(post.select("td.gall_recommend")[0].text) > self.standard
-        ]
+        log.debug("Checking Top Posts..")
+        posts_href = [post for post in posts if post.recommend > self.standard]
         if len(posts_href) == 0:
-            print("No Recommended Posts")
+            log.debug("No Recommended Posts")
         return posts_href
 
     async def fetch_posts(self, session, post_href: list):
-        print("Fetching Post..!")
+        log.debug("Fetching Post..!")
         url = BASE_URL + post_href
 
-        content = None
-        while content is None:
-            async with session.get(url, headers=HEADERS) as response:
-                html = await response.text()
-                soup = BeautifulSoup(html, "lxml")
-                try:
-                    content = soup.select_one("div.write_div").text
-                except AttributeError:
-                    asyncio.sleep(60)
-                    pass
-                content = content.replace("\n", "").replace(
-                    "  - dc official App", ""
-                )
-
-                post = {}
-                post["title"] = soup.select_one("span.title_subject").text
-                post["author"] = soup.select_one("span.nickname").get("title")
-                post["reg_ts"] = soup.select_one("span.gall_date").get("title")
-                post["content"] = content
-                post["agree"] = soup.select_one("div.up_num_box > p").text
-                post["disagree"] = soup.select_one("div.down_num_box > p").text
-                return print(post)
+        for attempt in range(1, RETRIES + 1):
+            html = await fetch_text(
+                session, url, self.limiter, self.cache, headers=HEADERS
+            )
+            record = await self.parser.parse(extract.dc_post, html)
+            if record is not None:
+                break
+            # 본문이 없으면 차단당한 것이므로 잠시 쉬었다가 다시 시도
+            if self.cache is not None:
+                self.cache.invalidate(url)
+            if attempt < RETRIES:
+                await asyncio.sleep(RETRY_DELAY)
+        else:
+            log.warning("Failed to fetch %s", url)
+            return None
+
+        post = Post(
+            title=record.title,
+            content=record.content,
+            stock_name="",
+            author=record.author,
+            reg_ts=record.reg_ts,
+            views=0,
+            likes=record.agree,
+            dislikes=record.disagree,
+            platform=PLATFORM,
+            url=url,
+        )
+        log.debug("%s", post)
+        return post
 
     async def fetch_page(self, session, gallery, page):
-        print("Fetching Page..!")
-        url = (
-            BASE_URL + "/mgallery/board/lists/?id=" + gallery + f"&page={page}"
+        log.debug("Fetching Page..!")
+        url = page_url(gallery, page)
+        log.debug("Now Crawling %s gallery's page #%d", gallery, page)
+        html = await fetch_text(
+            session, url, self.limiter, self.cache, headers=HEADERS
+        )
+        post_list = await self.parser.parse(extract.dc_listing, html)
+
+        if page == 1:
+            post_list = self.announcement_checker(post_list)
+        posts_href = self.top_post_checker(post_list)
+        post_ids = [post.id for post in post_list]
+        return posts_href, post_ids, post_list
+
+    def push_page(self, frontier, gallery, page, hot=0, cold=0):
+        """
+        갤러리 페이지를 frontier에 넣는다.
+        직전 페이지에 인기글이 많았던 갤러리일수록 다음 페이지를 먼저 본다.
+        """
+        frontier.push(
+            page_url(gallery, page),
+            kind="page",
+            priority=page - hot,
+            gallery=gallery,
+            page=page,
+            cold=cold,
         )
+
+    def is_new_top_post(self, hit):
+        """
+        pipeline의 filter stage
+        추천 수가 standard를 넘고 아직 가져오지 않은 글만 통과시킨다.
+        :param hit: (gallery, DCListingRow)
+        """
+        gallery, row = hit
+        if (
+            row.recommend <= self.standard
+            or (gallery, row.id) in self.in_flight
+        ):
+            return False
+        status = self.state.check(PLATFORM, gallery, row.id)
+        if status == STALE:
+            # 이미 가져온 글은 다시 가져오지 않고 목록의 추천 수만 갱신
+            self.state.record_post(
+                PLATFORM, gallery, row.id, agree=row.recommend
+            )
+        if status != NEW:
+            return False
+        self.in_flight.add((gallery, row.id))
+        return True
+
+    async def fetch_hit(self, session, hit):
+        """
+        pipeline의 post stage
+        filter를 통과한 글의 내용을 가져온다.
+        state에는 sink가 글을 올린 뒤 uploaded()에서 기록한다.
+        :param hit: (gallery, DCListingRow)
+        """
+        gallery, row = hit
+        post = None
+        try:
+            post = await self.fetch_posts(session, row.href)
+        finally:
+            if post is None:
+                # 못 가져온 글을 다음 실행에서 다시 보도록 mark를 올리지 않는다
+                self.in_flight.discard((gallery, row.id))
+                self.marks.fail(gallery)
+        if post is None:
+            return None
+        return post._replace(
+            board=gallery, post_id=row.id, agree=row.recommend
+        )
+
+    def uploaded(self, post, error=None):
+        """
+        sink가 글의 전송을 마치면 부르는 callback
+        올라간 글만 state에 기록한다. 못 올린 글은 갤러리의 mark를 올리지
+        않아서 다음 실행에서 다시 가져온다.
+        :param error: 전송에 실패했으면 그 예외
+        """
+        self.in_flight.discard((post.board, post.post_id))
+        if error is not None:
+            self.marks.fail(post.board)
+            return
+        self.state.record_post(
+            PLATFORM,
+            post.board,
+            post.post_id,
+            likes=post.likes,
+            dislikes=post.dislikes,
+            agree=post.agree,
+        )
+
+    async def crawl(self, session, frontier, item):
+        """
+        frontier에서 꺼낸 갤러리 페이지 하나를 처리하는 handler
+        다음 페이지를 frontier에 넣고, 페이지의 글들을 추천 수 순으로
+        pipeline에 흘려보낸다.
+        :return: (gallery, DCListingRow)의 list
+        """
+        meta = item.meta
+        gallery = meta["gallery"]
         try:
-            async with session.get(url, headers=HEADERS) as response:
-                asyncio.sleep(3)
-                print(f"Now Crawling {gallery} gallery's page #{page}")
-                html = await response.text()
-                soup = BeautifulSoup(html, "lxml")
-                post_list = soup.select("tr.ub-content.us-post")
-
-                if page == 1:
-                    post_list = self.announcement_checker(post_list)
-                posts_href = self.top_post_checker(post_list)
-
-                async with aiohttp.ClientSession() as session:
-                    result = await asyncio.gather(
-                        *[
-                            self.fetch_posts(session, href)
-                            for href in posts_href
-                        ]
-                    )
-                return result
-        except aiohttp.ClientConnectionError:
-            print("Oops, the connection was dropped before we finished")
-
-
-async def dc_main():
+            posts_href, post_ids, post_list = await self.fetch_page(
+                session, gallery, meta["page"]
+            )
+        except Exception:
+            # 이 페이지와 그 뒤의 글들을 못 봤으므로 mark를 올리지 않는다
+            self.marks.fail(gallery)
+            raise
+
+        # 지난 실행에서 본 글에 닿았거나, 인기글 없는 페이지가 이어지면 멈춘다
+        passed = self.marks.observe(gallery, post_ids)
+        cold = 0 if posts_href else meta["cold"] + 1
+        if (
+            post_ids
+            and not passed
+            and cold < self.max_cold_pages
+            and meta["page"] < self.max_pages
+        ):
+            self.push_page(
+                frontier, gallery, meta["page"] + 1, len(posts_href), cold
+            )
+        post_list.sort(key=lambda row: -row.recommend)
+        return [(gallery, row) for row in post_list]
+
+    async def poll(self, session, sink, gallery: str, workers: int = 4):
+        """
+        daemon mode에서 갤러리 하나의 지난 poll 이후 새 글들을 확인하고
+        인기글을 sink에 넣는다.
+        :return: 새로 올라온 글 수 (처음 보는 갤러리면 None)
+        """
+        frontier = Frontier(
+            lambda frontier, item: self.crawl(session, frontier, item),
+            workers=1,
+            name="dcinside.poll",
+        )
+        self.push_page(frontier, gallery, page=1)
+        posts = self.stream(session, frontier, workers)
+        async with contextlib.aclosing(posts) as posts:
+            # 올리지 못한 글이 있으면 mark를 올리지 않도록 전송까지 기다린다
+            await sink.put_all(posts, self.uploaded)
+        new_posts = self.marks.advance(gallery)
+        self.state.save_marks(PLATFORM, self.marks, [gallery])
+        return new_posts
+
+    def stream(self, session, frontier, workers: int = 8):
+        """
+        갤러리 페이지 → 인기글 고르기 → 글 내용 순으로 이어진 pipeline
+        글은 가져오는 대로 하나씩 나온다. 받은 쪽에서 글을 다 처리하면
+        uploaded()를 불러야 state에 기록된다.
+        :param frontier: 첫 페이지들을 넣어둔 Frontier
+        :param workers: 글 내용을 동시에 가져올 수
+        """
+        hits = frontier.stream(maxsize=workers * 4)
+        hits = pipeline.select(hits, self.is_new_top_post)
+        return pipeline.stage(
+            hits,
+            lambda hit: self.fetch_hit(session, hit),
+            workers=workers,
+            name="dcinside.post",
+        )
+
+
+async def crawl_dcinside(
+    session,
+    limiter,
+    state,
+    cache,
+    parser,
+    sink=None,
+    workers: int = 8,
+    shard=None,
+):
+    """
+    GALLERIES의 인기글을 sink에 넣는다.
+    high-water mark는 끝까지 돌았을 때만 저장한다.
+    :param sink: 없으면 가져온 글을 PostBatch에 모아서 돌려준다
+                 (이때 batch에 담은 글은 state에 올린 것으로 기록되므로,
+                  sink로 올리는 실행과 같은 state 파일을 쓰면 안 된다)
+    :param shard: 있으면 이 worker가 시작할 때 lease를 잡은 갤러리만 돈다
+    :return: sink에 넣은 글 수 (sink가 없으면 가져온 글의 PostBatch)
+    """
+    galleries = GALLERIES
+    if shard is not None:
+        await shard.register(PLATFORM, galleries)
+        galleries = [g for g in galleries if shard.holds(PLATFORM, g)]
     standard = 10
-    c = DCInsideCrawler(standard)
-    async with aiohttp.ClientSession() as session:
-        result = await asyncio.gather(
-            *[
-                c.fetch_page(session, gallery, page=i + 1)
-                for gallery in GALLERIES
-                for i in range(30)
-            ]
+    c = DCInsideCrawler(
+        standard, limiter, state=state, cache=cache, parser=parser
+    )
+    frontier = Frontier(
+        lambda frontier, item: c.crawl(session, frontier, item),
+        workers=workers,
+        name="dcinside.frontier",
+    )
+    for gallery in galleries:
+        c.push_page(frontier, gallery, page=1)
+    # 취소되면 pipeline의 task들을 바로 정리하도록 명시적으로 닫는다
+    async with contextlib.aclosing(c.stream(session, frontier, workers)) as s:
+        if sink is None:
+            # 넘겨줄 sink가 없으면 batch에 담는 것으로 끝난다
+            posts = PostBatch()
+            async for post in s:
+                posts.append(post)
+                c.uploaded(post)
+            count = len(posts)
+        else:
+            # 올리지 못한 글의 갤러리는 mark를 저장하지 않도록 전송까지 기다린다
+            count = await sink.put_all(s, c.uploaded)
+    state.save_marks(PLATFORM, c.marks)
+    log.info("Fetched %d posts", count)
+    return posts if sink is None else count
+
+
+async def watch_dcinside(
+    session,
+    limiter,
+    state,
+    cache,
+    parser,
+    sink,
+    workers: int = 4,
+    shard=None,
+):
+    """
+    GALLERIES를 갤러리마다 글이 올라오는 속도에 맞춘 간격으로 계속
+    확인하면서 새 인기글을 sink에 넣는다. 취소될 때까지 돈다.
+    :param shard: 있으면 이 worker가 lease를 잡은 갤러리만 확인한다
+    """
+    if shard is not None:
+        await shard.register(PLATFORM, GALLERIES)
+
+    def owns(gallery):
+        return shard is None or shard.holds(PLATFORM, gallery)
+
+    c = DCInsideCrawler(10, limiter, state=state, cache=cache, parser=parser)
+    poller = Poller(
+        lambda gallery: c.poll(session, sink, gallery, workers=workers),
+        name=PLATFORM,
+        owns=owns,
+    )
+    await poller.run(GALLERIES)
+
+
+async def dc_main(session=None, workers: int = 8, limiter=None):
+    if session is None:
+        async with shared_session() as session:
+            return await dc_main(session, workers, limiter)
+
+    # 올리지 않는 글들이 crawl_state에 기록되지 않도록 state는 메모리에 둔다
+    state = CrawlState(":memory:")
+    with HTTPCache() as cache, state, ParsePool() as parser:
+        return await crawl_dcinside(
+            session, limiter, state, cache, parser, workers=workers
         )
-        result = [r for res in result for r in res]
-        print(result)
@@ -1,14 +1,26 @@
-import asyncio
-import aiohttp
-from bs4 import BeautifulSoup
-from fake_useragent import UserAgent
+import logging
+import os
+from crawler import extract
+from db_manager import Post, PostBatch
+from utils import pipeline
+from utils.frontier import Frontier, HighWaterMarks
+from utils.http_cache import HTTPCache, fetch_text
+from utils.limiter import RateLimiter
+from utils.parse_pool import ParsePool
+from utils.session import close_session, create_session
+from utils.state import NEW, STALE, CrawlState
+from utils.user_agent import random_user_agent
+
+log = logging.getLogger(__name__)
+
 
-UA = UserAgent()
 HEADERS = {
-    "User-Agent": UA.random,
+    "User-Agent": random_user_agent(),
 }
 
-BASE_URL = "https://gall.dcinside.com"
+PLATFORM = "dcinside"
+# 부하 테스트에서는 mock 서버 주소로 바꾼다
+BASE_URL = os.environ.get("ILGAMINATI_DC_URL", "https://gall.dcinside.com")
 GALLERIES = [
     "stockus",
     "neostock",
@@ -23,14 +35,40 @@ GALLERIES = [
 ]
 
 
+def page_url(gallery, page):
+    return BASE_URL + "/mgallery/board/lists/?id=" + gallery + f"&page={page}"
+
+
 class DCInsideCrawler:
-    def __init__(self, standard: int):
-        print("Init Crawler..!")
-        self.session = aiohttp.ClientSession(headers=HEADERS)
+    def __init__(
+        self,
+        standard: int,
+        session=None,
+        limiter: RateLimiter = None,
+        max_pages: int = 30,
+        max_cold_pages: int = 3,
+        marks: HighWaterMarks = None,
+        state: CrawlState = None,
+        cache: HTTPCache = None,
+        parser: ParsePool = None,
+    ):
+        log.debug("Init Crawler..!")
+        self.limiter = limiter or RateLimiter()
+        self.max_pages = max_pages
+        self.max_cold_pages = max_cold_pages
+        self.state = state or CrawlState(":memory:")
+        self.marks = marks or self.state.high_water_marks(PLATFORM)
+        self.cache = cache
+        self.parser = parser or ParsePool(workers=0)
+        # 가져와서 올리는 중인 (갤러리, 글 번호), 다른 페이지에 또 나와도 넘긴다
+        self.in_flight = set()
+        self.owns_session = session is None
+        self.session = session or create_session(headers=HEADERS)
         self.standard = standard
 
     async def close(self):
-        await self.session.close()
+        if self.owns_session:
+            await close_session(self.session)
 
     async def __aenter__(self):
         return self
@@ -40,68 +78,178 @@ class DCInsideCrawler:
 
     @staticmethod
     def announcement_checker(posts: list):
-        print("Removing Announcement..!")
-        posts = [
-            post
-            for post in posts
-            if post.select("td.gall_subject")[0].text != "공지"
-        ]
+        log.debug("Removing Announcement..!")
+        posts = [post for post in posts if post.subject != "공지"]
         return posts
 
     def top_post_checker(self, posts: list):
-        print("Checking Top Posts..")
-        posts_href = [
-            post.select("a")[0].get("href")
-            for post in posts
-            if int(post.select("td.gall_recommend")[0].text) > self.standard
-        ]
+        log.debug("Checking Top Posts..")
+        posts_href = [post for post in posts if post.recommend > self.standard]
         return posts_href
 
     async def fetch_posts(self, posts_href):
-        if posts_href == None:
-            yield None
+        if posts_href is None:
+            return
         url = BASE_URL + posts_href
-        async with self.session.get(url) as res:
-            html = await res.text()
-            soup = BeautifulSoup(html, "lxml")
-        try:
-            content = soup.select_one("div.write_div").text
-        except AttributeError:
-            yield print("AttributeError")
-        content = content.replace("\n", "").replace("  - dc official App", "")
-        post = {}
-        post["title"] = soup.select_one("span.title_subject").text
-        post["author"] = soup.select_one("span.nickname").get("title")
-        post["reg_ts"] = soup.select_one("span.gall_date").get("title")
-        post["content"] = content
-        post["agree"] = soup.select_one("div.up_num_box > p").text
-        post["disagree"] = soup.select_one("div.down_num_box > p").text
-        print(post)
+        html = await fetch_text(
+            self.session, url, self.limiter, self.cache, headers=HEADERS
+        )
+        record = await self.parser.parse(extract.dc_post, html)
+        if record is None:
+            log.warning("No post body in %s", url)
+            return
+        post = Post(
+            title=record.title,
+            content=record.content,
+            stock_name="",
+            author=record.author,
+            reg_ts=record.reg_ts,
+            views=0,
+            likes=record.agree,
+            dislikes=record.disagree,
+            platform=PLATFORM,
+            url=url,
+        )
+        log.debug("%s", post)
         yield (post)
 
     async def fetch_top_posts_href(self, gallery, page):
-        print(f"Now Crawling {gallery} gallery's page #{page}")
-        url = (
-            BASE_URL + "/mgallery/board/lists/?id=" + gallery + f"&page={page}"
+        log.debug("Now Crawling %s gallery's page #%d", gallery, page)
+        url = page_url(gallery, page)
+        html = await fetch_text(
+            self.session, url, self.limiter, self.cache, headers=HEADERS
         )
-        async with self.session.get(url, headers=HEADERS) as res:
-            html = await res.text()
-            soup = BeautifulSoup(html, "lxml")
-        post_list = soup.select("tr.ub-content.us-post")
+        post_list = await self.parser.parse(extract.dc_listing, html)
 
         if page == 1:
             post_list = self.announcement_checker(post_list)
         posts_href = self.top_post_checker(post_list)
+        post_ids = [post.id for post in post_list]
         if len(posts_href) == 0:
-            return print("No top post in this page")
-        print(f"Fetching top posts href in this page!")
-        for href in posts_href:
-            await self.fetch_posts(href)
-
-    async def main(self):
-        coros = [
-            self.fetch_top_posts_href(gallery, page=i + 1)
-            for gallery in GALLERIES
-            for i in range(30)
-        ]
-        await asyncio.gather(*coros)
+            log.debug("No top post in this page")
+        return posts_href, post_ids
+
+    def push_page(self, frontier, gallery, page, hot=0, cold=0):
+        frontier.push(
+            page_url(gallery, page),
+            kind="page",
+            priority=page - hot,
+            gallery=gallery,
+            page=page,
+            cold=cold,
+        )
+
+    def is_new_top_post(self, hit):
+        """
+        pipeline의 filter stage
+        아직 가져오지 않은 글만 통과시킨다.
+        :param hit: (gallery, DCListingRow), 이미 추천 수로 걸러진 글
+        """
+        gallery, post = hit
+        if (gallery, post.id) in self.in_flight:
+            return False
+        status = self.state.check(PLATFORM, gallery, post.id)
+        if status == STALE:
+            # 이미 가져온 글은 다시 가져오지 않고 목록의 추천 수만 갱신
+            self.state.record_post(
+                PLATFORM, gallery, post.id, agree=post.recommend
+            )
+        if status != NEW:
+            return False
+        self.in_flight.add((gallery, post.id))
+        return True
+
+    async def fetch_hit(self, hit):
+        """
+        pipeline의 post stage
+        fetch_posts가 내주는 글을 그대로 흘려보낸다.
+        state에는 받은 쪽이 uploaded()를 부를 때 기록한다.
+        :param hit: (gallery, DCListingRow)
+        """
+        gallery, row = hit
+        fetched = False
+        try:
+            async for post in self.fetch_posts(row.href):
+                fetched = True
+                yield post._replace(
+                    board=gallery, post_id=row.id, agree=row.recommend
+                )
+        finally:
+            if not fetched:
+                # 못 가져온 글을 다음 실행에서 다시 보도록 mark를 올리지 않는다
+                self.in_flight.discard((gallery, row.id))
+                self.marks.fail(gallery)
+
+    def uploaded(self, post, error=None):
+        """
+        글을 다 처리했을 때 부르는 callback (IlgaminatiSink.put() 참고)
+        처리된 글만 state에 기록한다.
+        :param error: 처리에 실패했으면 그 예외
+        """
+        self.in_flight.discard((post.board, post.post_id))
+        if error is not None:
+            self.marks.fail(post.board)
+            return
+        self.state.record_post(
+            PLATFORM,
+            post.board,
+            post.post_id,
+            likes=post.likes,
+            dislikes=post.dislikes,
+            agree=post.agree,
+        )
+
+    async def crawl(self, frontier, item):
+        """
+        frontier에서 꺼낸 갤러리 페이지 하나를 처리하는 handler
+        :return: (gallery, 인기글 DCListingRow)의 list, 추천 수 순
+        """
+        meta = item.meta
+        gallery = meta["gallery"]
+        try:
+            posts_href, post_ids = await self.fetch_top_posts_href(
+                gallery, meta["page"]
+            )
+        except Exception:
+            # 이 페이지와 그 뒤의 글들을 못 봤으므로 mark를 올리지 않는다
+            self.marks.fail(gallery)
+            raise
+
+        passed = self.marks.observe(gallery, post_ids)
+        cold = 0 if posts_href else meta["cold"] + 1
+        if (
+            post_ids
+            and not passed
+            and cold < self.max_cold_pages
+            and meta["page"] < self.max_pages
+        ):
+            self.push_page(
+                frontier, gallery, meta["page"] + 1, len(posts_href), cold
+            )
+        posts_href.sort(key=lambda post: -post.recommend)
+        return [(gallery, post) for post in posts_href]
+
+    async def stream(self, workers: int = 8):
+        """
+        갤러리 페이지 → 인기글 고르기 → 글 내용 순으로 이어진 pipeline
+        글은 가져오는 대로 하나씩 나온다.
+        """
+        frontier = Frontier(
+            self.crawl, workers=workers, name="dcinside.frontier"
+        )
+        for gallery in GALLERIES:
+            self.push_page(frontier, gallery, page=1)
+        hits = frontier.stream(maxsize=workers * 4)
+        hits = pipeline.select(hits, self.is_new_top_post)
+        async for post in pipeline.stage(
+            hits, self.fetch_hit, workers=workers, name="dcinside.post"
+        ):
+            yield post
+        self.state.save_marks(PLATFORM, self.marks)
+
+    async def main(self, workers: int = 8):
+        posts = PostBatch()
+        async for post in self.stream(workers):
+            posts.append(post)
+            self.uploaded(post)
+        return posts
@@ -0,0 +1,275 @@
+"""
+각 사이트 페이지에서 필요한 값만 뽑아내는 파서 모음
+XPath는 import 시점에 한 번만 컴파일하고, 결과는 namedtuple로 돌려준다.
+페이지가 기대한 구조가 아니면 (에러/차단 페이지 등) LayoutError를 낸다.
+"""
+
+import json
+import re
+from collections import namedtuple
+
+import lxml.html
+from lxml import etree
+
+NaverTrendStock = namedtuple("NaverTrendStock", "symbol, code")
+NaverListingRow = namedtuple(
+    "NaverListingRow", "nid, href, title, views, agree, disagree"
+)
+NaverPost = namedtuple(
+    "NaverPost", "author, reg_ts, views, likes, dislikes, content"
+)
+NaverComment = namedtuple(
+    "NaverComment",
+    "comment_no, contents, reply_all_count, user_name, mod_time,"
+    " sympathy_count, antipathy_count",
+)
+DCListingRow = namedtuple("DCListingRow", "id, href, subject, recommend")
+DCPost = namedtuple(
+    "DCPost", "title, author, reg_ts, content, agree, disagree"
+)
+
+
+class LayoutError(ValueError):
+    """
+    페이지에 파서가 찾는 부분이 없을 때
+    """
+
+
+def _has_class(name: str):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _text(elements):
+    return elements[0].text_content() if elements else None
+
+
+def _int(text):
+    return int(text.strip().replace(",", ""))
+
+
+def _root(html: str, page: str):
+    """
+    :param page: LayoutError에 쓸 페이지 이름
+    """
+    try:
+        return lxml.html.fromstring(html)
+    except etree.ParserError as e:
+        # 빈 응답 등 ("Document is empty")
+        raise LayoutError(f"{page}: {e}") from None
+
+
+def _first(elements, page: str, what: str):
+    """
+    :return: elements의 첫 번째, 없으면 LayoutError
+    """
+    if not elements:
+        raise LayoutError(f"{page}: no {what}")
+    return elements[0]
+
+
+# finance.naver.com/sise/lastsearch2.naver
+_NAVER_TREND_LINKS = etree.XPath(f"//a[{_has_class('tltle')}]")
+
+# finance.naver.com/item/board.naver
+_NAVER_LISTING_TABLE = etree.XPath(f"//table[{_has_class('type2')}]")
+_NAVER_LISTING_ROWS = etree.XPath(f"//tr[td[{_has_class('title')}]]")
+_NAVER_ROW_LINK = etree.XPath(f"td[{_has_class('title')}]/a")
+_NAVER_ROW_VIEWS = etree.XPath("td[4]/span")
+_NAVER_ROW_AGREE = etree.XPath("td[5]/strong")
+_NAVER_ROW_DISAGREE = etree.XPath("td[6]/strong")
+_NAVER_NID = re.compile(r"(?<=nid=)[0-9]+")
+
+# finance.naver.com/item/board_read.naver
+_NAVER_POST_AUTHOR = etree.XPath(f"//th/span[{_has_class('gray03')}]/strong")
+_NAVER_POST_DATE = etree.XPath(
+    f"//tr/th[{_has_class('gray03')} and {_has_class('p9')}"
+    f" and {_has_class('tah')}]"
+)
+_NAVER_POST_INFO = etree.XPath("//tr/th[2]")
+_NAVER_POST_BODY = etree.XPath("//*[@id='body']")
+
+# gall.dcinside.com/mgallery/board/lists
+_DC_LISTING_TABLE = etree.XPath(f"//table[{_has_class('gall_list')}]")
+_DC_LISTING_ROWS = etree.XPath(
+    f"//tr[{_has_class('ub-content')} and {_has_class('us-post')}]"
+)
+_DC_ROW_LINK = etree.XPath("(.//a)[1]")
+_DC_ROW_SUBJECT = etree.XPath(f"td[{_has_class('gall_subject')}]")
+_DC_ROW_RECOMMEND = etree.XPath(f"td[{_has_class('gall_recommend')}]")
+_DC_NO = re.compile(r"(?<=no=)[0-9]+")
+
+# gall.dcinside.com/mgallery/board/view
+_DC_POST_BODY = etree.XPath(f"//div[{_has_class('write_div')}]")
+_DC_POST_TITLE = etree.XPath(f"//span[{_has_class('title_subject')}]")
+_DC_POST_AUTHOR = etree.XPath(
+    f"//span[{_has_class('nickname')}]/@title", smart_strings=False
+)
+_DC_POST_DATE = etree.XPath(
+    f"//span[{_has_class('gall_date')}]/@title", smart_strings=False
+)
+_DC_POST_UP = etree.XPath(f"//div[{_has_class('up_num_box')}]/p")
+_DC_POST_DOWN = etree.XPath(f"//div[{_has_class('down_num_box')}]/p")
+
+
+def naver_trend_stocks(html: str):
+    """
+    네이버 검색상위 종목 페이지
+    :return: NaverTrendStock의 list
+    """
+    page = "naver trend stocks"
+    links = _NAVER_TREND_LINKS(_root(html, page))
+    if not links:
+        raise LayoutError(f"{page}: no stock links")
+    return [
+        NaverTrendStock(a.text_content(), a.get("href").split("=", 1)[1])
+        for a in links
+    ]
+
+
+def naver_listing(html: str):
+    """
+    네이버 종목토론실 게시판 페이지
+    :return: NaverListingRow의 list (마지막 페이지를 넘으면 빈 list)
+    """
+    page = "naver board"
+    root = _root(html, page)
+    _first(_NAVER_LISTING_TABLE(root), page, "board table")
+    rows = []
+    for tr in _NAVER_LISTING_ROWS(root):
+        link = _NAVER_ROW_LINK(tr)
+        agree = _NAVER_ROW_AGREE(tr)
+        if not link or not agree:
+            continue
+        href = link[0].get("href")
+        nid = _first(_NAVER_NID.findall(href or ""), page, "nid in " + href)
+        rows.append(
+            NaverListingRow(
+                nid=int(nid),
+                href=href,
+                title=link[0].get("title"),
+                views=_int(_text(_NAVER_ROW_VIEWS(tr)) or "0"),
+                agree=_int(agree[0].text_content()),
+                disagree=_int(_text(_NAVER_ROW_DISAGREE(tr)) or "0"),
+            )
+        )
+    return rows
+
+
+def naver_post(html: str):
+    """
+    네이버 종목토론실 글 페이지
+    :return: NaverPost
+    """
+    page = "naver post"
+    root = _root(html, page)
+    info = [
+        text.strip()
+        for text in _first(_NAVER_POST_INFO(root), page, "info").itertext()
+        if text.strip()
+    ]
+    # 조회, 수, 공감, 수, 비공감, 수
+    info = ",".join(info).split(",")
+    if len(info) < 6:
+        raise LayoutError(f"{page}: unexpected info {info!r}")
+    content = _first(_NAVER_POST_BODY(root), page, "body").text_content()
+    content = content.replace("\xa0\r", "\n").replace("\r", "\n")
+    author = _first(_NAVER_POST_AUTHOR(root), page, "author")
+    date = _first(_NAVER_POST_DATE(root), page, "date")
+    return NaverPost(
+        author=author.text_content().replace(" ", ""),
+        reg_ts=date.text_content().replace(".", "-") + ":00",
+        views=_int(info[1]),
+        likes=_int(info[3]),
+        dislikes=_int(info[5]),
+        content=content,
+    )
+
+
+def jsonp(text: str):
+    """
+    JSONP 응답에서 callback(...)의 괄호 안만 잘라서 json으로 읽는다.
+    """
+    start = text.find("(")
+    end = text.rfind(")")
+    if start < 0 or end < start:
+        raise LayoutError(f"not a JSONP response: {text[:80]!r}")
+    try:
+        return json.loads(text[start + 1 : end])
+    except json.JSONDecodeError as e:
+        raise LayoutError(f"broken JSONP response: {e}") from None
+
+
+def naver_comments(text: str):
+    """
+    네이버 cbox 댓글 목록 JSONP 응답
+    :return: (NaverComment의 list, 전체 페이지 수)
+    """
+    response = jsonp(text)
+    result = response.get("result")
+    if not isinstance(result, dict):
+        # 에러 응답은 {"success": false, "message": ...} 꼴로 온다
+        raise LayoutError(
+            f"naver comments: no result ({response.get('message')!r})"
+        )
+    comments = [
+        NaverComment(
+            comment_no=comment["commentNo"],
+            contents=comment["contents"],
+            reply_all_count=comment["replyAllCount"],
+            user_name=comment["userName"],
+            mod_time=comment["modTime"],
+            sympathy_count=comment["sympathyCount"],
+            antipathy_count=comment["antipathyCount"],
+        )
+        for comment in result.get("commentList") or ()
+    ]
+    page_model = result.get("pageModel") or {}
+    return comments, page_model.get("totalPages", 1)
+
+
+def dc_listing(html: str):
+    """
+    디시인사이드 PC 갤러리 목록 페이지
+    :return: DCListingRow의 list (마지막 페이지를 넘으면 빈 list)
+    """
+    page = "dcinside list"
+    root = _root(html, page)
+    _first(_DC_LISTING_TABLE(root), page, "gallery list table")
+    rows = []
+    for tr in _DC_LISTING_ROWS(root):
+        href = _first(_DC_ROW_LINK(tr), page, "post link").get("href") or ""
+        no = _first(_DC_NO.findall(href), page, "post no in " + href)
+        recommend = _first(_DC_ROW_RECOMMEND(tr), page, "recommend count")
+        rows.append(
+            DCListingRow(
+                id=int(no),
+                href=href,
+                subject=_text(_DC_ROW_SUBJECT(tr)),
+                recommend=_int(recommend.text_content()),
+            )
+        )
+    return rows
+
+
+def dc_post(html: str):
+    """
+    디시인사이드 PC 글 페이지
+    :return: DCPost, 본문이 없으면 (차단 등) None
+    """
+    page = "dcinside post"
+    root = _root(html, page)
+    body = _DC_POST_BODY(root)
+    if not body:
+        return None
+    content = body[0].text_content()
+    content = content.replace("\n", "").replace("  - dc official App", "")
+    return DCPost(
+        title=_text(_DC_POST_TITLE(root)),
+        author=_first(_DC_POST_AUTHOR(root), page, "author"),
+        reg_ts=_first(_DC_POST_DATE(root), page, "date"),
+        content=content,
+        agree=_int(_first(_DC_POST_UP(root), page, "up count").text_content()),
+        disagree=_int(
+            _first(_DC_POST_DOWN(root), page, "down count").text_content()
+        ),
+    )
@@ -1,17 +1,21 @@
-import json
-import re
-from multiprocessing import Pool
+import logging
+import os
 from multiprocessing.pool import ThreadPool
 
-import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-from fake_useragent import UserAgent
+from crawler import extract
+from db_manager import Post, send_to_ilgaminati
+from utils.user_agent import random_user_agent
 
-BASE_URL = "https://finance.naver.com"
-UA = UserAgent()
+log = logging.getLogger(__name__)
+
+
+BASE_URL = os.environ.get("ILGAMINATI_NAVER_URL", "https://finance.naver.com")
+COMMENT_BASE_URL = os.environ.get(
+    "ILGAMINATI_NAVER_COMMENT_URL", "https://apis.naver.com"
+)
 HEADERS = {
-    "User-Agent": UA.random,
+    "User-Agent": random_user_agent(),
 }
 
 
@@ -28,93 +32,68 @@ class Crawler:
         """
         if (n > 30) or (n < 0):
             raise Exception("n must be between 0 and 30")
+        import pandas as pd
 
         url = BASE_URL + "/sise/lastsearch2.naver"
         r = requests.get(url, headers=HEADERS)
-        html = r.text
-        soup = BeautifulSoup(html, "html.parser")
-        li = soup.find_all("a", "tltle")
-
-        symbols = []
-        codes = []
-        for stock in li:
-            symbol = stock.text
-            code = re.search(r"(?<==).*", stock["href"])[0]
-
-            symbols.append(symbol)
-            codes.append(code)
+        stocks = extract.naver_trend_stocks(r.text)[:n]
 
-        df = pd.DataFrame(zip(symbols, codes), columns=["Symbol", "Code"])
+        df = pd.DataFrame(stocks, columns=["Symbol", "Code"])
         return df
 
     @staticmethod
-    def fetch_comments_by_post(nid):
+    def fetch_comments_by_post(code, nid):
         comment_url = (
-            "https://apis.naver.com/commentBox/cbox/"
+            COMMENT_BASE_URL + "/commentBox/cbox/"
             "web_naver_list_jsonp.json?ticket=finance"
             "&templateId=default&pool=cbox12&lang=ko&"
             f"country=KR&objectId={nid}"
         )
         headers = {
-            "User-Agent": UA.random,
-            "referer": "https://finance.naver.com/item/board_read.naver?"
-            f"code=112040&nid={nid}&st=&sw=&page=1",
+            "User-Agent": random_user_agent(),
+            "referer": BASE_URL + "/item/board_read.naver?"
+            f"code={code}&nid={nid}&st=&sw=&page=1",
         }
         r = requests.get(comment_url, headers=headers)
-        comments_list = re.findall(
-            r'(?<={"commentList":).*(?=,"pageModel")', r.text
-        )[0]
-        comments_list = json.loads(comments_list)
+        comments_list, _ = extract.naver_comments(r.text)
 
         comments = []
-        keys = [
-            "contents",
-            "replyAllCount",
-            "userName",
-            "modTime",
-            "sympathyCount",
-            "antipathyCount",
-        ]
         for comment in comments_list:
-            comments.append({x: comment[x] for x in keys})
+            comments.append(
+                {
+                    "contents": comment.contents,
+                    "replyAllCount": comment.reply_all_count,
+                    "userName": comment.user_name,
+                    "modTime": comment.mod_time,
+                    "sympathyCount": comment.sympathy_count,
+                    "antipathyCount": comment.antipathy_count,
+                }
+            )
         return comments
 
     def fetch_by_post(self, top_post, symbol):
-        href = top_post.get("href")
-        r = requests.get(BASE_URL + href)
-        content_soup = BeautifulSoup(r.text, "lxml")
-
-        author = content_soup.select_one(
-            "th > span.gray03 > strong"
-        ).text.replace(" ", "")
-        date = content_soup.select_one("tr > th.gray03.p9.tah").text
-
-        post_info = content_soup.select_one("tr > th:nth-of-type(2)")
-        post_info = post_info.getText(",", strip=True).split(",")
-
-        content = content_soup.select_one("#body")
-        content = content.getText().replace("\xa0\r", "\n")
-        content = content.replace("\r", "\n")
-        # nid = int(re.search(r'(?<=nid=)[0-9]+', href)[0])
-        # comments = self.fetch_comments_by_post(nid)
-
-        post = {}
-        post["title"] = top_post.get("title")
-        post["author"] = author
-        post["content"] = content
-        post["stock_name"] = symbol
-        post["likes"] = post_info[3]
-        post["dislikes"] = post_info[5]
-        post["views"] = post_info[1]
-        post["reg_ts"] = date.replace(".", "-") + ":00"
-        # post['nid'] = nid
-        # post['comments'] = comments
-        # return post
-        print(post)
-        r = requests.post(
-            "https://hxx059yi92.execute-api.ap-northeast-2.amazonaws.com/api/crawling/posts",
-            json=post,
+        r = requests.get(BASE_URL + top_post.href)
+        record = extract.naver_post(r.text)
+        # nid = top_post.nid
+        # comments = self.fetch_comments_by_post(code, nid)
+
+        post = Post(
+            title=top_post.title,
+            content=record.content,
+            stock_name=symbol,
+            author=record.author,
+            reg_ts=record.reg_ts,
+            views=record.views,
+            likes=record.likes,
+            dislikes=record.dislikes,
+            agree=top_post.agree,
+            platform="naver",
+            post_id=top_post.nid,
+            url=BASE_URL + top_post.href,
         )
+        # post = post._replace(comments=tuple(comments))
+        log.debug("%s", post)
+        r = send_to_ilgaminati(post)
         # print(r)
         # return r
 
@@ -127,23 +106,12 @@ class Crawler:
         """
         url = BASE_URL + "/item/board.naver?code=" + code + "&page=%d" % page
         req = requests.get(url, headers=HEADERS)
-        soup = BeautifulSoup(req.text, "lxml")
-
-        title_list = soup.select("td.title > a")
-        agree_list = soup.select("td:nth-child(5) > strong")
-        disagree_list = soup.select("td:nth-child(6) > strong")
-        idx_list = [
-            idx
-            for idx, agree in enumerate(agree_list)
-            if int(agree.text) >= standard
-        ]
-        top_post_list = [title_list[x] for x in idx_list]
+        rows = extract.naver_listing(req.text)
+        top_post_list = [row for row in rows if row.agree >= standard]
 
         pool = ThreadPool(2)
         posts = [
-            pool.apply_async(
-                self.fetch_by_post, args={top_post: top_post, symbol: symbol}
-            )
+            pool.apply_async(self.fetch_by_post, args=(top_post, symbol))
             for top_post in top_post_list
         ]
         pool.close()
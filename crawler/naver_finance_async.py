@@ -1,178 +1,592 @@
 import asyncio
-import json
-import re
-from multiprocessing import Pool
-from multiprocessing.pool import ThreadPool
-
-import aiohttp
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from db_manager import send_to_ilgaminati
-from db_manager import Post
-from fake_useragent import UserAgent
-
-BASE_URL = "https://finance.naver.com"
-UA = UserAgent()
+import contextlib
+import logging
+import os
+
+from crawler import extract
+from db_manager import IlgaminatiSink, Post, PostBatch
+from utils import pipeline
+from utils.frontier import Frontier, HighWaterMarks
+from utils.http_cache import HTTPCache, fetch_text
+from utils.limiter import RateLimiter
+from utils.parse_pool import ParsePool
+from utils.poller import Poller
+from utils.session import shared_session
+from utils.state import NEW, STALE, CrawlState
+from utils.user_agent import random_user_agent
+
+log = logging.getLogger(__name__)
+
+PLATFORM = "naver"
+# 부하 테스트에서는 mock 서버 주소로 바꾼다
+BASE_URL = os.environ.get("ILGAMINATI_NAVER_URL", "https://finance.naver.com")
+COMMENT_BASE_URL = os.environ.get(
+    "ILGAMINATI_NAVER_COMMENT_URL", "https://apis.naver.com"
+)
 HEADERS = {
-    "User-Agent": UA.random,
+    "User-Agent": random_user_agent(),
 }
 
 
-class NaverFinanceCrawler:
-    def __init__(self):
-        self.trend_stock_df = self.get_search_trend_stock()
-
-    @staticmethod
-    def get_search_trend_stock(n: int = 30):
-        """
-        네이버 검생상위 n개 종목과 그 코드를 df로 출력
-        :param n: 가져올 상위 종목의 갯수 (0 < n <= 30)
-        :return:
-        """
-        print("Fetching search trend stock list")
-        if (n > 30) or (n < 0):
-            raise Exception("n must be between 0 and 30")
-
-        url = BASE_URL + "/sise/lastsearch2.naver"
-        r = requests.get(url, headers=HEADERS)
-        html = r.text
-        soup = BeautifulSoup(html, "html.parser")
-        li = soup.find_all("a", "tltle")
-
-        symbols = []
-        codes = []
-        for stock in li:
-            symbol = stock.text
-            code = re.search(r"(?<==).*", stock["href"])[0]
-
-            symbols.append(symbol)
-            codes.append(code)
-
-        df = pd.DataFrame(zip(symbols, codes), columns=["Symbol", "Code"])
-        return df
-
-    @staticmethod
-    async def fetch_comments_by_post(session, nid):
-        comment_url = (
-            "https://apis.naver.com/commentBox/cbox/"
-            "web_naver_list_jsonp.json?ticket=finance"
-            "&templateId=default&pool=cbox12&lang=ko&"
-            f"country=KR&objectId={nid}"
+COMMENT_URL = (
+    COMMENT_BASE_URL + "/commentBox/cbox/web_naver_list_jsonp.json"
+    "?ticket=finance&templateId=default&pool=cbox12&lang=ko&country=KR"
+)
+# 게시판을 돌 종목을 고르는 목록 페이지들
+# (모두 종목 링크에 class="tltle"이 붙어 있어서 같은 파서를 쓴다)
+TREND_SOURCES = {
+    "lastsearch": "/sise/lastsearch2.naver",  # 검색상위
+    "rising": "/sise/sise_rise.naver",  # 상승
+    "quant": "/sise/sise_quant.naver",  # 거래상위
+}
+# 기본으로 쓸 목록들 (쉼표로 구분)
+TREND_SOURCE_NAMES = os.environ.get(
+    "ILGAMINATI_NAVER_SOURCES", "lastsearch"
+).split(",")
+# 목록 하나에서 가져올 종목 수
+TREND_SIZE = 30
+# daemon mode에서 종목 목록을 다시 가져오는 간격(초)
+TREND_REFRESH = 10 * 60
+# 댓글 한 페이지의 크기와 글 하나에서 가져올 최대 페이지 수
+COMMENT_PAGE_SIZE = 100
+MAX_COMMENT_PAGES = 10
+
+
+def board_url(code: str, page: int):
+    return BASE_URL + "/item/board.naver?code=" + code + "&page=%d" % page
+
+
+def comment_url(nid: int, page: int):
+    return (
+        COMMENT_URL
+        + f"&objectId={nid}&page={page}&pageSize={COMMENT_PAGE_SIZE}"
+        + "&sort=NEW"
+    )
+
+
+class TrendStocks:
+    """
+    게시판을 돌 종목 목록
+    TREND_SOURCES 중 고른 목록 페이지들에서 NaverTrendStock(symbol, code)을
+    모은다. 여러 목록에 나온 종목은 처음 나온 것만 남긴다.
+    """
+
+    def __init__(
+        self,
+        limiter: RateLimiter = None,
+        sources=TREND_SOURCE_NAMES,
+        size: int = TREND_SIZE,
+        parser: ParsePool = None,
+    ):
+        """
+        :param sources: TREND_SOURCES의 이름들
+        :param size: 목록 하나에서 가져올 종목 수
+        :param parser: html을 파싱할 ParsePool (없으면 event loop에서 파싱)
+        """
+        unknown = set(sources) - set(TREND_SOURCES)
+        if unknown:
+            raise ValueError(f"unknown trend source: {sorted(unknown)}")
+        self.limiter = limiter or RateLimiter()
+        self.sources = list(sources)
+        self.size = size
+        self.parser = parser or ParsePool(workers=0)
+        self.stocks = []
+
+    def __iter__(self):
+        return iter(self.stocks)
+
+    def __len__(self):
+        return len(self.stocks)
+
+    async def fetch(self, session, source: str):
+        """
+        :return: 목록 하나의 NaverTrendStock list
+        """
+        url = BASE_URL + TREND_SOURCES[source]
+        html = await fetch_text(session, url, self.limiter, headers=HEADERS)
+        stocks = await self.parser.parse(extract.naver_trend_stocks, html)
+        return stocks[: self.size]
+
+    async def refresh(self, session):
+        """
+        목록들을 동시에 다시 가져온다. 목록 하나가 실패하면 나머지만 쓰고,
+        전부 실패하거나 비어 있으면 이전 목록을 그대로 둔다.
+        :return: 종목 list
+        """
+        log.info("Fetching trend stock lists: %s", ", ".join(self.sources))
+        results = await asyncio.gather(
+            *[self.fetch(session, source) for source in self.sources],
+            return_exceptions=True,
         )
-        headers = {
-            "User-Agent": UA.random,
-            "referer": "https://finance.naver.com/item/board_read.naver?"
-            f"code=112040&nid={nid}&st=&sw=&page=1",
-        }
-        async with session.get(comment_url, headers=headers) as response:
-            html = await response.text()
-            comments_list = re.findall(
-                r'(?<={"commentList":).*(?=,"pageModel")', html
-            )[0]
-            comments_list = json.loads(comments_list)
-
-            comments = []
-            keys = [
-                "contents",
-                "replyAllCount",
-                "userName",
-                "modTime",
-                "sympathyCount",
-                "antipathyCount",
-            ]
-            for comment in comments_list:
-                comments.append({x: comment[x] for x in keys})
-            return comments
-
-    async def fetch_by_post(self, session, top_post, symbol):
+        stocks = {}
+        for source, result in zip(self.sources, results):
+            if isinstance(result, Exception):
+                log.warning("Failed to fetch %s list: %r", source, result)
+                continue
+            for stock in result:
+                stocks.setdefault(stock.code, stock)
+        if stocks:
+            self.stocks = list(stocks.values())
+        return self.stocks
+
+    async def run(self, session, callback, interval=TREND_REFRESH):
+        """
+        취소될 때까지 interval마다 목록을 다시 가져와서 callback(종목 list)을
+        기다린다. callback은 coroutine 함수여야 한다.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await callback(await self.refresh(session))
+
+
+class NaverFinanceCrawler:
+    def __init__(
+        self,
+        limiter: RateLimiter = None,
+        standard: int = 20,
+        max_pages: int = 30,
+        max_cold_pages: int = 3,
+        marks: HighWaterMarks = None,
+        state: CrawlState = None,
+        cache: HTTPCache = None,
+        parser: ParsePool = None,
+        comments: bool = True,
+    ):
+        """
+        :param standard: 인기글로 볼 최소 공감 수
+        :param max_pages: 게시판 당 최대로 넘길 페이지 수
+        :param max_cold_pages: 인기글 없는 페이지가 이만큼 이어지면 멈춤
+        :param marks: 종목코드 별 지난 실행의 high-water mark
+        :param state: 이미 올린 글을 기록하는 state (없으면 메모리에만 기록)
+        :param cache: 게시판/글 페이지를 보관할 HTTPCache (없으면 사용 안 함)
+        :param parser: html을 파싱할 ParsePool (없으면 event loop에서 파싱)
+        :param comments: False면 댓글은 가져오지 않는다
+                         (True면 이미 올린 글도 state의 refresh 간격마다
+                         다시 가져와서 새 댓글이 있으면 그것만 올린다)
+        """
+        self.limiter = limiter or RateLimiter()
+        self.standard = standard
+        self.max_pages = max_pages
+        self.max_cold_pages = max_cold_pages
+        self.state = state or CrawlState(":memory:")
+        self.marks = marks or self.state.high_water_marks(PLATFORM)
+        self.cache = cache
+        self.parser = parser or ParsePool(workers=0)
+        self.comments = comments
+        # 가져와서 올리는 중인 (종목코드, nid), 다른 페이지에 또 나와도 넘긴다
+        self.in_flight = set()
+        # 그중 새 댓글을 보러 다시 가져오는 이미 올린 글
+        self.refreshing = set()
+
+    async def fetch_comments_by_post(self, session, referer, nid, since=0):
+        """
+        글의 댓글 중 since보다 번호가 큰 것만 최신순으로 가져온다.
+        최신순 페이지에서 이미 본 댓글이 나오면 다음 페이지는 보지 않는다.
+        :param referer: 글 페이지 주소 (cbox가 referer를 확인함)
+        :param nid: 글 번호
+        :param since: 지난 실행까지 가져온 가장 큰 댓글 번호
+        :return: 댓글 dict의 list, 최신순
+        """
+        headers = {"User-Agent": HEADERS["User-Agent"], "referer": referer}
+        comments = []
+        for page in range(1, MAX_COMMENT_PAGES + 1):
+            async with self.limiter.request(
+                session, "GET", comment_url(nid, page), headers=headers
+            ) as response:
+                text = await response.text()
+            rows, total_pages = await self.parser.parse(
+                extract.naver_comments, text
+            )
+            new_rows = [row for row in rows if row.comment_no > since]
+            for row in new_rows:
+                comments.append(
+                    {
+                        "commentNo": row.comment_no,
+                        "contents": row.contents,
+                        "replyAllCount": row.reply_all_count,
+                        "userName": row.user_name,
+                        "modTime": row.mod_time,
+                        "sympathyCount": row.sympathy_count,
+                        "antipathyCount": row.antipathy_count,
+                    }
+                )
+            if len(new_rows) < len(rows) or page >= total_pages:
+                break
+        return comments
+
+    async def fetch_post_comments(self, session, post):
+        """
+        pipeline의 comment stage
+        글에 지난번 댓글 mark 이후로 달린 댓글을 Post.comments에 붙인다.
+        댓글을 못 가져와도 새 글은 댓글 없이 넘긴다.
+        댓글을 보러 다시 가져온 글은 새 댓글이 있을 때만 넘긴다.
+        댓글 mark는 글이 올라간 뒤에 uploaded()에서 저장한다.
+        """
+        since = self.state.comment_mark(PLATFORM, post.board, post.post_id)
+        try:
+            comments = await self.fetch_comments_by_post(
+                session, post.url, post.post_id, since
+            )
+        except Exception as e:
+            log.warning(
+                "Failed to fetch comments of %s/%s: %r",
+                post.board,
+                post.post_id,
+                e,
+            )
+            comments = ()
+        key = (post.board, post.post_id)
+        if not comments and key in self.refreshing:
+            # 올릴 것이 없으므로 다시 가져온 수치만 기록하고 끝낸다
+            self.in_flight.discard(key)
+            self.refreshing.discard(key)
+            self.state.record_post(
+                PLATFORM,
+                post.board,
+                post.post_id,
+                likes=post.likes,
+                dislikes=post.dislikes,
+                views=post.views,
+            )
+            return None
+        return post._replace(comments=tuple(comments))
+
+    async def fetch_by_post(self, session, top_post, symbol, code=""):
         """
         post의 내용을 크롤링하는 메소드
-        comment의 경우 일시적으로 가져오지 않는다.
+        comment는 pipeline의 comment stage에서 따로 가져온다.
         :param session:
-        :param top_post:
+        :param top_post: 게시판 페이지의 NaverListingRow
         :param symbol:
-        :return:
-        """
-        href = top_post.get("href")
-        async with session.get(BASE_URL + href, headers=HEADERS) as response:
-            html = await response.text()
-            content_soup = BeautifulSoup(html, "lxml")
-
-            author = content_soup.select_one(
-                "th > span.gray03 > strong"
-            ).text.replace(" ", "")
-            date = content_soup.select_one("tr > th.gray03.p9.tah").text
-
-            post_info = content_soup.select_one("tr > th:nth-of-type(2)")
-            post_info = post_info.getText(",", strip=True).split(",")
-
-            content = content_soup.select_one("#body")
-            content = content.getText().replace("\xa0\r", "\n")
-            content = content.replace("\r", "\n")
-            # nid = int(re.search(r'(?<=nid=)[0-9]+', href)[0])
-            # comments = self.fetch_comments_by_post(nid) #비동기로 바꿔줘야함
-
-            post = {}
-            post["title"] = top_post.get("title")
-            post["author"] = author
-            post["content"] = content
-            post["stock_name"] = symbol
-            post["likes"] = post_info[3]
-            post["dislikes"] = post_info[5]
-            post["views"] = post_info[1]
-            post["reg_ts"] = date.replace(".", "-") + ":00"
-            # post['nid'] = nid
-            # post['comments'] = comments
-            print(post)
-            return send_to_ilgaminati(post=post)
+        :param code: 종목코드
+        :return: Post
+        """
+        url = BASE_URL + top_post.href
+        html = await fetch_text(
+            session, url, self.limiter, self.cache, headers=HEADERS
+        )
+        record = await self.parser.parse(extract.naver_post, html)
+
+        post = Post(
+            title=top_post.title,
+            content=record.content,
+            stock_name=symbol,
+            author=record.author,
+            reg_ts=record.reg_ts,
+            views=record.views,
+            likes=record.likes,
+            dislikes=record.dislikes,
+            agree=top_post.agree,
+            platform=PLATFORM,
+            board=code,
+            post_id=top_post.nid,
+            url=url,
+        )
+        log.debug("%s", post)
+        return post
 
     async def fetch_by_page(
         self, session, symbol: str, code: str, page: int, standard
     ):
         """
-        한 게시판 페이지 내의 글들을 크롤링하는 메소드
+        한 게시판 페이지에서 공감 수가 standard 이상인 글들을 찾는 메소드
         :param code: 종목코드
         :param page: 페이지 번호
-        :return: 한 페이지의 게시글들을 dict of list 로 반환.
-        """
-        print(f"Fetching {symbol} board's page #{page}")
-        url = BASE_URL + "/item/board.naver?code=" + code + "&page=%d" % page
-        async with session.get(url, headers=HEADERS) as response:
-            html = await response.text()
-            soup = BeautifulSoup(html, "lxml")
-
-            title_list = soup.select("td.title > a")
-            agree_list = soup.select("td:nth-child(5) > strong")
-            idx_list = [
-                idx
-                for idx, agree in enumerate(agree_list)
-                if int(agree.text) >= standard
-            ]
-            top_post_list = [title_list[x] for x in idx_list]
-
-            async with aiohttp.ClientSession() as session:
-                await asyncio.gather(
-                    *[
-                        self.fetch_by_post(session, top_post, symbol)
-                        for top_post in top_post_list
-                    ]
-                )
+        :return: (인기글 NaverListingRow의 list,
+                  페이지에 있는 모든 글의 nid list,
+                  페이지에 있는 모든 NaverListingRow의 list)
+        """
+        log.debug("Fetching %s board's page #%d", symbol, page)
+        url = board_url(code, page)
+        html = await fetch_text(
+            session, url, self.limiter, self.cache, headers=HEADERS
+        )
+        rows = await self.parser.parse(extract.naver_listing, html)
+        nid_list = [row.nid for row in rows]
+        top_post_list = [row for row in rows if row.agree >= standard]
+        return top_post_list, nid_list, rows
 
+    def push_page(
+        self, frontier, symbol: str, code: str, page: int, hot=0, cold=0
+    ):
+        """
+        게시판 페이지를 frontier에 넣는다.
+        직전 페이지에 인기글이 많았던 게시판일수록 다음 페이지를 먼저 본다.
+        :param hot: 직전 페이지의 인기글 수
+        :param cold: 인기글 없이 연속으로 넘긴 페이지 수
+        """
+        frontier.push(
+            board_url(code, page),
+            kind="page",
+            priority=page - hot,
+            symbol=symbol,
+            code=code,
+            page=page,
+            cold=cold,
+        )
 
-async def nf_main():
-    c = NaverFinanceCrawler()
-    async with aiohttp.ClientSession() as session:
-        await asyncio.gather(
-            *[
-                c.fetch_by_page(
-                    session,
-                    row["Symbol"],
-                    row["Code"],
-                    page=i + 1,
-                    standard=20,
-                )
-                for _, row in c.trend_stock_df.iterrows()
-                for i in range(30)
-            ]
+    def is_new_top_post(self, hit):
+        """
+        pipeline의 filter stage
+        공감 수가 standard 이상이고 아직 올리지 않은 글을 통과시킨다.
+        이미 올린 글은 수치를 다시 기록할 때가 되면(STALE) 목록의 공감
+        수를 갱신하고, 댓글을 가져오는 중이면 새 댓글을 보러 통과시킨다.
+        :param hit: (symbol, code, NaverListingRow)
+        """
+        symbol, code, row = hit
+        if row.agree < self.standard or (code, row.nid) in self.in_flight:
+            return False
+        status = self.state.check(PLATFORM, code, row.nid)
+        if status == STALE:
+            self.state.record_post(PLATFORM, code, row.nid, agree=row.agree)
+            if not self.comments:
+                return False
+            self.refreshing.add((code, row.nid))
+        elif status != NEW:
+            return False
+        self.in_flight.add((code, row.nid))
+        return True
+
+    async def fetch_hit(self, session, hit):
+        """
+        pipeline의 post stage
+        filter를 통과한 글의 내용을 가져온다.
+        state에는 sink가 글을 올린 뒤 uploaded()에서 기록한다.
+        :param hit: (symbol, code, NaverListingRow)
+        """
+        symbol, code, top_post = hit
+        key = (code, top_post.nid)
+        try:
+            return await self.fetch_by_post(session, top_post, symbol, code)
+        except Exception:
+            self.in_flight.discard(key)
+            if key in self.refreshing:
+                # 이미 올린 글이라 게시판의 mark와는 상관없다
+                self.refreshing.discard(key)
+            else:
+                # 못 가져온 글을 다음 실행에서 다시 보도록 mark를 올리지 않는다
+                self.marks.fail(code)
+            raise
+
+    def uploaded(self, post, error=None):
+        """
+        sink가 글의 전송을 마치면 부르는 callback
+        올라간 글과 그 댓글 mark만 state에 기록한다. 못 올린 글은
+        게시판의 mark를 올리지 않아서 다음 실행에서 다시 가져온다.
+        :param error: 전송에 실패했으면 그 예외
+        """
+        key = (post.board, post.post_id)
+        self.in_flight.discard(key)
+        refreshed = key in self.refreshing
+        self.refreshing.discard(key)
+        if error is not None:
+            # 새 댓글만 다시 올리던 글은 게시판의 mark와 상관없다
+            # (댓글 mark를 저장하지 않으므로 다음 refresh 때 다시 올린다)
+            if not refreshed:
+                self.marks.fail(post.board)
+            return
+        self.state.record_post(
+            PLATFORM,
+            post.board,
+            post.post_id,
+            likes=post.likes,
+            dislikes=post.dislikes,
+            views=post.views,
+            agree=post.agree,
+        )
+        if post.comments:
+            # 댓글은 최신순이므로 첫 번째가 가장 최근 댓글
+            self.state.save_comment_mark(
+                PLATFORM,
+                post.board,
+                post.post_id,
+                post.comments[0]["commentNo"],
+            )
+
+    async def crawl(self, session, frontier, item):
+        """
+        frontier에서 꺼낸 게시판 페이지 하나를 처리하는 handler
+        다음 페이지를 frontier에 넣고, 페이지의 글들을 공감 수 순으로
+        pipeline에 흘려보낸다.
+        :return: (symbol, code, NaverListingRow)의 list
+        """
+        meta = item.meta
+        code = meta["code"]
+        try:
+            top_post_list, nid_list, rows = await self.fetch_by_page(
+                session, meta["symbol"], code, meta["page"], self.standard
+            )
+        except Exception:
+            # 이 페이지와 그 뒤의 글들을 못 봤으므로 mark를 올리지 않는다
+            self.marks.fail(code)
+            raise
+
+        # 지난 실행에서 본 글에 닿았거나, 인기글 없는 페이지가 이어지면 멈춘다
+        passed = self.marks.observe(code, nid_list)
+        cold = 0 if top_post_list else meta["cold"] + 1
+        if (
+            nid_list
+            and not passed
+            and cold < self.max_cold_pages
+            and meta["page"] < self.max_pages
+        ):
+            self.push_page(
+                frontier,
+                meta["symbol"],
+                code,
+                meta["page"] + 1,
+                hot=len(top_post_list),
+                cold=cold,
+            )
+        rows.sort(key=lambda row: -row.agree)
+        return [(meta["symbol"], code, row) for row in rows]
+
+    async def poll(self, session, sink, symbol: str, code: str, workers=4):
+        """
+        daemon mode에서 게시판 하나의 지난 poll 이후 새 글들을 확인하고
+        인기글을 sink에 넣는다.
+        :return: 새로 올라온 글 수 (처음 보는 게시판이면 None)
+        """
+        frontier = Frontier(
+            lambda frontier, item: self.crawl(session, frontier, item),
+            workers=1,
+            name="naver.poll",
         )
+        self.push_page(frontier, symbol, code, page=1)
+        posts = self.stream(session, frontier, workers)
+        async with contextlib.aclosing(posts) as posts:
+            # 올리지 못한 글이 있으면 mark를 올리지 않도록 전송까지 기다린다
+            await sink.put_all(posts, self.uploaded)
+        new_posts = self.marks.advance(code)
+        self.state.save_marks(PLATFORM, self.marks, [code])
+        return new_posts
+
+    def stream(self, session, frontier, workers: int = 16):
+        """
+        게시판 페이지 → 인기글 고르기 → 글 내용 → 댓글 순으로 이어진 pipeline
+        stage 사이의 queue가 제한되어 있어서 메모리는 일정하게 유지되고,
+        글은 가져오는 대로 하나씩 나온다. 받은 쪽에서 글을 다 처리하면
+        uploaded()를 불러야 state에 기록된다.
+        :param frontier: 첫 페이지들을 넣어둔 Frontier
+        :param workers: 글 내용을 동시에 가져올 수
+        """
+        hits = frontier.stream(maxsize=workers * 4)
+        hits = pipeline.select(hits, self.is_new_top_post)
+        posts = pipeline.stage(
+            hits,
+            lambda hit: self.fetch_hit(session, hit),
+            workers=workers,
+            name="naver.post",
+        )
+        if not self.comments:
+            return posts
+        return pipeline.stage(
+            posts,
+            lambda post: self.fetch_post_comments(session, post),
+            workers=workers,
+            name="naver.comment",
+        )
+
+
+async def crawl_naver(
+    session,
+    limiter,
+    state,
+    cache,
+    parser,
+    sink=None,
+    workers: int = 16,
+    shard=None,
+):
+    """
+    검색상위 종목 게시판들의 인기글을 sink에 넣는다.
+    high-water mark는 끝까지 돌았을 때만 저장하므로, 중간에 취소되면
+    다음 실행에서 같은 페이지부터 다시 본다. (이미 올린 글은 state로 걸러짐)
+    :param sink: 없으면 가져온 글을 PostBatch에 모아서 돌려준다
+                 (이때 batch에 담은 글은 state에 올린 것으로 기록되므로,
+                  sink로 올리는 실행과 같은 state 파일을 쓰면 안 된다)
+    :param shard: 있으면 이 worker가 시작할 때 lease를 잡은 게시판만 돈다
+    :return: sink에 넣은 글 수 (sink가 없으면 가져온 글의 PostBatch)
+    """
+    c = NaverFinanceCrawler(limiter, state=state, cache=cache, parser=parser)
+    frontier = Frontier(
+        lambda frontier, item: c.crawl(session, frontier, item),
+        workers=workers,
+        name="naver.frontier",
+    )
+    boards = await TrendStocks(c.limiter, parser=c.parser).refresh(session)
+    if shard is not None:
+        await shard.register(PLATFORM, [stock.code for stock in boards])
+        boards = [
+            stock for stock in boards if shard.holds(PLATFORM, stock.code)
+        ]
+    for stock in boards:
+        c.push_page(frontier, stock.symbol, stock.code, page=1)
+    # 취소되면 pipeline의 task들을 바로 정리하도록 명시적으로 닫는다
+    async with contextlib.aclosing(c.stream(session, frontier, workers)) as s:
+        if sink is None:
+            # 넘겨줄 sink가 없으면 batch에 담는 것으로 끝난다
+            posts = PostBatch()
+            async for post in s:
+                posts.append(post)
+                c.uploaded(post)
+        else:
+            # 올리지 못한 글의 게시판은 mark를 저장하지 않도록 전송까지 기다린다
+            count = await sink.put_all(s, c.uploaded)
+    state.save_marks(PLATFORM, c.marks)
+    return posts if sink is None else count
+
+
+async def watch_naver(
+    session,
+    limiter,
+    state,
+    cache,
+    parser,
+    sink,
+    workers: int = 4,
+    shard=None,
+):
+    """
+    검색상위 종목 게시판들을 게시판마다 글이 올라오는 속도에 맞춘 간격으로
+    계속 확인하면서 새 인기글을 sink에 넣는다. 취소될 때까지 돈다.
+    종목 목록은 TREND_REFRESH마다 다시 가져와서, 빠진 종목은 그만 보고
+    새로 들어온 종목을 보기 시작한다.
+    :param shard: 있으면 이 worker가 lease를 잡은 게시판만 확인한다
+    """
+    c = NaverFinanceCrawler(limiter, state=state, cache=cache, parser=parser)
+    trends = TrendStocks(c.limiter, parser=c.parser)
+
+    def owns(stock):
+        return shard is None or shard.holds(PLATFORM, stock.code)
+
+    poller = Poller(
+        lambda stock: c.poll(session, sink, *stock, workers=workers),
+        name=PLATFORM,
+        owns=owns,
+    )
+
+    async def track(stocks):
+        if shard is not None:
+            await shard.register(PLATFORM, [stock.code for stock in stocks])
+        poller.update(stocks)
+
+    await track(await trends.refresh(session))
+    refreshing = asyncio.create_task(trends.run(session, track))
+    try:
+        await poller.run()
+    finally:
+        refreshing.cancel()
+        await asyncio.gather(refreshing, return_exceptions=True)
+
+
+async def nf_main(session=None, workers: int = 16, limiter=None):
+    if session is None:
+        async with shared_session() as session:
+            return await nf_main(session, workers, limiter)
+
+    with HTTPCache() as cache, CrawlState() as state, ParsePool() as parser:
+        async with IlgaminatiSink() as sink:
+            await crawl_naver(
+                session, limiter, state, cache, parser, sink, workers
+            )
@@ -1,12 +1,33 @@
 import asyncio
+import collections
+import functools
 import json
 import lxml.html
 from datetime import datetime, timedelta
 import itertools
-import aiohttp
-import filetype
+import logging
+import os
 
+from db_manager import Post
+from utils.http_cache import HTTPCache, fetch_text
+from utils.image_store import ImageStore, sniff_extension, write_stream
+from utils.limiter import RateLimiter
+from utils.parse_pool import ParsePool
+from utils.poller import AdaptiveInterval
+from utils.session import close_session, create_session
+
+log = logging.getLogger(__name__)
+
+
+# 모바일 페이지 주소 (부하 테스트에서는 mock 서버 주소로 바꾼다)
+MOBILE_URL = os.environ.get(
+    "ILGAMINATI_DC_MOBILE_URL", "https://m.dcinside.com"
+)
 DOCS_PER_PAGE = 200
+# 댓글 페이지를 동시에 가져올 수
+COMMENT_CONCURRENCY = 4
+# resolve_documents에서 글을 동시에 가져올 수
+DOCUMENT_CONCURRENCY = 16
 
 GET_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Linux; Android 7.0; SM-G892A Build/NRD90M; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/67.0.3396.87 Mobile Safari/537.36"
@@ -33,6 +54,8 @@ POST_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Linux; Android 7.0; SM-G892A Build/NRD90M; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/67.0.3396.87 Mobile Safari/537.36",
 }
 
+DEFAULT_COOKIES = {"_ga": "GA1.2.693521455.1588839880"}
+
 GALLERY_POSTS_COOKIES = {
     "__gat_mobile_search": 1,
     "list_count": DOCS_PER_PAGE,
@@ -68,6 +91,221 @@ def peek(iterable):
     return first, itertools.chain((first,), iterable)
 
 
+# DC에 표시되는 시간 형식들
+# "12:34", "10.17", "10.17 12:34", "22.10.17", "10.17 12:34:56",
+# "2022.10.17 12:34", "2022.10.17 12:34:56", "2022-10-17 12:34:56"
+_TIME_FORMAT = re.compile(
+    r"(?:(\d{4}|\d{2})[.-])?(?:(\d{1,2})[.-](\d{1,2}))?\s*"
+    r"(?:(\d{1,2}):(\d{2})(?::(\d{2}))?)?"
+)
+# 연도/날짜가 생략된 시간이 now보다 이만큼 넘게 미래면 전날(전년) 것으로 본다
+FUTURE_TOLERANCE = timedelta(hours=1)
+
+
+@functools.lru_cache(maxsize=4096)
+def _time_fields(text):
+    """
+    :return: (year, month, day, hour, minute, second), 없는 값은 None
+    """
+    match = _TIME_FORMAT.fullmatch(text.strip())
+    if match is None or (match[2] is None and match[4] is None):
+        raise ValueError(f"Unknown time format: {text!r}")
+    year, month, day, hour, minute, second = (
+        int(field) if field else None for field in match.groups()
+    )
+    if year is not None and year < 100:
+        year += 2000
+    return year, month, day, hour, minute, second
+
+
+def parse_time(text, now=None):
+    """
+    DC의 시간 문자열을 datetime으로 바꾼다.
+    날짜가 없으면 now의 날짜, 연도가 없으면 now의 연도를 쓰되 결과가
+    now보다 미래면 전날/전년으로 넘긴다. (자정, 연말 직후에 받은 페이지)
+    연도 없는 02.29는 올해에 없으면 작년 것으로 본다.
+    시간이 없으면 그날의 23:59:59로 본다.
+    :param now: 기준 시각, 한 페이지 안에서는 같은 값을 넘긴다
+    """
+    now = now or datetime.now()
+    year, month, day, hour, minute, second = _time_fields(text)
+    if hour is None:
+        hour, minute, second = 23, 59, 59
+    if month is None:
+        result = now.replace(
+            hour=hour, minute=minute, second=second or 0, microsecond=0
+        )
+        if result - now > FUTURE_TOLERANCE:
+            result -= timedelta(days=1)
+        return result
+    if year is not None:
+        return datetime(year, month, day, hour, minute, second or 0)
+    for year in (now.year, now.year - 1):
+        try:
+            result = datetime(year, month, day, hour, minute, second or 0)
+        except ValueError:
+            # 평년에는 없는 02.29
+            continue
+        if result - now <= FUTURE_TOLERANCE or result.date() <= now.date():
+            return result
+    raise ValueError(f"No such date before {now}: {text!r}")
+
+
+# 아래 파서들은 ParsePool의 worker에서 돌 수 있도록 module 최상위에 두고
+# pickle 가능한 값만 돌려준다. 시간 문자열은 API에서 변환한다.
+
+
+def _parse_board(text):
+    """
+    모바일 갤러리 목록 페이지
+    :return: DocumentIndex 인자(board_id, document, comments 제외)의 list
+    """
+    parsed = lxml.html.fromstring(text)
+    rows = []
+    for li in parsed.xpath("//ul[contains(@class, 'gall-detail-lst')]/li"):
+        if li.get("class", "").startswith("ad"):
+            continue
+        doc = li[0]
+        if len(doc[0][1]) == 5:
+            subject = doc[0][1][0].text
+            author = doc[0][1][1].text
+            time = doc[0][1][2].text
+            view_count = int(doc[0][1][3].text.split()[-1])
+            voteup_count = int(doc[0][1][4][0].text.split()[-1])
+        else:
+            subject = None
+            author = doc[0][1][0].text
+            time = doc[0][1][1].text
+            view_count = int(doc[0][1][2].text.split()[-1])
+            voteup_count = int(doc[0][1][3].text_content().split()[-1])
+        rows.append(
+            {
+                "id": doc[0].get("href").split("/")[-1].split("?")[0],
+                "title": doc[0][0][1].text,
+                "has_image": doc[0][0][0].get("class").endswith("img"),
+                "image_available": "sp-lst-img" in doc[0][0][0].get("class"),
+                "author": author,
+                "view_count": view_count,
+                "voteup_count": voteup_count,
+                "comment_count": int(doc[1][0].text),
+                "time": time,
+                "subject": subject,
+            }
+        )
+    return rows
+
+
+def _parse_document(text):
+    """
+    모바일 글 페이지
+    :return: Document 인자(id, board_id, comments 제외, images는 src의
+             list)의 dict, 본문을 못 찾으면 None
+    """
+    parsed = lxml.html.fromstring(text)
+    doc_content_container = parsed.xpath("//div[@class='thum-txtin']")
+    doc_head_containers = parsed.xpath(
+        "//div[starts-with(@class, 'gallview-tit-box')]"
+    )
+    if not len(doc_head_containers) or not len(doc_content_container):
+        return None
+    doc_head_container = doc_head_containers[0]
+    doc_content = doc_content_container[0]
+    for adv in doc_content.xpath("div[@class='adv-groupin']"):
+        adv.getparent().remove(adv)
+    for adv in doc_content.xpath("//img"):
+        if adv.get("src", "").startswith("https://nstatic") and not adv.get(
+            "data-original"
+        ):
+            adv.getparent().remove(adv)
+    return {
+        "title": " ".join(doc_head_container[0].text.strip().split()),
+        "author": doc_head_container[1][0][0].text.strip(),
+        "author_id": (
+            None
+            if len(doc_head_container[1]) <= 1
+            else doc_head_container[1][1][0].get("href").split("/")[-1]
+        ),
+        "contents": "\n".join(
+            i.strip()
+            for i in doc_content.itertext()
+            if i.strip() and not i.strip().startswith("이미지 광고")
+        ),
+        "images": [
+            i.get("data-original", i.get("src"))
+            for i in doc_content.xpath("//img")
+            if i.get("data-original")
+            or (
+                not i.get("src", "").startswith("https://nstatic")
+                and not i.get("src", "").startswith(
+                    "https://img.iacstatic.co.kr"
+                )
+                and i.get("src")
+            )
+        ],
+        "html": lxml.html.tostring(doc_content, encoding=str),
+        "view_count": int(
+            parsed.xpath("//ul[@class='ginfo2']")[1][0].text.strip().split()[1]
+        ),
+        "voteup_count": int(
+            parsed.xpath("//span[@id='recomm_btn']")[0].text.strip()
+        ),
+        "votedown_count": int(
+            parsed.xpath("//span[@id='nonrecomm_btn']")[0].text.strip()
+        ),
+        "logined_voteup_count": int(
+            parsed.xpath("//span[@id='recomm_btn_member']")[0].text.strip()
+        ),
+        "time": doc_head_container[1][0][1].text.strip(),
+    }
+
+
+def _parse_comments(text):
+    """
+    모바일 댓글 ajax 응답 한 페이지
+    :return: (Comment 인자의 dict list, 전체 페이지 수)
+             페이지 표시가 없으면 전체 페이지 수는 None,
+             댓글이 없는 페이지면 (None, None)
+    """
+    parsed = lxml.html.fromstring(text)
+    if not len(parsed[1].xpath("li")):
+        return None, None
+    rows = []
+    for li in parsed[1].xpath("li"):
+        if not len(li[0]) or not li[0].text:
+            continue
+        rows.append(
+            {
+                "id": li.get("no"),
+                "is_reply": "comment-add"
+                in li.get("class", "").strip().split(),
+                "author": li[0].text
+                + ("{}".format(li[0][0].text) if li[0][0].text else ""),
+                "author_id": (
+                    li[0][1].get("data-info", None) if len(li[0]) > 1 else None
+                ),
+                "contents": "\n".join(i.strip() for i in li[1].itertext()),
+                "dccon": (
+                    li[1][0].get("data-original", li[1][0].get("src", None))
+                    if len(li[1]) and li[1][0].tag == "img"
+                    else None
+                ),
+                "voice": (
+                    li[1][0].get("src", None)
+                    if len(li[1]) and li[1][0].tag == "iframe"
+                    else None
+                ),
+                "time": li[2].text,
+            }
+        )
+    last_page = None
+    page_num_els = parsed.xpath("span[@class='pgnum']")
+    if page_num_els:
+        p = page_num_els[0].itertext()
+        next(p)
+        last_page = int(next(p).strip().lstrip("/"))
+    return rows, last_page
+
+
 class DocumentIndex:
     __slots__ = [
         "id",
@@ -119,6 +357,36 @@ class DocumentIndex:
         return f"{self.subject or ''}\t|{self.id}\t|{self.time.isoformat()}\t|{self.author}\t|{self.title}({self.comment_count}) +{self.voteup_count}"
 
 
+class LazyDocument:
+    """
+    DocumentIndex.document로 쓰이는 handle
+    처음 부를 때 글을 가져오고, 이후에는 같은 결과를 돌려준다.
+    동시에 여러 번 불러도 요청은 한 번만 보내며, 실패하면 다음에 다시
+    가져온다.
+    """
+
+    __slots__ = ["api", "board_id", "document_id", "_future"]
+
+    def __init__(self, api, board_id, document_id):
+        self.api = api
+        self.board_id = board_id
+        self.document_id = document_id
+        self._future = None
+
+    def __call__(self):
+        if self._future is None:
+            self._future = asyncio.ensure_future(
+                self.api.document(self.board_id, self.document_id)
+            )
+            self._future.add_done_callback(self._forget_failure)
+        # 기다리던 쪽이 취소되어도 다른 쪽이 쓸 수 있도록 shield
+        return asyncio.shield(self._future)
+
+    def _forget_failure(self, future):
+        if future.cancelled() or future.exception() is not None:
+            self._future = None
+
+
 class Document:
     __slots__ = [
         "id",
@@ -175,6 +443,25 @@ class Document:
     def __str__(self):
         return f"{self.subject or ''}\t|{self.id}\t|{self.time.isoformat()}\t|{self.author}\t|{self.title}({self.comment_count}) +{self.voteup_count} -{self.votedown_count}\n{self.contents}"
 
+    def to_post(self):
+        """
+        크롤러들이 쓰는 Post로 바꾼다.
+        """
+        return Post(
+            title=self.title,
+            content=self.contents,
+            stock_name="",
+            author=self.author,
+            reg_ts=self.time.strftime("%Y-%m-%d %H:%M:%S"),
+            views=self.view_count,
+            likes=self.voteup_count,
+            dislikes=self.votedown_count,
+            platform="dcinside",
+            board=self.board_id,
+            post_id=int(self.id),
+            url=MOBILE_URL + "/board/{}/{}".format(self.board_id, self.id),
+        )
+
 
 class Comment:
     __slots__ = [
@@ -205,46 +492,85 @@ class Comment:
 
 
 class Image:
-    __slots__ = ["src", "document_id", "board_id", "session"]
+    __slots__ = ["src", "document_id", "board_id", "session", "limiter"]
 
-    def __init__(self, src, document_id, board_id, session):
+    def __init__(self, src, document_id, board_id, session, limiter):
         self.src = src
         self.document_id = document_id
         self.board_id = board_id
         self.session = session
+        self.limiter = limiter
 
-    async def load(self):
+    def _headers(self):
         headers = GET_HEADERS.copy()
-        headers["Referer"] = "https://m.dcinside.com/board/{}/{}".format(
+        headers["Referer"] = MOBILE_URL + "/board/{}/{}".format(
             self.board_id, self.document_id
         )
-        async with self.session.get(
-            self.src, cookies=GALLERY_POSTS_COOKIES, headers=headers
+        return headers
+
+    async def load(self):
+        async with self.limiter.request(
+            self.session,
+            "GET",
+            self.src,
+            cookies=GALLERY_POSTS_COOKIES,
+            headers=self._headers(),
         ) as res:
             return await res.read()
 
     async def download(self, path):
-        headers = GET_HEADERS.copy()
-        headers["Referer"] = "https://m.dcinside.com/board/{}/{}".format(
-            self.board_id, self.document_id
+        """
+        이미지를 path.(확장자)에 chunk 단위로 받는다.
+        :return: 저장된 파일 경로
+        """
+        tmp = path + ".part"
+        try:
+            async with self.limiter.request(
+                self.session,
+                "GET",
+                self.src,
+                cookies=GALLERY_POSTS_COOKIES,
+                headers=self._headers(),
+            ) as res:
+                _, head = await write_stream(res, tmp)
+            path = path + "." + sniff_extension(head)
+            os.replace(tmp, path)
+            return path
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    async def save(self, store: ImageStore):
+        """
+        이미지를 내용 기준으로 store에 저장한다. 같은 이미지는 한 번만 저장.
+        :return: 저장된 파일 경로
+        """
+        return await store.download(
+            self.session,
+            self.limiter,
+            self.src,
+            cookies=GALLERY_POSTS_COOKIES,
+            headers=self._headers(),
         )
-        async with self.session.get(
-            self.src, cookies=GALLERY_POSTS_COOKIES, headers=headers
-        ) as res:
-            bytes = await res.read()
-            ext = filetype.guess(bytes).extension
-            with open(path + "." + ext, "wb") as f:
-                f.write(bytes)
 
 
 class API:
-    def __init__(self):
-        self.session = aiohttp.ClientSession(
-            headers=GET_HEADERS, cookies={"_ga": "GA1.2.693521455.1588839880"}
-        )
+    def __init__(
+        self,
+        session=None,
+        limiter: RateLimiter = None,
+        cache: HTTPCache = None,
+        parser: ParsePool = None,
+    ):
+        self.owns_session = session is None
+        self.session = session if session is not None else create_session()
+        self.limiter = limiter or RateLimiter()
+        self.cache = cache
+        self.parser = parser or ParsePool(workers=0)
 
     async def close(self):
-        await self.session.close()
+        if self.owns_session:
+            await close_session(self.session)
 
     async def __aenter__(self):
         return self
@@ -252,13 +578,73 @@ class API:
     async def __aexit__(self, *args, **kwargs):
         await self.close()
 
-    async def watch(self, board_id):
-        pass
+    def _get(self, url, headers=None, cookies=None, **kwargs):
+        return self.limiter.request(
+            self.session,
+            "GET",
+            url,
+            headers=GET_HEADERS if headers is None else headers,
+            cookies=DEFAULT_COOKIES if cookies is None else cookies,
+            **kwargs,
+        )
+
+    async def _get_text(self, url):
+        """
+        읽기 전용 페이지(목록, 글)를 캐시를 거쳐서 가져온다.
+        """
+        return await fetch_text(
+            self.session,
+            url,
+            self.limiter,
+            self.cache,
+            headers=GET_HEADERS,
+            cookies=DEFAULT_COOKIES,
+        )
+
+    def _post(self, url, headers=None, cookies=None, **kwargs):
+        return self.limiter.request(
+            self.session,
+            "POST",
+            url,
+            headers=GET_HEADERS if headers is None else headers,
+            cookies=DEFAULT_COOKIES if cookies is None else cookies,
+            **kwargs,
+        )
+
+    async def watch(self, board_id, interval=None, backlog=0, **kwargs):
+        """
+        board_id 게시판에 새로 올라오는 글의 DocumentIndex를 계속 흘려보낸다.
+        매번 첫 페이지부터 지난번에 본 가장 큰 글 번호까지만 넘기고
+        (document_id_lower_limit), 새 글이 올라오는 속도에 맞춰 다음
+        확인까지의 간격을 조절한다.
+        :param interval: 간격을 정할 AdaptiveInterval (없으면 기본값)
+        :param backlog: 처음 확인할 때 흘려보낼 최근 글 수
+        :param kwargs: board()에 넘길 인자 (recommend 등)
+        """
+        interval = interval or AdaptiveInterval()
+        last = None
+        while True:
+            if last is None:
+                indexes = self.board(board_id, num=max(backlog, 1), **kwargs)
+            else:
+                indexes = self.board(
+                    board_id, document_id_lower_limit=last, **kwargs
+                )
+            new_posts = 0
+            top = last or 0
+            async for index in indexes:
+                top = max(top, int(index.id))
+                if last is not None or new_posts < backlog:
+                    yield index
+                new_posts += 1
+            delay = interval.update(None if last is None else new_posts)
+            last = top
+            await asyncio.sleep(delay)
 
     async def gallery(self, name=None):
-        url = "https://m.dcinside.com/galltotal"
+        url = MOBILE_URL + "/galltotal"
         gallerys = {}
-        async with self.session.get(url) as res:
+        async with self._get(url) as res:
             text = await res.text()
             parsed = lxml.html.fromstring(text)
         for i in parsed.xpath('//*[@id="total_1"]/li'):
@@ -286,25 +672,17 @@ class API:
         page = start_page
         while num:
             if recommend:
-                url = "https://m.dcinside.com/board/{}?recommend=1&page={}".format(
+                url = MOBILE_URL + "/board/{}?recommend=1&page={}".format(
                     board_id, page
                 )
             else:
-                url = "https://m.dcinside.com/board/{}?page={}".format(
-                    board_id, page
-                )
-            async with self.session.get(url) as res:
-                text = await res.text()
-                parsed = lxml.html.fromstring(text)
-            doc_headers = (
-                i[0]
-                for i in parsed.xpath(
-                    "//ul[contains(@class, 'gall-detail-lst')]/li"
-                )
-                if not i.get("class", "").startswith("ad")
+                url = MOBILE_URL + "/board/{}?page={}".format(board_id, page)
+            doc_headers = await self.parser.parse(
+                _parse_board, await self._get_text(url)
             )
-            for doc in doc_headers:
-                document_id = doc[0].get("href").split("/")[-1].split("?")[0]
+            now = datetime.now()
+            for row in doc_headers:
+                document_id = row["id"]
                 if document_id_upper_limit and int(
                     document_id_upper_limit
                 ) <= int(document_id):
@@ -314,37 +692,14 @@ class API:
                 ) >= int(document_id):
                     return
 
-                if len(doc[0][1]) == 5:
-                    subject = doc[0][1][0].text
-                    author = doc[0][1][1].text
-                    time = self.__parse_time(doc[0][1][2].text)
-                    view_count = int(doc[0][1][3].text.split()[-1])
-                    voteup_count = int(doc[0][1][4][0].text.split()[-1])
-                else:
-                    subject = None
-                    author = doc[0][1][0].text
-                    time = self.__parse_time(doc[0][1][1].text)
-                    view_count = int(doc[0][1][2].text.split()[-1])
-                    voteup_count = int(doc[0][1][3].text_content().split()[-1])
-                if "sp-lst-img" in doc[0][0][0].get("class"):
-                    image_available = True
-                else:
-                    image_available = False
-                title = doc[0][0][1].text
                 indexdata = DocumentIndex(
-                    id=document_id,
                     board_id=board_id,
-                    title=title,
-                    has_image=doc[0][0][0].get("class").endswith("img"),
-                    author=author,
-                    view_count=view_count,
-                    voteup_count=voteup_count,
-                    comment_count=int(doc[1][0].text),
-                    document=lambda: self.document(board_id, document_id),
-                    comments=lambda: self.comments(board_id, document_id),
-                    time=time,
-                    subject=subject,
-                    image_available=image_available,
+                    document=LazyDocument(self, board_id, document_id),
+                    comments=functools.partial(
+                        self.comments, board_id, document_id
+                    ),
+                    time=self.__parse_time(row.pop("time"), now),
+                    **row,
                 )
                 yield (indexdata)
                 num -= 1
@@ -355,89 +710,52 @@ class API:
             else:
                 page += 1
 
+    async def resolve_documents(
+        self, indexes, concurrency=DOCUMENT_CONCURRENCY
+    ):
+        """
+        board()가 준 DocumentIndex들의 글을 concurrency개씩 동시에 가져온다.
+        가져온 글은 각 index의 document()에도 기억된다.
+        :return: indexes 순서대로의 Document list (못 가져온 글은 None)
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def resolve(index):
+            async with semaphore:
+                try:
+                    return await index.document()
+                except Exception as e:
+                    log.warning("Failed to fetch document %s: %r", index.id, e)
+                    return None
+
+        return await asyncio.gather(*[resolve(index) for index in indexes])
+
     async def document(self, board_id, document_id):
-        url = "https://m.dcinside.com/board/{}/{}".format(
-            board_id, document_id
+        url = MOBILE_URL + "/board/{}/{}".format(board_id, document_id)
+        parsed = await self.parser.parse(
+            _parse_document, await self._get_text(url)
         )
-        async with self.session.get(url) as res:
-            text = await res.text()
-            parsed = lxml.html.fromstring(text)
-        doc_content_container = parsed.xpath("//div[@class='thum-txtin']")
-        doc_head_containers = parsed.xpath(
-            "//div[starts-with(@class, 'gallview-tit-box')]"
-        )
-        if not len(doc_head_containers):
-            return None
-        doc_head_container = doc_head_containers[0]
-        if len(doc_content_container):
-            title = " ".join(doc_head_container[0].text.strip().split())
-            author = doc_head_container[1][0][0].text.strip()
-            author_id = (
-                None
-                if len(doc_head_container[1]) <= 1
-                else doc_head_container[1][1][0].get("href").split("/")[-1]
-            )
-            time = doc_head_container[1][0][1].text.strip()
-            doc_content = parsed.xpath("//div[@class='thum-txtin']")[0]
-            for adv in doc_content.xpath("div[@class='adv-groupin']"):
-                adv.getparent().remove(adv)
-            for adv in doc_content.xpath("//img"):
-                if adv.get("src", "").startswith(
-                    "https://nstatic"
-                ) and not adv.get("data-original"):
-                    adv.getparent().remove(adv)
-            return Document(
-                id=document_id,
-                board_id=board_id,
-                title=title,
-                author=author,
-                author_id=author_id,
-                contents="\n".join(
-                    i.strip()
-                    for i in doc_content.itertext()
-                    if i.strip() and not i.strip().startswith("이미지 광고")
-                ),
-                images=[
-                    Image(
-                        src=i.get("data-original", i.get("src")),
-                        board_id=board_id,
-                        document_id=document_id,
-                        session=self.session,
-                    )
-                    for i in doc_content.xpath("//img")
-                    if i.get("data-original")
-                    or (
-                        not i.get("src", "").startswith("https://nstatic")
-                        and not i.get("src", "").startswith(
-                            "https://img.iacstatic.co.kr"
-                        )
-                        and i.get("src")
-                    )
-                ],
-                html=lxml.html.tostring(doc_content, encoding=str),
-                view_count=int(
-                    parsed.xpath("//ul[@class='ginfo2']")[1][0]
-                    .text.strip()
-                    .split()[1]
-                ),
-                voteup_count=int(
-                    parsed.xpath("//span[@id='recomm_btn']")[0].text.strip()
-                ),
-                votedown_count=int(
-                    parsed.xpath("//span[@id='nonrecomm_btn']")[0].text.strip()
-                ),
-                logined_voteup_count=int(
-                    parsed.xpath("//span[@id='recomm_btn_member']")[
-                        0
-                    ].text.strip()
-                ),
-                comments=lambda: self.comments(board_id, document_id),
-                time=self.__parse_time(time),
-            )
-        else:
+        if parsed is None:
             # fail due to unusual tags in mobile version
             # at now, just skip it
             return None
+        return Document(
+            id=document_id,
+            board_id=board_id,
+            images=[
+                Image(
+                    src=src,
+                    board_id=board_id,
+                    document_id=document_id,
+                    session=self.session,
+                    limiter=self.limiter,
+                )
+                for src in parsed.pop("images")
+            ],
+            comments=functools.partial(self.comments, board_id, document_id),
+            time=self.__parse_time(parsed.pop("time")),
+            **parsed,
+        )
         """ !TODO: use an alternative(PC) protocol to fetch document
         else:
             url = "https://gall.dcinside.com/{}?no={}".format(board_id, document_id)
@@ -447,57 +765,70 @@ class API:
             return '\n'.join(i.strip() for i in doc_content.itertext() if i.strip() and not i.strip().startswith("이미지 광고")), [i.get("src") for i in doc_content.xpath("//img") if not i.get("src","").startswith("https://nstatic")], comments(board_id, document_id, sess=sess)
         """
 
-    async def comments(self, board_id, document_id, num=-1, start_page=1):
-        url = "https://m.dcinside.com/ajax/response-comment"
-        for page in range(start_page, 999999):
-            payload = {
-                "id": board_id,
-                "no": document_id,
-                "cpage": page,
-                "managerskill": "",
-                "del_scope": "1",
-                "csort": "",
-            }
-            async with self.session.post(
-                url, headers=XML_HTTP_REQ_HEADERS, data=payload
-            ) as res:
-                parsed = lxml.html.fromstring(await res.text())
-            if not len(parsed[1].xpath("li")):
-                break
-            for li in parsed[1].xpath("li"):
-                if not len(li[0]) or not li[0].text:
-                    continue
-                yield Comment(
-                    id=li.get("no"),
-                    is_reply="comment-add"
-                    in li.get("class", "").strip().split(),
-                    author=li[0].text
-                    + ("{}".format(li[0][0].text) if li[0][0].text else ""),
-                    author_id=li[0][1].get("data-info", None)
-                    if len(li[0]) > 1
-                    else None,
-                    contents="\n".join(i.strip() for i in li[1].itertext()),
-                    dccon=li[1][0].get(
-                        "data-original", li[1][0].get("src", None)
+    async def _comment_page(self, board_id, document_id, page):
+        url = MOBILE_URL + "/ajax/response-comment"
+        payload = {
+            "id": board_id,
+            "no": document_id,
+            "cpage": page,
+            "managerskill": "",
+            "del_scope": "1",
+            "csort": "",
+        }
+        # 댓글을 읽기만 하는 요청이라 실패하면 다시 보내도 된다
+        async with self._post(
+            url, headers=XML_HTTP_REQ_HEADERS, data=payload, retry=True
+        ) as res:
+            text = await res.text()
+        return await self.parser.parse(_parse_comments, text)
+
+    async def comments(
+        self,
+        board_id,
+        document_id,
+        num=-1,
+        start_page=1,
+        concurrency=COMMENT_CONCURRENCY,
+    ):
+        """
+        첫 페이지에서 전체 페이지 수를 읽고, 나머지 페이지는 concurrency개씩
+        앞서서 동시에 가져온다. 댓글은 페이지 순서대로 나온다.
+        """
+        rows, last_page = await self._comment_page(
+            board_id, document_id, start_page
+        )
+        if rows is None:
+            return
+        pages = iter(range(start_page + 1, (last_page or start_page) + 1))
+        ahead = collections.deque(
+            asyncio.create_task(
+                self._comment_page(board_id, document_id, page)
+            )
+            for page in itertools.islice(pages, concurrency)
+        )
+        try:
+            while rows is not None:
+                now = datetime.now()
+                for row in rows:
+                    yield Comment(
+                        time=self.__parse_time(row.pop("time"), now), **row
                     )
-                    if len(li[1]) and li[1][0].tag == "img"
-                    else None,
-                    voice=li[1][0].get("src", None)
-                    if len(li[1]) and li[1][0].tag == "iframe"
-                    else None,
-                    time=self.__parse_time(li[2].text),
-                )
-                num -= 1
-                if num == 0:
-                    return
-            page_num_els = parsed.xpath("span[@class='pgnum']")
-            if page_num_els:
-                p = page_num_els[0].itertext()
-                next(p)
-                if page == next(p)[1:]:
+                    num -= 1
+                    if num == 0:
+                        return
+                if not ahead:
                     break
-            else:
-                break
+                rows, _ = await ahead.popleft()
+                for page in itertools.islice(pages, 1):
+                    ahead.append(
+                        asyncio.create_task(
+                            self._comment_page(board_id, document_id, page)
+                        )
+                    )
+        finally:
+            for task in ahead:
+                task.cancel()
+            await asyncio.gather(*ahead, return_exceptions=True)
 
     async def write_comment(
         self,
@@ -511,10 +842,8 @@ class API:
         password="",
         is_minor=False,
     ):
-        url = "https://m.dcinside.com/board/{}/{}".format(
-            board_id, document_id
-        )
-        async with self.session.get(url) as res:
+        url = MOBILE_URL + "/board/{}/{}".format(board_id, document_id)
+        async with self._get(url) as res:
             parsed = lxml.html.fromstring(await res.text())
         hide_robot = parsed.xpath("//input[@class='hide-robot']")[0].get(
             "name"
@@ -530,14 +859,14 @@ class API:
         header = XML_HTTP_REQ_HEADERS.copy()
         header["Referer"] = url
         header["Host"] = "m.dcinside.com"
-        header["Origin"] = "https://m.dcinside.com"
+        header["Origin"] = MOBILE_URL
         header["X-CSRF-TOKEN"] = csrf_token
         cookies = {
             "m_dcinside_" + board_id: board_id,
             "m_dcinside_lately": quote(board_id + "|" + board_name + ","),
             "_ga": "GA1.2.693521455.1588839880",
         }
-        url = "https://m.dcinside.com/ajax/comment-write"
+        url = MOBILE_URL + "/ajax/comment-write"
         payload = {
             "comment_memo": contents,
             "comment_nick": name,
@@ -557,13 +886,13 @@ class API:
         if dccon_id:
             payload["detail_idx"] = dccon_id
         if dccon_src:
-            payload[
-                "comment_memo"
-            ] = "<img src='{}' class='written_dccon' alt='1'>".format(
-                dccon_src
+            payload["comment_memo"] = (
+                "<img src='{}' class='written_dccon' alt='1'>".format(
+                    dccon_src
+                )
             )
-        # async with self.session.post(url, headers=header, data=payload, cookies=cookies) as res:
-        async with self.session.post(
+        # async with self._post(url, headers=header, data=payload, cookies=cookies) as res:
+        async with self._post(
             url, headers=header, data=payload, cookies=cookies
         ) as res:
             parsed = await res.text()
@@ -590,10 +919,10 @@ class API:
         is_minor=False,
     ):
         if not password:
-            url = "https://m.dcinside.com/write/{}/modify/{}".format(
+            url = MOBILE_URL + "/write/{}/modify/{}".format(
                 board_id, document_id
             )
-            async with self.session.get(url) as res:
+            async with self._get(url) as res:
                 return await self.__write_or_modify_document(
                     board_id,
                     title,
@@ -605,11 +934,11 @@ class API:
                     document_id=document_id,
                     is_minor=is_minor,
                 )
-        url = "https://m.dcinside.com/confirmpw/{}/{}?mode=modify".format(
+        url = MOBILE_URL + "/confirmpw/{}/{}?mode=modify".format(
             board_id, document_id
         )
         referer = url
-        async with self.session.get(url) as res:
+        async with self._get(url) as res:
             parsed = lxml.html.fromstring(await res.text())
         token = parsed.xpath("//input[@name='_token']")[0].get("value", "")
         csrf_token = parsed.xpath("//meta[@name='csrf-token']")[0].get(
@@ -629,10 +958,10 @@ class API:
         header = XML_HTTP_REQ_HEADERS.copy()
         header["Referer"] = referer
         header["Host"] = "m.dcinside.com"
-        header["Origin"] = "https://m.dcinside.com"
+        header["Origin"] = MOBILE_URL
         header["X-CSRF-TOKEN"] = csrf_token
-        url = "https://m.dcinside.com/ajax/pwcheck-board"
-        async with self.session.post(url, headers=header, data=payload) as res:
+        url = MOBILE_URL + "/ajax/pwcheck-board"
+        async with self._post(url, headers=header, data=payload) as res:
             res = await res.text()
             if not res.strip():
                 Exception(
@@ -646,10 +975,8 @@ class API:
         }
         header = POST_HEADERS.copy()
         header["Referer"] = referer
-        url = "https://m.dcinside.com/write/{}/modify/{}".format(
-            board_id, document_id
-        )
-        async with self.session.post(url, headers=header, data=payload) as res:
+        url = MOBILE_URL + "/write/{}/modify/{}".format(board_id, document_id)
+        async with self._post(url, headers=header, data=payload) as res:
             return await self.__write_or_modify_document(
                 board_id,
                 title,
@@ -665,10 +992,8 @@ class API:
         self, board_id, document_id, password="", is_minor=False
     ):
         if not password:
-            url = "https://m.dcinside.com/board/{}/{}".format(
-                board_id, document_id
-            )
-            async with self.session.get(url) as res:
+            url = MOBILE_URL + "/board/{}/{}".format(board_id, document_id)
+            async with self._get(url) as res:
                 parsed = lxml.html.fromstring(await res.text())
             csrf_token = parsed.xpath("//meta[@name='csrf-token']")[0].get(
                 "content"
@@ -679,20 +1004,18 @@ class API:
             con_key = await self.__access(
                 "board_Del", url, require_conkey=False, csrf_token=csrf_token
             )
-            url = "https://m.dcinside.com/del/board"
+            url = MOBILE_URL + "/del/board"
             payload = {"id": board_id, "no": document_id, "con_key": con_key}
-            async with self.session.post(
-                url, headers=header, data=payload
-            ) as res:
+            async with self._post(url, headers=header, data=payload) as res:
                 res = await res.text()
             if res.find("true") < 0:
                 raise Exception("Error while removing: " + unquote(str(res)))
             return True
-        url = "https://m.dcinside.com/confirmpw/{}/{}?mode=del".format(
+        url = MOBILE_URL + "/confirmpw/{}/{}?mode=del".format(
             board_id, document_id
         )
         referer = url
-        async with self.session.get(url) as res:
+        async with self._get(url) as res:
             parsed = lxml.html.fromstring(await res.text())
         token = parsed.xpath("//input[@name='_token']")[0].get("value", "")
         csrf_token = parsed.xpath("//meta[@name='csrf-token']")[0].get(
@@ -718,8 +1041,8 @@ class API:
             "m_dcinside_lately": quote(board_id + "|" + board_name + ","),
             "_ga": "GA1.2.693521455.1588839880",
         }
-        url = "https://m.dcinside.com/del/board"
-        async with self.session.post(
+        url = MOBILE_URL + "/del/board"
+        async with self._post(
             url, headers=header, data=payload, cookies=cookies
         ) as res:
             res = await res.text()
@@ -753,8 +1076,8 @@ class API:
         is_minor=False,
     ):
         if not intermediate:
-            url = "https://m.dcinside.com/write/{}".format(board_id)
-            async with self.session.get(url) as res:
+            url = MOBILE_URL + "/write/{}".format(board_id)
+            async with self._get(url) as res:
                 parsed = lxml.html.fromstring(await res.text())
         else:
             parsed = lxml.html.fromstring(intermediate)
@@ -781,7 +1104,7 @@ class API:
         header = XML_HTTP_REQ_HEADERS.copy()
         header["Referer"] = url
         header["X-CSRF-TOKEN"] = csrf_token
-        url = "https://m.dcinside.com/ajax/w_filter"
+        url = MOBILE_URL + "/ajax/w_filter"
         payload = {
             "subject": title,
             "memo": contents,
@@ -790,7 +1113,7 @@ class API:
         }
         if rand_code:
             payload["code"] = rand_code
-        async with self.session.post(url, headers=header, data=payload) as res:
+        async with self._post(url, headers=header, data=payload) as res:
             res = await res.text()
             res = json.loads(res)
         if not res["result"]:
@@ -834,7 +1157,7 @@ class API:
             "m_dcinside_lately": quote(board_id + "|" + board_name + ","),
             "_ga": "GA1.2.693521455.1588839880",
         }
-        async with self.session.post(
+        async with self._post(
             url, headers=header, data=payload, cookies=cookies
         ) as res:
             res = await res.text()
@@ -843,7 +1166,7 @@ class API:
         self, token_verify, target_url, require_conkey=True, csrf_token=None
     ):
         if require_conkey:
-            async with self.session.get(target_url) as res:
+            async with self._get(target_url) as res:
                 parsed = lxml.html.fromstring(await res.text())
             con_key = parsed.xpath("//input[@id='con_key']")[0].get("value")
             payload = {"token_verify": token_verify, "con_key": con_key}
@@ -851,47 +1174,15 @@ class API:
             payload = {
                 "token_verify": token_verify,
             }
-        url = "https://m.dcinside.com/ajax/access"
+        url = MOBILE_URL + "/ajax/access"
         headers = XML_HTTP_REQ_HEADERS.copy()
         headers["Referer"] = target_url
         headers["X-CSRF-TOKEN"] = csrf_token
-        async with self.session.post(
-            url, headers=headers, data=payload
-        ) as res:
+        async with self._post(url, headers=headers, data=payload) as res:
             return (await res.json())["Block_key"]
 
-    def __parse_time(self, time):
-        today = datetime.now()
-        if len(time) <= 5:
-            if time.find(":") > 0:
-                return datetime.strptime(time, "%H:%M").replace(
-                    year=today.year, month=today.month, day=today.day
-                )
-            else:
-                return datetime.strptime(time, "%m.%d").replace(
-                    year=today.year, hour=23, minute=59, second=59
-                )
-        elif len(time) <= 11:
-            if time.find(":") > 0:
-                return datetime.strptime(time, "%m.%d %H:%M").replace(
-                    year=today.year
-                )
-            else:
-                return datetime.strptime(time, "%y.%m.%d").replace(
-                    year=today.year, hour=23, minute=59, second=59
-                )
-        elif len(time) <= 16:
-            if time.count(".") >= 2:
-                return datetime.strptime(time, "%Y.%m.%d %H:%M")
-            else:
-                return datetime.strptime(time, "%m.%d %H:%M:%S").replace(
-                    year=today.year
-                )
-        else:
-            if "." in time:
-                return datetime.strptime(time, "%Y.%m.%d %H:%M:%S")
-            else:
-                return datetime.strptime(time, "%Y-%m-%d %H:%M:%S")
+    def __parse_time(self, time, now=None):
+        return parse_time(time, now)
 
 
 import unittest
@@ -1,25 +1,312 @@
+import asyncio
+import logging
+import os
+from array import array
 from collections import namedtuple
 
-import requests
+import aiohttp
+
+from utils.metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+# post를 올릴 ilgaminati API (부하 테스트에서는 mock 서버로 바꾼다)
+API_URL = os.environ.get(
+    "ILGAMINATI_API_URL",
+    "https://hxx059yi92.execute-api.ap-northeast-2."
+    "amazonaws.com/api/crawling/posts",
+)
+# post 하나를 보내보는 최대 횟수와 다시 보내기까지 기다리는 시간(초)
+# (기다리는 시간은 시도할 때마다 두 배)
+SEND_ATTEMPTS = 3
+SEND_BACKOFF = 1.0
 
 Post = namedtuple(
     "Post",
-    "title, content, stock_name, author,reg_ts, views, likes, dislikes",
+    "title, content, stock_name, author, reg_ts, views, likes, dislikes,"
+    " agree, platform, board, post_id, url, comments",
+    defaults=(0, "", "", 0, "", ()),
 )
+# PostBatch에서 array로 보관하는 int column
+INT_COLUMNS = ("views", "likes", "dislikes", "agree", "post_id")
+
+
+class PostBatch:
+    """
+    Post들을 column 별로 모아두는 batch
+    문자열 column은 list, 수치 column은 array("q")로 보관해서 post마다
+    dict를 두는 것보다 메모리를 적게 쓰고, pandas/Arrow로 바로 넘길 수 있다.
+    """
+
+    def __init__(self, posts=()):
+        self.columns = {
+            field: array("q") if field in INT_COLUMNS else []
+            for field in Post._fields
+        }
+        self.extend(posts)
+
+    def __len__(self):
+        return len(self.columns["title"])
+
+    def __iter__(self):
+        return map(Post._make, zip(*self.columns.values()))
+
+    def append(self, post: Post):
+        for column, value in zip(self.columns.values(), post):
+            column.append(value)
+
+    def extend(self, posts):
+        for post in posts:
+            self.append(post)
+
+    def to_pandas(self):
+        import numpy as np
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                field: (
+                    np.frombuffer(column, dtype=np.int64)
+                    if field in INT_COLUMNS
+                    else column
+                )
+                for field, column in self.columns.items()
+            }
+        )
+
+    @classmethod
+    def from_pandas(cls, df):
+        batch = cls()
+        for field, column in batch.columns.items():
+            if field not in df:
+                column.extend([Post._field_defaults[field]] * len(df))
+            elif field in INT_COLUMNS:
+                column.frombytes(df[field].to_numpy("int64").tobytes())
+            else:
+                column.extend(df[field].tolist())
+        return batch
+
+    def to_arrow(self):
+        import pyarrow as pa
+
+        return pa.table(
+            {
+                field: (
+                    pa.Array.from_buffers(
+                        pa.int64(), len(column), [None, pa.py_buffer(column)]
+                    )
+                    if field in INT_COLUMNS
+                    else pa.array(column)
+                )
+                for field, column in self.columns.items()
+            }
+        )
+
+    @classmethod
+    def from_arrow(cls, table):
+        batch = cls()
+        for field, column in batch.columns.items():
+            if field not in table.column_names:
+                column.extend([Post._field_defaults[field]] * len(table))
+            elif field in INT_COLUMNS:
+                values = table.column(field).to_numpy()
+                column.frombytes(values.astype("int64").tobytes())
+            else:
+                column.extend(table.column(field).to_pylist())
+        return batch
+
+
+def to_payload(post: Post):
+    """
+    크롤링한 post를 ilgaminati API가 받는 json 형태로 변환
+    :param post: 크롤러가 만든 Post
+    :return: API 요청 body
+    """
+    payload = {
+        "title": post.title,
+        "author": post.author,
+        "content": post.content,
+        "stock_name": post.stock_name,
+        "likes": post.likes,
+        "dislikes": post.dislikes,
+        "views": post.views,
+        "reg_ts": post.reg_ts,
+    }
+    if post.comments:
+        payload["comments"] = list(post.comments)
+    return payload
+
+
+def send_to_ilgaminati(post: Post):
+    # 동기 크롤러에서만 쓰므로 async 크롤러가 requests를 import하지 않게 한다
+    import requests
+
+    return requests.post(API_URL, json=to_payload(post))
+
+
+class IlgaminatiSink:
+    """
+    post를 큐에 모아두었다가 batch 단위로 ilgaminati 서버에 비동기 전송한다.
+    큐가 가득 차면 put()이 대기하므로 업로드가 느릴 때 크롤러도 같이 느려진다.
+    API가 post 하나씩만 받기 때문에 batch는 keep-alive 연결 위에서
+    동시에 전송된다. 실패한 전송은 attempts번까지 다시 보내고, 결과는
+    put()에 넘긴 callback으로 알려준다.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 20,
+        flush_interval: float = 1.0,
+        max_queue: int = 100,
+        concurrency: int = 8,
+        url: str = API_URL,
+        attempts: int = SEND_ATTEMPTS,
+        backoff: float = SEND_BACKOFF,
+    ):
+        """
+        :param batch_size: 한 번에 전송할 최대 post 수
+        :param flush_interval: batch가 덜 찼어도 전송하기까지 기다리는 초
+        :param max_queue: 전송 대기 큐의 크기 (backpressure 기준)
+        :param concurrency: 서버로 동시에 열어둘 연결 수
+        :param url: post를 전송할 API 주소
+        :param attempts: post 하나를 보내보는 최대 횟수
+        :param backoff: 처음 다시 보내기까지 기다리는 시간(초)
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.concurrency = concurrency
+        self.url = url
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.session = None
+        self.sent = 0
+        self.failed = 0
+        self._worker = None
+        self._gauge = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency, keepalive_timeout=30
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30),
+        )
+        self._worker = asyncio.create_task(self._run())
+        self._gauge = METRICS.track(
+            "queue_depth", self.queue.qsize, queue="sink"
+        )
+        return self
+
+    async def close(self):
+        if self._worker is not None:
+            await self.queue.put(None)
+            await self._worker
+            self._worker = None
+            METRICS.untrack(self._gauge)
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *err):
+        await self.close()
+
+    async def put(self, post: Post, callback=None):
+        """
+        post를 전송 큐에 넣는다. 큐가 가득 차 있으면 자리가 날 때까지 대기.
+        :param callback: 전송이 끝나면 부를 함수 (post, error)
+                         올라갔으면 error는 None, 끝내 못 올렸으면 그 예외
+        :return: 전송이 끝나면 완료되는 Future (올라갔으면 True)
+        """
+        done = asyncio.get_running_loop().create_future()
+        await self.queue.put((post, callback, done))
+        return done
+
+    async def put_all(self, posts, callback=None):
+        """
+        posts(async iterable)의 post들을 큐에 넣고, 넣은 post들의 전송이
+        모두 끝날 때까지 기다린다. (다른 곳에서 넣은 post는 기다리지 않음)
+        :param callback: post마다 put()에 넘길 callback
+        :return: 넣은 post 수
+        """
+        uploads = set()
+        count = 0
+        async for post in posts:
+            upload = await self.put(post, callback)
+            uploads.add(upload)
+            upload.add_done_callback(uploads.discard)
+            count += 1
+        await asyncio.gather(*uploads)
+        return count
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
 
+    async def _flush(self, batch: list):
+        results = await asyncio.gather(
+            *[self._send(post) for post, _, _ in batch],
+            return_exceptions=True,
+        )
+        for (post, callback, done), result in zip(batch, results):
+            error = result if isinstance(result, Exception) else None
+            if error is None:
+                self.sent += 1
+                METRICS.inc("uploads_total", result="sent")
+            else:
+                self.failed += 1
+                METRICS.inc("uploads_total", result="failed")
+                log.warning("Failed to send post %s: %r", post.url, error)
+            if callback is not None:
+                try:
+                    callback(post, error)
+                except Exception as e:
+                    log.warning(
+                        "Upload callback failed for %s: %r", post.url, e
+                    )
+            if not done.done():
+                done.set_result(error is None)
 
-def send_to_ilgaminati(post: dict):
-    return requests.post(
-        "https://hxx059yi92.execute-api.ap-northeast-2."
-        "amazonaws.com/api/crawling/posts",
-        json={
-            "title": post["title"],
-            "author": post["author"],
-            "content": post["content"],
-            "stock_name": post["stock_name"],
-            "likes": int(post["likes"]),
-            "dislikes": int(post["dislikes"]),
-            "views": int(post["views"]),
-            "reg_ts": post["reg_ts"],
-        },
-    )
+    async def _send(self, post: Post):
+        for attempt in range(1, self.attempts + 1):
+            try:
+                with METRICS.timer("upload_seconds"):
+                    async with self.session.post(
+                        self.url, json=to_payload(post)
+                    ) as res:
+                        res.raise_for_status()
+                        return res.status
+            except aiohttp.ClientResponseError as e:
+                # 요청 자체가 잘못된 4xx는 다시 보내도 같다
+                if e.status < 500 and e.status != 429:
+                    raise
+                if attempt == self.attempts:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.attempts:
+                    raise
+            METRICS.inc("upload_retries_total")
+            await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
@@ -1,8 +1,187 @@
+import argparse
 import asyncio
-from crawler.naver_finance_async import nf_main
-from crawler.dcinside_async_v1 import dc_main
+import contextlib
+import logging
+import os
+import signal
+import time
+
+from crawler.naver_finance_async import crawl_naver, watch_naver
+from crawler.dcinside_async_v1 import crawl_dcinside, watch_dcinside
+from db_manager import IlgaminatiSink
+from utils.http_cache import HTTPCache
+from utils.limiter import RateLimiter
+from utils.metrics import METRICS
+from utils.parse_pool import ParsePool
+from utils.proxy import (
+    NoProxyAvailable,
+    ProxyPool,
+    candidates_from_env,
+    parse_candidates,
+)
+from utils.session import shared_session
+from utils.shard import Shard
+from utils.state import CrawlState
+
+log = logging.getLogger(__name__)
+
+# 함께 돌릴 platform 크롤러
+# (session, limiter, state, cache, parser, sink)를 받는 async 함수
+PLATFORMS = {
+    "naver": crawl_naver,
+    "dcinside": crawl_dcinside,
+}
+# daemon mode에서 게시판마다 따로 정한 간격으로 새 글을 계속 확인하는 함수
+# (인자는 PLATFORMS와 같고, 취소될 때까지 돈다)
+DAEMONS = {
+    "naver": watch_naver,
+    "dcinside": watch_dcinside,
+}
+# 전체 크롤링의 제한 시간(초), 0이면 제한 없음
+DEADLINE = float(os.environ.get("ILGAMINATI_DEADLINE", 0))
+
+
+async def run(
+    platforms=tuple(PLATFORMS),
+    deadline: float = DEADLINE,
+    daemon=False,
+    shard: Shard = None,
+    proxies=(),
+):
+    """
+    platform 크롤러들을 한 event loop에서 동시에 돌린다.
+    session, limiter, state, cache, parser, sink는 모두 함께 쓴다.
+    deadline이 지나거나 SIGINT/SIGTERM을 받으면 남은 크롤러를 취소하고,
+    sink에 쌓인 글은 마저 올린 뒤 끝낸다.
+    :param platforms: 돌릴 platform 이름들 (PLATFORMS의 key)
+    :param deadline: 제한 시간(초), 0이나 None이면 제한 없음
+    :param daemon: True면 한 번 돌고 끝나는 대신 DAEMONS로 계속 돈다
+    :param shard: 있으면 다른 worker들과 게시판을 나눠 맡는다
+    :param proxies: 있으면 모든 요청을 이 proxy 주소들로 나눠 보낸다
+                    (하나도 동작하지 않으면 NoProxyAvailable)
+    :return: {platform: 끝난 task}
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    signals = [signal.SIGINT, signal.SIGTERM]
+    for sig in signals:
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    crawlers = DAEMONS if daemon else PLATFORMS
+    extra = {} if shard is None else {"shard": shard}
+    pool = ProxyPool(proxies) if proxies else None
+    limiter = RateLimiter(proxies=pool)
+    start = time.monotonic()
+    # shard mode에서는 같은 state 파일과 캐시를 다른 worker 프로세스와 함께 쓴다
+    cache = HTTPCache(shared=shard is not None)
+    state = CrawlState(shared=shard is not None)
+    with state, cache, ParsePool() as parser:
+        async with shared_session() as session, IlgaminatiSink() as sink:
+            if pool is not None and not await pool.validate(session):
+                raise NoProxyAvailable(
+                    f"none of {len(pool.candidates)} proxies is alive"
+                )
+            tasks = {
+                name: asyncio.create_task(
+                    crawlers[name](
+                        session, limiter, state, cache, parser, sink, **extra
+                    ),
+                    name=name,
+                )
+                for name in platforms
+            }
+            everything = asyncio.gather(
+                *tasks.values(), return_exceptions=True
+            )
+            stopped = asyncio.create_task(stop.wait())
+            # lease를 잡고 있는 동안 계속 갱신한다
+            renewing = asyncio.create_task(shard.run()) if shard else None
+            # 빠진 proxy들을 주기적으로 다시 확인한다
+            checking = asyncio.create_task(pool.run(session)) if pool else None
+            try:
+                await asyncio.wait(
+                    [everything, stopped],
+                    timeout=deadline or None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            finally:
+                # 두 번째 신호부터는 기본 동작(바로 종료)으로 돌아간다
+                for sig in signals:
+                    with contextlib.suppress(NotImplementedError):
+                        loop.remove_signal_handler(sig)
+                stopped.cancel()
+                if renewing is not None:
+                    renewing.cancel()
+                if checking is not None:
+                    checking.cancel()
+                for task in tasks.values():
+                    task.cancel()
+                await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    for name, task in tasks.items():
+        if task.cancelled():
+            log.warning("%s: cancelled", name)
+        elif task.exception() is not None:
+            log.error("%s: failed", name, exc_info=task.exception())
+        else:
+            log.info("%s: done", name)
+    log.info("Crawled in %.1fs", time.monotonic() - start)
+    return tasks
+
+
+async def main(
+    platforms, deadline: float, daemon=False, shard=False, proxies=()
+):
+    async with METRICS.exporting():
+        if not shard:
+            await run(platforms, deadline, daemon, proxies=proxies)
+            return
+        with Shard() as s:
+            await s.start()
+            await run(platforms, deadline, daemon, s, proxies)
 
 
 if __name__ == "__main__":
-    asyncio.run(nf_main())
-    asyncio.run(dc_main())
+    parser = argparse.ArgumentParser()
+    for name in PLATFORMS:
+        parser.add_argument(
+            f"--{name}",
+            action=argparse.BooleanOptionalAction,
+            default=True,
+            help=f"{name} 크롤러를 돌릴지 여부",
+        )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=DEADLINE,
+        help="이 시간(초)이 지나면 남은 크롤러를 멈춘다 (0이면 제한 없음)",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="끝내지 않고 게시판마다 글이 올라오는 속도에 맞춰 계속 확인",
+    )
+    parser.add_argument(
+        "--shard",
+        action="store_true",
+        help="같은 lease 파일(ILGAMINATI_LEASES)을 보는 worker들과 "
+        "게시판을 나눠 맡는다 (죽은 worker의 게시판을 가져가는 것은 "
+        "--daemon일 때만, 한 번 돌 때는 시작할 때 잡은 게시판만 돈다)",
+    )
+    parser.add_argument(
+        "--proxies",
+        type=parse_candidates,
+        default=candidates_from_env(),
+        help="요청을 나눠 보낼 proxy 주소들, 쉼표로 구분 "
+        "(기본값 ILGAMINATI_PROXIES)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=os.environ.get("ILGAMINATI_LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    platforms = [name for name in PLATFORMS if getattr(args, name)]
+    asyncio.run(
+        main(platforms, args.deadline, args.daemon, args.shard, args.proxies)
+    )
@@ -0,0 +1,87 @@
+import socket
+import unittest
+
+import aiohttp
+
+from benchmarks.mock_site import MockConfig, MockProxy, MockSite
+from utils.limiter import HostLimit, RateLimiter
+from utils.proxy import NoProxyAvailable, ProxyPool
+
+
+def closed_port():
+    """
+    :return: 아무것도 듣고 있지 않은 로컬 port
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ProxyPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.site = await MockSite(MockConfig(boards=3)).start()
+        self.proxy = await MockProxy().start()
+        self.session = aiohttp.ClientSession()
+        self.dead = f"http://127.0.0.1:{closed_port()}"
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.proxy.close()
+        await self.site.close()
+
+    def pool(self, candidates, **kwargs):
+        return ProxyPool(
+            candidates, check_url=self.site.url + "/_mock/stats", **kwargs
+        )
+
+    async def test_validate(self):
+        pool = self.pool([self.proxy.url, self.dead])
+        self.assertEqual(await pool.validate(self.session), 1)
+        self.assertEqual(list(pool.healthy), [self.proxy.url])
+        self.assertEqual(self.proxy.forwarded, 1)
+
+    async def test_no_proxy_alive(self):
+        pool = self.pool([self.dead])
+        self.assertEqual(await pool.validate(self.session), 0)
+        with self.assertRaises(NoProxyAvailable):
+            pool.pick()
+
+    async def test_request_through_limiter(self):
+        pool = self.pool([self.proxy.url, self.dead], rate=100, burst=10)
+        await pool.validate(self.session)
+        limiter = RateLimiter(
+            limits={}, default=HostLimit(4, 100, 10), proxies=pool
+        )
+        url = self.site.url + "/sise/lastsearch2.naver"
+        async with limiter.request(self.session, "GET", url) as response:
+            html = await response.text()
+        self.assertIn("종목3", html)
+        self.assertEqual(self.proxy.forwarded, 2)
+        self.assertEqual(self.site.stats["naver_trend"], 1)
+        self.assertEqual(pool.healthy[self.proxy.url].requests, 2)
+
+    async def test_evict_failing_proxy(self):
+        # 확인 요청(/_mock/)은 통과하고 나머지는 모두 503
+        failing = await MockSite(MockConfig(error_rate=1.0)).start()
+        try:
+            pool = ProxyPool(
+                [self.proxy.url],
+                check_url=failing.url + "/_mock/stats",
+                rate=100,
+                burst=10,
+                max_failures=2,
+            )
+            await pool.validate(self.session)
+            url = failing.url + "/sise/lastsearch2.naver"
+            for _ in range(2):
+                async with pool.request(self.session, "GET", url) as response:
+                    self.assertEqual(response.status, 503)
+            self.assertEqual(len(pool), 0)
+            # 다시 확인하면 pool로 돌아온다
+            self.assertEqual(await pool.validate(self.session), 1)
+        finally:
+            await failing.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
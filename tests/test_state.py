@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from utils.frontier import HighWaterMarks
+from utils.state import FRESH, NEW, CrawlState
+
+
+class SharedStateTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "state.sqlite3")
+        self.state = CrawlState(self.path, shared=True)
+        # 다른 worker가 쓰기 잠금을 잡고 있는 것처럼 한다
+        self.other = sqlite3.connect(self.path, isolation_level=None)
+        self.other.execute("BEGIN IMMEDIATE")
+
+    def tearDown(self):
+        self.other.close()
+        self.dir.cleanup()
+
+    def count(self, table):
+        (n,) = self.other.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        return n
+
+    def test_locked_writes_wait_for_next_commit(self):
+        started = time.monotonic()
+        self.state.record_post("naver", "000001", 1, agree=10)
+        self.state.save_comment_mark("naver", "000001", 1, 7)
+        self.state.save_marks("naver", HighWaterMarks({"000001": 3}))
+        # 잠금을 오래 기다리지 않는다
+        self.assertLess(time.monotonic() - started, 1)
+        # commit하지 못한 기록도 바로 보인다
+        self.assertEqual(self.state.check("naver", "000001", 1), FRESH)
+        self.assertEqual(self.state.check("naver", "000001", 2), NEW)
+        self.assertEqual(self.state.comment_mark("naver", "000001", 1), 7)
+        marks = self.state.high_water_marks("naver").marks
+        self.assertEqual(marks, {"000001": 3})
+        self.assertEqual(self.count("posts"), 0)
+
+        self.other.execute("COMMIT")
+        self.state.record_post("naver", "000001", 2)
+        self.assertEqual(self.count("posts"), 2)
+        self.assertEqual(self.count("comments"), 1)
+        self.assertEqual(self.count("boards"), 1)
+        self.assertEqual(self.state.comment_mark("naver", "000001", 1), 7)
+        self.state.close()
+
+    def test_close_flushes(self):
+        self.state.record_post("naver", "000001", 1)
+        self.other.execute("COMMIT")
+        self.state.close()
+        self.assertEqual(self.count("posts"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from datetime import datetime
+
+from crawler.temp import parse_time
+
+
+class ParseTimeTest(unittest.TestCase):
+    def test_same_day(self):
+        now = datetime(2024, 5, 10, 15, 0)
+        self.assertEqual(
+            parse_time("12:34", now), datetime(2024, 5, 10, 12, 34)
+        )
+        # 서버 시계가 조금 빨라도 같은 날로 본다
+        self.assertEqual(
+            parse_time("15:20", now), datetime(2024, 5, 10, 15, 20)
+        )
+
+    def test_before_midnight(self):
+        now = datetime(2024, 5, 10, 0, 5)
+        self.assertEqual(
+            parse_time("23:58", now), datetime(2024, 5, 9, 23, 58)
+        )
+        self.assertEqual(parse_time("00:01", now), datetime(2024, 5, 10, 0, 1))
+        # 전날이 전년이어도 된다
+        self.assertEqual(
+            parse_time("23:58", datetime(2024, 1, 1, 0, 5)),
+            datetime(2023, 12, 31, 23, 58),
+        )
+
+    def test_date_this_year(self):
+        now = datetime(2024, 5, 10, 15, 0)
+        self.assertEqual(
+            parse_time("05.09 10:00", now), datetime(2024, 5, 9, 10, 0)
+        )
+        # 시간이 없으면 그날의 23:59:59
+        self.assertEqual(
+            parse_time("05.10", now), datetime(2024, 5, 10, 23, 59, 59)
+        )
+
+    def test_date_previous_year(self):
+        now = datetime(2024, 1, 2, 9, 0)
+        self.assertEqual(
+            parse_time("12.31 23:50", now), datetime(2023, 12, 31, 23, 50)
+        )
+        self.assertEqual(
+            parse_time("12.31", now), datetime(2023, 12, 31, 23, 59, 59)
+        )
+
+    def test_leap_day(self):
+        self.assertEqual(
+            parse_time("02.29 12:00", datetime(2024, 3, 1, 9, 0)),
+            datetime(2024, 2, 29, 12, 0),
+        )
+        # 평년 초에 받은 02.29는 작년(윤년) 것
+        self.assertEqual(
+            parse_time("02.29 12:00", datetime(2025, 1, 5, 9, 0)),
+            datetime(2024, 2, 29, 12, 0),
+        )
+        # 작년도 평년이면 있을 수 없는 날짜
+        with self.assertRaises(ValueError):
+            parse_time("02.29", datetime(2026, 1, 5, 9, 0))
+
+    def test_with_year(self):
+        now = datetime(2024, 5, 10, 15, 0)
+        self.assertEqual(
+            parse_time("2022.10.17 12:34:56", now),
+            datetime(2022, 10, 17, 12, 34, 56),
+        )
+        self.assertEqual(
+            parse_time("2022-10-17 12:34:56", now),
+            datetime(2022, 10, 17, 12, 34, 56),
+        )
+        self.assertEqual(
+            parse_time("22.10.17", now), datetime(2022, 10, 17, 23, 59, 59)
+        )
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            parse_time("어제", datetime(2024, 5, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
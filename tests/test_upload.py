@@ -0,0 +1,179 @@
+import collections
+import unittest
+
+import aiohttp
+
+from benchmarks import mock_site
+from benchmarks.pipeline import point_at
+from crawler import dcinside_async_v1, naver_finance_async, temp
+from db_manager import IlgaminatiSink
+from utils.limiter import HostLimit, RateLimiter
+from utils.parse_pool import ParsePool
+from utils.session import shared_session
+from utils.state import NEW, CrawlState
+
+# 이웃한 페이지끼리 겹치는 글 수
+OVERLAP = 5
+
+
+class ShiftingSite(mock_site.MockSite):
+    """
+    목록을 넘기는 사이에 새 글이 올라온 것처럼, 각 페이지 앞에
+    이전 페이지의 마지막 OVERLAP개 글이 다시 나오는 mock 서버
+    """
+
+    def _listing(self, page: int):
+        rows = super()._listing(page)
+        if rows and page > 1:
+            rows = super()._listing(page - 1)[-OVERLAP:] + rows
+        return rows
+
+
+class FailingSink(IlgaminatiSink):
+    """
+    fail에 있는 (board, post_id)의 글만 전송에 실패하는 sink
+    올라간 글은 서버로 보내지 않고 posts에 모으고 uploads에 센다.
+    """
+
+    def __init__(self, fail=()):
+        super().__init__(flush_interval=0.01, attempts=1)
+        self.fail = set(fail)
+        self.posts = []
+        self.uploads = collections.Counter()
+
+    async def _send(self, post):
+        key = (post.board, post.post_id)
+        if key in self.fail:
+            raise aiohttp.ClientConnectionError("refused")
+        self.posts.append(post)
+        self.uploads[key] += 1
+
+
+class MockCrawlTest(unittest.IsolatedAsyncioTestCase):
+    """
+    크롤러들을 site_class의 mock 서버로 돌리는 test의 바탕
+    """
+
+    site_class = mock_site.MockSite
+    config = mock_site.MockConfig(boards=2, pages=3, comments=1)
+    # state에서 이미 올린 글의 수치를 다시 기록하는 간격(초)
+    refresh_interval = 6 * 60 * 60
+
+    async def asyncSetUp(self):
+        self.urls = (
+            dcinside_async_v1.BASE_URL,
+            naver_finance_async.COMMENT_URL,
+            naver_finance_async.COMMENT_BASE_URL,
+            naver_finance_async.BASE_URL,
+            temp.MOBILE_URL,
+        )
+        self.site = await self.site_class(self.config).start()
+        point_at(self.site.url)
+        self.limiter = RateLimiter(
+            limits={}, default=HostLimit(32, 1e9, 10**9)
+        )
+        self.state = CrawlState(
+            ":memory:", refresh_interval=self.refresh_interval
+        )
+        self.parser = ParsePool(0)
+
+    async def asyncTearDown(self):
+        self.parser.close()
+        self.state.close()
+        await self.site.close()
+        (
+            dcinside_async_v1.BASE_URL,
+            naver_finance_async.COMMENT_URL,
+            naver_finance_async.COMMENT_BASE_URL,
+            naver_finance_async.BASE_URL,
+            temp.MOBILE_URL,
+        ) = self.urls
+
+    async def crawl(self, crawl, fail=()):
+        async with shared_session() as session, FailingSink(fail) as sink:
+            await crawl(
+                session, self.limiter, self.state, None, self.parser, sink
+            )
+        return sink
+
+
+class UploadTest(MockCrawlTest):
+    site_class = ShiftingSite
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        # 첫 페이지의 인기글 (게시판마다 글 번호가 같다)
+        self.hot = [
+            row.post_id
+            for row in self.site._listing(1)
+            if row.agree >= mock_site.HOT_AGREE
+        ]
+        # 두 페이지에 걸쳐 나오는 인기글
+        self.repeated = [
+            row.post_id
+            for row in self.site._listing(2)[:OVERLAP]
+            if row.agree >= mock_site.HOT_AGREE
+        ]
+
+    def check(self, platform, sink, failed):
+        board = failed[0]
+        self.assertTrue(self.repeated, "mock 목록에 겹치는 인기글이 없음")
+        self.assertGreater(len(sink.uploads), len(self.hot))
+        # 두 페이지에 나온 글도 한 번만 올라간다
+        self.assertEqual(set(sink.uploads.values()), {1})
+        for post_id in self.repeated:
+            self.assertEqual(sink.uploads[board, post_id], 1)
+        # 못 올린 글은 기록하지 않고, 그 게시판의 mark도 저장하지 않는다
+        self.assertNotIn(failed, sink.uploads)
+        self.assertEqual(self.state.check(platform, *failed), NEW)
+        marks = self.state.high_water_marks(platform).marks
+        self.assertNotIn(board, marks)
+        self.assertTrue(marks, "다른 게시판의 mark는 저장되어야 함")
+        for uploaded in sink.uploads:
+            self.assertNotEqual(self.state.check(platform, *uploaded), NEW)
+
+    async def test_naver(self):
+        failed = ("000001", self.hot[0])
+        sink = await self.crawl(naver_finance_async.crawl_naver, [failed])
+        self.check(naver_finance_async.PLATFORM, sink, failed)
+
+    async def test_dcinside(self):
+        failed = (dcinside_async_v1.GALLERIES[0], self.hot[0])
+        sink = await self.crawl(dcinside_async_v1.crawl_dcinside, [failed])
+        self.check(dcinside_async_v1.PLATFORM, sink, failed)
+
+
+class CommentRefreshTest(MockCrawlTest):
+    config = mock_site.MockConfig(boards=2, pages=2, comments=3)
+    # 실행할 때마다 이미 올린 글의 새 댓글을 확인한다
+    refresh_interval = 0
+
+    async def test_new_comments_only(self):
+        platform = naver_finance_async.PLATFORM
+        sink = await self.crawl(naver_finance_async.crawl_naver)
+        first = {(post.board, post.post_id): post for post in sink.posts}
+        self.assertTrue(first)
+        for post in first.values():
+            self.assertEqual(len(post.comments), 3)
+        marks = {key: self.state.comment_mark(platform, *key) for key in first}
+
+        # 다음 실행 전에 글마다 댓글이 두 개씩 더 달린다
+        self.site.config = self.site.config._replace(comments=5)
+        sink = await self.crawl(naver_finance_async.crawl_naver)
+        self.assertTrue(sink.posts)
+        for post in sink.posts:
+            key = (post.board, post.post_id)
+            numbers = [comment["commentNo"] for comment in post.comments]
+            self.assertEqual(len(numbers), 2)
+            self.assertGreater(min(numbers), marks[key])
+            self.assertEqual(
+                self.state.comment_mark(platform, *key), max(numbers)
+            )
+
+        # 새 댓글이 없으면 다시 올리지 않는다
+        sink = await self.crawl(naver_finance_async.crawl_naver)
+        self.assertEqual(sink.posts, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+import asyncio
+import itertools
+import logging
+from collections import Counter, namedtuple
+
+from utils.metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+FrontierItem = namedtuple("FrontierItem", "priority, seq, url, kind, meta")
+
+# stream()에서 worker들이 끝났음을 알리는 표시
+_DONE = object()
+
+
+class Frontier:
+    """
+    크롤링할 url을 priority 순으로 꺼내주는 queue와 worker pool.
+    handler(frontier, item)가 item을 처리하면서 새 url을 push()한다.
+    priority는 값이 작을수록 먼저 처리되며, 한 번 push된 url은 다시
+    들어가지 않는다.
+    """
+
+    def __init__(self, handler, workers: int = 8, name="frontier"):
+        """
+        :param handler: item 하나를 처리하는 async 함수 (frontier, item)
+        :param workers: 동시에 item을 처리할 worker 수
+        :param name: METRICS의 queue_depth에 붙일 이름
+        """
+        self.handler = handler
+        self.workers = workers
+        self.name = name
+        self.queue = asyncio.PriorityQueue()
+        self.seen = set()
+        self._seq = itertools.count()
+
+    def push(self, url: str, kind: str, priority: float = 0, **meta):
+        """
+        url을 queue에 넣는다.
+        :param url: 가져올 주소 (중복 제거 기준)
+        :param kind: handler가 구분할 item의 종류 ("page", "post" 등)
+        :param priority: 작을수록 먼저 처리
+        :param meta: handler에게 넘길 추가 정보
+        :return: 새로 들어갔으면 True, 이미 본 url이면 False
+        """
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        self.queue.put_nowait(
+            FrontierItem(priority, next(self._seq), url, kind, meta)
+        )
+        return True
+
+    async def _work(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                await self.handler(self, item)
+            except Exception as e:
+                log.warning("Failed to crawl %s: %r", item.url, e)
+            finally:
+                self.queue.task_done()
+
+    async def run(self):
+        """
+        queue가 빌 때까지 worker들을 돌린다.
+        """
+        gauge = METRICS.track("queue_depth", self.queue.qsize, queue=self.name)
+        workers = [
+            asyncio.create_task(self._work()) for _ in range(self.workers)
+        ]
+        try:
+            await self.queue.join()
+        finally:
+            METRICS.untrack(gauge)
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def stream(self, maxsize: int = 0):
+        """
+        run()처럼 worker들을 돌리면서 handler가 돌려준 값들을 나오는 대로
+        흘려보낸다. handler는 흘려보낼 값의 list(또는 None)를 돌려준다.
+        결과 queue가 maxsize만큼 차면 worker들이 자리가 날 때까지 멈춘다.
+        """
+        results = asyncio.Queue(maxsize)
+        handler = self.handler
+
+        async def collect(frontier, item):
+            for value in await handler(frontier, item) or ():
+                await results.put(value)
+
+        async def run():
+            try:
+                await self.run()
+            except Exception as e:
+                log.warning("Frontier stopped: %r", e)
+            await results.put(_DONE)
+
+        self.handler = collect
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                value = await results.get()
+                if value is _DONE:
+                    break
+                yield value
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            self.handler = handler
+
+
+class HighWaterMarks:
+    """
+    게시판 별로 지난 실행까지 본 가장 큰 글 번호(high-water mark).
+    목록 페이지가 이 번호 이하의 글에 닿으면 그 게시판은 더 넘기지 않는다.
+    이번 실행에서 새로 본 번호는 latest에 따로 모아서 다음 실행에 넘긴다.
+    목록 페이지나 인기글을 가져오지 못한 게시판은 fail()로 표시해서
+    mark를 올리지 않는다. (올리면 못 본 글들을 다음 실행에서 건너뛴다)
+    """
+
+    def __init__(self, marks: dict = None):
+        """
+        :param marks: {게시판: 지난 실행에서 본 가장 큰 글 번호}
+        """
+        self.marks = dict(marks or {})
+        self.latest = dict(self.marks)
+        # 게시판 별로 mark보다 큰 번호로 본 글 수
+        self.new = Counter()
+        # 이번 실행에서 페이지나 인기글을 가져오지 못한 게시판
+        self.failed = set()
+
+    def observe(self, board, post_ids: list):
+        """
+        목록 페이지에서 본 글 번호들을 기록한다.
+        :return: 지난 실행에서 본 글에 닿았으면 True (다음 페이지가 필요 없음)
+        """
+        if not post_ids:
+            return False
+        mark = self.marks.get(board, 0)
+        self.new[board] += sum(post_id > mark for post_id in post_ids)
+        self.latest[board] = max(self.latest.get(board, 0), *post_ids)
+        return min(post_ids) <= mark
+
+    def fail(self, board):
+        """
+        board의 목록 페이지나 인기글을 가져오지 못했을 때 부른다.
+        """
+        self.failed.add(board)
+
+    def completed(self):
+        """
+        :return: {게시판: 다음 실행에 넘길 mark}, 실패한 게시판은 빠진다
+        """
+        return {
+            board: post_id
+            for board, post_id in self.latest.items()
+            if board not in self.failed
+        }
+
+    def advance(self, board):
+        """
+        daemon mode에서 게시판 하나의 poll이 끝날 때 부른다.
+        이번에 본 가장 큰 번호를 mark로 올려서 다음 poll은 그 뒤의 글까지만
+        페이지를 넘기게 한다. 실패한 게시판은 mark를 그대로 둔다.
+        :return: mark 이후로 새로 본 글 수 (mark가 없던 게시판이면 None)
+        """
+        new = self.new.pop(board, 0)
+        known = board in self.marks
+        if board in self.failed:
+            # 다음 poll에서 같은 페이지들을 다시 보도록 mark를 그대로 둔다
+            self.failed.discard(board)
+            if known:
+                self.latest[board] = self.marks[board]
+            else:
+                self.latest.pop(board, None)
+        elif board in self.latest:
+            self.marks[board] = self.latest[board]
+        return new if known else None
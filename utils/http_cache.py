@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+import zlib
+
+log = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get("ILGAMINATI_CACHE", ".http_cache")
+# 캐시 전체 크기 제한(byte, 압축 후 기준)
+MAX_SIZE = 256 * 1024 * 1024
+# 이만큼 기록할 때마다 commit (shared면 매번)
+COMMIT_EVERY = 100
+# shared일 때 다른 프로세스의 쓰기 잠금을 기다리는 시간(초)
+# 이보다 오래 잡혀 있으면 event loop를 막지 않고 그 기록은 버린다
+SHARED_TIMEOUT = 0.1
+# url 패턴 별로 서버에 다시 묻지 않고 캐시를 그대로 쓰는 시간(초)
+TTL_OVERRIDES = [
+    (r"finance\.naver\.com/item/board\.naver", 60),
+    (r"finance\.naver\.com/item/board_read\.naver", 10 * 60),
+    (r"gall\.dcinside\.com/mgallery/board/lists", 60),
+    (r"gall\.dcinside\.com/mgallery/board/view", 10 * 60),
+    (r"m\.dcinside\.com/board/[^/?]+\?", 60),
+    (r"m\.dcinside\.com/board/[^/?]+/[0-9]+", 10 * 60),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    encoding TEXT NOT NULL,
+    stored_ts REAL NOT NULL,
+    accessed_ts REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_ts);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM entries;
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries
+BEGIN
+    UPDATE totals SET size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries
+BEGIN
+    UPDATE totals SET size = size - old.size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries
+BEGIN
+    UPDATE totals SET size = size - old.size;
+END;
+"""
+
+
+class CacheMiss(Exception):
+    pass
+
+
+def _write(path, body: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(zlib.compress(body))
+    os.replace(tmp, path)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return zlib.decompress(f.read())
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _locked(e: sqlite3.OperationalError):
+    """
+    :return: 다른 연결이 잠금을 잡고 있어서 난 에러면 True
+    """
+    return "locked" in str(e)
+
+
+class HTTPCache:
+    """
+    GET 응답 본문을 디스크에 압축해서 보관하는 캐시
+    ETag/Last-Modified가 있으면 조건부 요청을 보내고 304면 캐시를 쓴다.
+    TTL_OVERRIDES에 맞는 url은 그 시간 동안 요청 자체를 보내지 않는다.
+    크기가 max_size를 넘으면 가장 오래 안 쓴 것부터 지운다.
+    전체 크기는 index의 totals에 trigger로 기록되므로, 같은 캐시를 쓰는
+    프로세스들이 모두 같은 값을 본다.
+    index는 캐시일 뿐이므로 잠금 때문에 못 한 기록은 버린다.
+    offline=True면 네트워크 없이 캐시에 있는 것만 돌려준다. (크롤링 재현용)
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_DIR,
+        max_size: int = MAX_SIZE,
+        ttl_overrides: list = None,
+        offline: bool = False,
+        shared: bool = False,
+    ):
+        """
+        :param path: 캐시를 저장할 디렉토리
+        :param max_size: 캐시 전체 크기 제한(byte)
+        :param ttl_overrides: [(url 정규식, 초)], 없으면 TTL_OVERRIDES
+        :param offline: True면 요청을 보내지 않고 캐시만 사용
+        :param shared: 여러 프로세스가 같은 디렉토리를 쓸 때 True
+                       (WAL로 열고, 쓰기 잠금을 오래 잡지 않도록 매번
+                        commit하되 잠금은 SHARED_TIMEOUT까지만 기다린다)
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        self.offline = offline
+        self.ttl_overrides = [
+            (re.compile(pattern), ttl)
+            for pattern, ttl in (
+                TTL_OVERRIDES if ttl_overrides is None else ttl_overrides
+            )
+        ]
+        self.commit_every = 1 if shared else COMMIT_EVERY
+        self.conn = sqlite3.connect(
+            os.path.join(path, "index.sqlite3"),
+            timeout=SHARED_TIMEOUT if shared else 5,
+        )
+        if shared:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._pending = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *err):
+        self.close()
+
+    def _execute(self, sql: str, params):
+        """
+        index를 고친다. 잠금 때문에 못 하면 commit 전의 기록과 함께 버린다.
+        :return: 기록했으면 True
+        """
+        try:
+            self.conn.execute(sql, params)
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self.conn.commit()
+                self._pending = 0
+        except sqlite3.OperationalError as e:
+            if not _locked(e):
+                raise
+            self._dropped()
+            return False
+        return True
+
+    def _dropped(self):
+        self.conn.rollback()
+        log.debug(
+            "Cache index is locked, dropped %d writes", self._pending + 1
+        )
+        self._pending = 0
+
+    @property
+    def size(self):
+        """
+        캐시 전체 크기(byte, 압축 후 기준)
+        """
+        return self.conn.execute("SELECT size FROM totals").fetchone()[0]
+
+    def _ttl(self, url: str):
+        for pattern, ttl in self.ttl_overrides:
+            if pattern.search(url):
+                return ttl
+        return 0
+
+    def _file(self, key: str):
+        return os.path.join(self.path, key[:2], key + ".z")
+
+    def _lookup(self, key: str):
+        return self.conn.execute(
+            "SELECT etag, last_modified, encoding, stored_ts "
+            "FROM entries WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+    async def _load(self, key: str, encoding: str):
+        """
+        :return: 캐시된 본문, 파일이 없으면 None
+                 (다른 프로세스가 지웠으면 entry도 지운다)
+        """
+        try:
+            body = await asyncio.to_thread(_read, self._file(key))
+        except FileNotFoundError:
+            self._execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        self._execute(
+            "UPDATE entries SET accessed_ts = ? WHERE key = ?",
+            (time.time(), key),
+        )
+        return body.decode(encoding, errors="replace")
+
+    async def _store(self, key, url, response, body: bytes, encoding: str):
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        await asyncio.to_thread(_write, path, body)
+        size = os.path.getsize(path)
+        now = time.time()
+        try:
+            # REPLACE는 delete trigger를 부르지 않으므로 upsert로 totals를
+            # 맞춘다
+            self.conn.execute(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "url = excluded.url, etag = excluded.etag, "
+                "last_modified = excluded.last_modified, "
+                "encoding = excluded.encoding, "
+                "stored_ts = excluded.stored_ts, "
+                "accessed_ts = excluded.accessed_ts, size = excluded.size",
+                (
+                    key,
+                    url,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    encoding,
+                    now,
+                    now,
+                    size,
+                ),
+            )
+            total = self.size
+            evicted = self._evict(total) if total > self.max_size else []
+            self.conn.commit()
+        except sqlite3.OperationalError as e:
+            if not _locked(e):
+                raise
+            self._dropped()
+            # index에 없는 파일은 지운다 (전의 entry는 파일이 없으면 지워진다)
+            _remove(path)
+            return
+        self._pending = 0
+        # 파일은 commit한 뒤에 지워서, 잠금을 잡은 동안 디스크를 기다리지
+        # 않고 commit이 실패해도 entry만 남는 일이 없게 한다
+        for evicted_key in evicted:
+            _remove(self._file(evicted_key))
+
+    def _evict(self, total: int):
+        """
+        :param total: 지금 캐시 전체 크기
+        :return: index에서 지운 key들 (파일은 commit한 뒤에 지운다)
+        """
+        rows = self.conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_ts"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_size * 0.9:
+                break
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            evicted.append(key)
+            total -= size
+        return evicted
+
+    def invalidate(self, url: str):
+        """
+        url의 캐시를 지운다. (차단 페이지 등 잘못 받은 응답을 버릴 때)
+        """
+        key = hashlib.sha1(url.encode()).hexdigest()
+        # index에서 못 지워도 파일이 없으면 다음 _load()에서 지워진다
+        self._execute("DELETE FROM entries WHERE key = ?", (key,))
+        _remove(self._file(key))
+
+    async def get_text(self, session, url: str, limiter, headers=None, **kw):
+        """
+        url의 본문을 캐시를 거쳐서 가져온다.
+        :param session: 요청을 보낼 session
+        :param limiter: 요청을 보낼 때 거칠 RateLimiter
+        :return: 디코딩된 본문
+        :raise aiohttp.ClientResponseError: 다시 보내봐도 2xx나 304가 아닐 때
+        """
+        key = hashlib.sha1(url.encode()).hexdigest()
+        entry = self._lookup(key)
+        if entry is not None:
+            etag, last_modified, encoding, stored_ts = entry
+            if self.offline or time.time() - stored_ts < self._ttl(url):
+                text = await self._load(key, encoding)
+                if text is not None:
+                    return text
+                entry = None
+        if entry is None and self.offline:
+            raise CacheMiss(url)
+
+        conditional = dict(headers or {})
+        if entry is not None:
+            if etag:
+                conditional["If-None-Match"] = etag
+            if last_modified:
+                conditional["If-Modified-Since"] = last_modified
+
+        async with limiter.request(
+            session, "GET", url, headers=conditional, **kw
+        ) as response:
+            if response.status != 304 or entry is None:
+                body = await response.read()
+                encoding = response.get_encoding()
+                cacheable = response.status == 200 and (
+                    "ETag" in response.headers
+                    or "Last-Modified" in response.headers
+                    or self._ttl(url)
+                )
+                if cacheable:
+                    await self._store(key, url, response, body, encoding)
+                return body.decode(encoding, errors="replace")
+
+        self._execute(
+            "UPDATE entries SET stored_ts = ? WHERE key = ?",
+            (time.time(), key),
+        )
+        text = await self._load(key, encoding)
+        if text is None:
+            # 304를 받는 사이에 다른 프로세스가 파일을 지웠으면 새로 받는다
+            return await self.get_text(session, url, limiter, headers, **kw)
+        return text
+
+
+async def fetch_text(session, url: str, limiter, cache=None, **kwargs):
+    """
+    url의 본문을 가져온다. cache가 있으면 캐시를 거친다.
+    에러 응답(4xx/5xx)의 본문은 파서로 넘기지 않고 limiter가 예외를 낸다.
+    """
+    if cache is not None:
+        return await cache.get_text(session, url, limiter, **kwargs)
+    async with limiter.request(session, "GET", url, **kwargs) as response:
+        return await response.text()
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import os
+import uuid
+
+import filetype
+
+IMAGE_DIR = os.environ.get("ILGAMINATI_IMAGES", "images")
+# 한 번에 읽어서 쓰는 크기(byte)
+CHUNK_SIZE = 64 * 1024
+# 파일 형식을 알아내는 데 필요한 앞부분 크기(byte)
+SNIFF_SIZE = 261
+# 동시에 받을 이미지 수
+DOWNLOAD_CONCURRENCY = 8
+
+
+def sniff_extension(head: bytes):
+    """
+    본문 앞부분으로 확장자를 알아낸다. 모르는 형식이면 "bin"
+    """
+    kind = filetype.guess(head)
+    return kind.extension if kind is not None else "bin"
+
+
+async def write_stream(response, path: str):
+    """
+    응답 본문을 chunk 단위로 path에 쓴다.
+    본문 전체를 메모리에 올리지 않고, 파일 쓰기는 thread에서 한다.
+    :return: (본문의 sha256 hex, 본문 앞 SNIFF_SIZE byte)
+    """
+    digest = hashlib.sha256()
+    head = b""
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            if len(head) < SNIFF_SIZE:
+                head += chunk[: SNIFF_SIZE - len(head)]
+            digest.update(chunk)
+            await asyncio.to_thread(f.write, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+    return digest.hexdigest(), head
+
+
+class ImageStore:
+    """
+    이미지를 내용의 sha256으로 이름 붙여 저장하는 저장소
+    여러 갤러리에 다시 올라온 같은 이미지는 한 번만 저장된다.
+    동시에 받는 이미지 수는 concurrency로 제한한다.
+    """
+
+    def __init__(
+        self,
+        path: str = IMAGE_DIR,
+        concurrency: int = DOWNLOAD_CONCURRENCY,
+    ):
+        """
+        :param path: 이미지를 저장할 디렉토리
+        :param concurrency: 동시에 받을 이미지 수
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stored = 0
+        self.duplicates = 0
+
+    def _file(self, digest: str, ext: str):
+        return os.path.join(self.path, digest[:2], digest + "." + ext)
+
+    async def download(self, session, limiter, url: str, **kwargs):
+        """
+        url의 이미지를 받아서 저장한다.
+        :param limiter: 요청을 보낼 때 거칠 RateLimiter
+        :return: 저장된 파일 경로 (이미 있던 이미지면 기존 경로)
+        """
+        tmp = os.path.join(self.path, uuid.uuid4().hex + ".part")
+        try:
+            async with self.semaphore:
+                async with limiter.request(
+                    session, "GET", url, **kwargs
+                ) as response:
+                    response.raise_for_status()
+                    digest, head = await write_stream(response, tmp)
+            path = self._file(digest, sniff_extension(head))
+            if os.path.exists(path):
+                self.duplicates += 1
+                return path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+            self.stored += 1
+            return path
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
@@ -0,0 +1,184 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from utils.metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+HostLimit = namedtuple("HostLimit", "concurrency, rate, burst")
+
+# host 별 동시 요청 수와 초당 요청 수. 차단당하지 않는 선에서 조정할 것.
+HOST_LIMITS = {
+    "finance.naver.com": HostLimit(concurrency=8, rate=10.0, burst=10),
+    "apis.naver.com": HostLimit(concurrency=4, rate=5.0, burst=5),
+    "gall.dcinside.com": HostLimit(concurrency=4, rate=2.0, burst=4),
+    "m.dcinside.com": HostLimit(concurrency=4, rate=3.0, burst=6),
+}
+DEFAULT_LIMIT = HostLimit(concurrency=4, rate=5.0, burst=5)
+
+# 429 응답에 Retry-After가 없을 때 host를 쉬게 할 시간(초)
+THROTTLE_BACKOFF = 60
+# 다시 보내볼 응답 코드 (429는 host를 쉬게 한 뒤, 5xx는 잠시 기다린 뒤)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# 429/5xx 응답을 받으면 다시 보내는 method
+# (POST 등은 서버에 이미 반영됐을 수 있으므로 요청마다 retry=True로 허락한다)
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# 요청 하나를 보내보는 최대 횟수
+MAX_ATTEMPTS = 4
+# 5xx 응답 뒤 다시 보내기까지 기다리는 시간(초), 시도할 때마다 두 배
+RETRY_BACKOFF = 1.0
+
+
+class TokenBucket:
+    """
+    초당 rate개의 토큰이 채워지고 최대 burst개까지 쌓이는 token bucket.
+    take()는 토큰이 생길 때까지 기다린다.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """
+        seconds 동안 토큰을 내주지 않는다. (429 응답을 받았을 때)
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def take(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate,
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    host 별 semaphore와 token bucket으로 크롤러의 모든 요청을 조절한다.
+    """
+
+    def __init__(
+        self,
+        limits: dict = None,
+        default: HostLimit = None,
+        proxies=None,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        """
+        :param limits: {host: HostLimit}, 없으면 HOST_LIMITS 사용
+        :param default: limits에 없는 host에 적용할 HostLimit
+        :param proxies: 요청을 proxy로 나눠 보낼 ProxyPool (없으면 직접 요청)
+        :param max_attempts: 429/5xx 응답을 받았을 때 요청 하나를
+                             보내보는 최대 횟수 (처음 보낸 것 포함)
+        """
+        self.limits = dict(HOST_LIMITS if limits is None else limits)
+        self.default = default or DEFAULT_LIMIT
+        self.proxies = proxies
+        self.max_attempts = max(1, max_attempts)
+        self._hosts = {}
+
+    def _host(self, host: str):
+        if host not in self._hosts:
+            limit = self.limits.get(host, self.default)
+            self._hosts[host] = (
+                asyncio.Semaphore(limit.concurrency),
+                TokenBucket(limit.rate, limit.burst),
+            )
+        return self._hosts[host]
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, url: str):
+        """
+        url의 host에 요청을 보낼 차례가 될 때까지 기다린다.
+        """
+        semaphore, bucket = self._host(urlsplit(url).hostname)
+        async with semaphore:
+            await bucket.take()
+            yield bucket
+
+    @contextlib.asynccontextmanager
+    async def request(
+        self, session, method: str, url: str, retry: bool = None, **kwargs
+    ):
+        """
+        session.request()를 limiter를 거쳐서 보낸다.
+        proxies가 있으면 pool에서 고른 proxy를 거친다.
+        429 응답을 받으면 그 host의 요청을 잠시 멈추고, 429/5xx 응답은
+        max_attempts번까지 다시 보낸다. 마지막 응답도 2xx(나 304)가 아니면
+        본문을 넘기지 않고 aiohttp.ClientResponseError를 낸다.
+        :param retry: 429/5xx 응답을 다시 보낼지 여부
+                      (None이면 IDEMPOTENT_METHODS일 때만)
+        """
+        if retry is None:
+            retry = method.upper() in IDEMPOTENT_METHODS
+        attempts = self.max_attempts if retry else 1
+        for attempt in range(1, attempts + 1):
+            delay = 0
+            async with self.acquire(url) as bucket:
+                if self.proxies is None:
+                    request = session.request(method, url, **kwargs)
+                else:
+                    request = self.proxies.request(
+                        session, method, url, **kwargs
+                    )
+                async with request as response:
+                    status = response.status
+                    if status == 429:
+                        retry_after = response.headers.get("Retry-After", "")
+                        bucket.pause(
+                            int(retry_after)
+                            if retry_after.isdigit()
+                            else THROTTLE_BACKOFF
+                        )
+                    elif status in RETRY_STATUSES:
+                        delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+                    if status not in RETRY_STATUSES or attempt == attempts:
+                        _check_status(response)
+                        yield response
+                        return
+            log.debug(
+                "Retrying %s after %d (attempt %d)", url, status, attempt
+            )
+            METRICS.inc(
+                "http_retries_total",
+                host=urlsplit(url).hostname,
+                status=status,
+            )
+            # host는 쉬게 했으므로 429면 바로 다시 줄을 선다
+            await asyncio.sleep(delay)
+
+
+def _check_status(response):
+    """
+    2xx나 304(캐시 사용)가 아닌 응답이면 ClientResponseError를 낸다.
+    """
+    if 200 <= response.status < 300 or response.status == 304:
+        return
+    raise aiohttp.ClientResponseError(
+        response.request_info,
+        response.history,
+        status=response.status,
+        message=response.reason or "",
+        headers=response.headers,
+    )
@@ -0,0 +1,287 @@
+import asyncio
+import bisect
+import collections
+import contextlib
+import json
+import logging
+import os
+import time
+
+import aiohttp
+
+log = logging.getLogger(__name__)
+
+# latency histogram의 bucket 경계(초)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Prometheus text를 내보낼 port (0이면 띄우지 않음)
+METRICS_PORT = int(os.environ.get("ILGAMINATI_METRICS_PORT", 0))
+# 주기적으로 JSON을 쓸 파일 (없으면 쓰지 않음)
+METRICS_FILE = os.environ.get("ILGAMINATI_METRICS_FILE")
+# JSON을 쓰는 간격(초)
+DUMP_INTERVAL = 10
+
+
+class Histogram:
+    """
+    Prometheus 형식의 누적 bucket histogram
+    """
+
+    __slots__ = ["buckets", "counts", "count", "sum"]
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # 마지막 칸은 +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        :return: (경계, 그 이하인 값의 수)의 list, 마지막 경계는 "+Inf"
+        """
+        total = 0
+        result = []
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    items = [*labels, *extra]
+    if not items:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Metrics:
+    """
+    counter, histogram, gauge를 모아두는 registry
+    값은 메모리에만 쌓이고, render()로 Prometheus text를,
+    snapshot()으로 JSON에 쓸 dict를 만든다.
+    gauge는 값 대신 함수를 등록해두고 내보낼 때 호출한다. (queue 길이 등)
+    """
+
+    def __init__(self):
+        self.counters = collections.defaultdict(float)
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.counters[_key(name, labels)] += value
+
+    def observe(
+        self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels
+    ):
+        key = _key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """
+        블록이 걸린 시간(초)을 name histogram에 기록한다.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def track(self, name: str, func, **labels):
+        """
+        내보낼 때마다 func()을 불러서 gauge 값으로 쓴다.
+        :return: untrack()에 넘길 key
+        """
+        key = _key(name, labels)
+        self.gauges[key] = func
+        return key, func
+
+    def untrack(self, handle):
+        key, func = handle
+        if self.gauges.get(key) is func:
+            del self.gauges[key]
+
+    def _series(self):
+        """
+        :return: {이름: (종류, [(labels, 값)])}
+        """
+        series = {}
+        for (name, labels), value in self.counters.items():
+            series.setdefault(name, ("counter", []))[1].append((labels, value))
+        for (name, labels), func in list(self.gauges.items()):
+            series.setdefault(name, ("gauge", []))[1].append((labels, func()))
+        for (name, labels), histogram in self.histograms.items():
+            series.setdefault(name, ("histogram", []))[1].append(
+                (labels, histogram)
+            )
+        return series
+
+    def render(self):
+        """
+        Prometheus text exposition 형식
+        """
+        lines = []
+        for name, (kind, samples) in sorted(self._series().items()):
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                for bound, count in value.cumulative():
+                    le = _format_labels(labels, [("le", bound)])
+                    lines.append(f"{name}_bucket{le} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {value.sum}")
+                lines.append(
+                    f"{name}_count{_format_labels(labels)} {value.count}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        JSON으로 쓸 수 있는 dict
+        histogram은 count, sum과 누적 bucket만 담는다.
+        """
+        result = {}
+        for name, (kind, samples) in sorted(self._series().items()):
+            entries = []
+            for labels, value in samples:
+                entry = {"labels": dict(labels)}
+                if kind == "histogram":
+                    entry["count"] = value.count
+                    entry["sum"] = value.sum
+                    entry["buckets"] = {
+                        str(bound): count
+                        for bound, count in value.cumulative()
+                    }
+                else:
+                    entry["value"] = value
+                entries.append(entry)
+            result[name] = {"type": kind, "samples": entries}
+        return result
+
+    def trace_config(self):
+        """
+        session의 요청마다 host 별 요청 수, latency, 주고받은 byte,
+        에러를 기록하는 aiohttp TraceConfig
+        latency는 응답 header를 받을 때까지의 시간이다.
+        """
+
+        async def on_start(session, context, params):
+            context.host = params.url.host
+            context.start = time.perf_counter()
+
+        async def on_end(session, context, params):
+            self.inc(
+                "http_requests_total",
+                host=context.host,
+                status=params.response.status,
+            )
+            self.observe(
+                "http_request_seconds",
+                time.perf_counter() - context.start,
+                host=context.host,
+            )
+
+        async def on_exception(session, context, params):
+            self.inc(
+                "http_request_errors_total",
+                host=context.host,
+                error=type(params.exception).__name__,
+            )
+
+        async def on_sent(session, context, params):
+            self.inc(
+                "http_request_bytes_total",
+                len(params.chunk),
+                host=context.host,
+            )
+
+        async def on_received(session, context, params):
+            self.inc(
+                "http_response_bytes_total",
+                len(params.chunk),
+                host=context.host,
+            )
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_start)
+        trace.on_request_end.append(on_end)
+        trace.on_request_exception.append(on_exception)
+        trace.on_request_chunk_sent.append(on_sent)
+        trace.on_response_chunk_received.append(on_received)
+        return trace
+
+    async def serve(self, host: str = "0.0.0.0", port: int = METRICS_PORT):
+        """
+        GET /metrics로 Prometheus text를 내보내는 서버를 띄운다.
+        :return: 정리할 때 cleanup()을 불러야 하는 AppRunner
+        """
+        # aiohttp.web은 서버를 띄울 때만 필요하다
+        from aiohttp import web
+
+        async def handler(request):
+            return web.Response(
+                text=self.render(), content_type="text/plain", charset="utf-8"
+            )
+
+        app = web.Application()
+        app.router.add_get("/metrics", handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        log.info("Serving metrics on http://%s:%d/metrics", host, port)
+        return runner
+
+    def dump(self, path: str):
+        """
+        snapshot()을 path에 JSON으로 쓴다. (쓰는 도중에 읽혀도 깨지지 않게
+        임시 파일에 쓴 뒤 바꿔치기)
+        """
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {"time": time.time(), "metrics": self.snapshot()}, f, indent=1
+            )
+        os.replace(tmp, path)
+
+    async def dump_every(self, path: str, interval: float = DUMP_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            self.dump(path)
+
+    @contextlib.asynccontextmanager
+    async def exporting(self, port: int = METRICS_PORT, path=METRICS_FILE):
+        """
+        블록 동안 port로 /metrics를 내보내고 path에 주기적으로 JSON을 쓴다.
+        블록이 끝나면 마지막 값을 한 번 더 쓴다.
+        """
+        runner = await self.serve(port=port) if port else None
+        task = asyncio.create_task(self.dump_every(path)) if path else None
+        try:
+            yield self
+        finally:
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                self.dump(path)
+            if runner is not None:
+                await runner.cleanup()
+
+
+# 크롤러 전체가 함께 쓰는 registry
+METRICS = Metrics()
@@ -0,0 +1,84 @@
+import asyncio
+import os
+from concurrent import futures
+
+from utils.metrics import METRICS
+
+# html 파싱에 쓸 worker 수. 0이면 event loop에서 바로 파싱한다.
+PARSE_WORKERS = int(
+    os.environ.get("ILGAMINATI_PARSE_WORKERS", os.cpu_count() or 1)
+)
+
+# process worker를 띄우는 방법. worker는 첫 파싱 때 만들어지는데, 그때는
+# 이미 resolver 등의 thread가 있어서 fork하면 deadlock이 날 수 있다.
+START_METHOD = "forkserver" if os.name == "posix" else "spawn"
+
+
+class ParseError(ValueError):
+    """
+    파서가 실패했을 때 낸다. worker의 예외는 lxml의 것처럼 pickle이
+    안 될 수 있어서, 파서 이름과 원래 예외를 메시지로만 담는다.
+    """
+
+
+def _call(func, *args):
+    """
+    worker에서 func(*args)를 실행한다. 예외는 ParseError로 바꿔서 낸다.
+    """
+    try:
+        return func(*args)
+    except Exception as e:
+        raise ParseError(f"{func.__name__}: {type(e).__name__}: {e}") from None
+
+
+class ParsePool:
+    """
+    html 파싱을 event loop 밖의 worker에서 돌린다.
+    큰 페이지 하나를 파싱하는 동안 다른 요청들이 멈추지 않도록 하기 위함.
+    process worker에 넘기는 함수는 module 최상위 함수여야 하고
+    결과도 pickle 가능한 값(namedtuple, dict 등)이어야 한다.
+    """
+
+    def __init__(self, workers: int = PARSE_WORKERS, processes: bool = True):
+        """
+        :param workers: worker 수, 0이면 worker 없이 바로 파싱
+        :param processes: False면 process 대신 thread를 쓴다
+                          (lxml은 파싱 중에 GIL을 놓는다)
+        """
+        self.workers = workers
+        if workers <= 0:
+            self.executor = None
+        elif processes:
+            # multiprocessing은 process worker를 쓸 때만 import한다
+            import multiprocessing
+
+            self.executor = futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context(START_METHOD)
+            )
+        else:
+            self.executor = futures.ThreadPoolExecutor(workers)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *err):
+        self.close()
+
+    async def parse(self, func, *args):
+        """
+        func(*args)를 worker에서 실행하고 결과를 기다린다.
+        걸린 시간은 파서 별로 METRICS의 parse_seconds에 기록된다.
+        :raise ParseError: func가 예외를 냈을 때
+        """
+        with METRICS.timer("parse_seconds", parser=func.__name__):
+            if self.executor is None:
+                return _call(func, *args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, _call, func, *args
+            )
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+from utils.metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+# stage가 끝났음을 다음 쪽에 알리는 표시
+_DONE = object()
+
+
+async def _close(source):
+    """
+    source가 async generator면 닫아서 그 안의 정리(finally)를 바로 돌린다.
+    도중에 멈춘 generator를 그냥 두면 event loop가 끝날 때에야 정리된다.
+    """
+    aclose = getattr(source, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def select(source, predicate):
+    """
+    source에서 predicate(item)이 참인 item만 흘려보낸다.
+    """
+    try:
+        async for item in source:
+            if predicate(item):
+                yield item
+    finally:
+        await _close(source)
+
+
+async def stage(
+    source, func, workers: int = 4, maxsize: int = None, name="stage"
+):
+    """
+    source의 item마다 func(item)을 최대 workers개 동시에 실행하고
+    결과를 끝나는 대로 흘려보낸다.
+    func는 coroutine이나 async generator를 돌려주는 함수로,
+    coroutine의 결과가 None이면 버리고 async generator면 나오는 값을
+    하나씩 흘려보낸다. func에서 난 예외는 출력하고 다음 item으로 넘어간다.
+    stage 앞뒤의 queue는 maxsize로 제한되므로 뒤쪽이 밀리면 앞쪽도 멈춘다.
+    :param source: item을 내주는 async iterable
+    :param func: item 하나를 처리하는 함수
+    :param workers: 동시에 처리할 item 수
+    :param maxsize: stage 앞뒤 queue의 크기 (없으면 workers * 2)
+    :param name: METRICS의 queue_depth에 붙일 이름
+    """
+    maxsize = maxsize or workers * 2
+    inbox = asyncio.Queue(maxsize)
+    outbox = asyncio.Queue(maxsize)
+
+    async def feed():
+        try:
+            async for item in source:
+                await inbox.put(item)
+        except Exception as e:
+            log.warning("Pipeline source failed: %r", e)
+        for _ in range(workers):
+            await inbox.put(_DONE)
+
+    async def work():
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                await outbox.put(_DONE)
+                return
+            try:
+                result = func(item)
+                if hasattr(result, "__aiter__"):
+                    async for value in result:
+                        await outbox.put(value)
+                else:
+                    value = await result
+                    if value is not None:
+                        await outbox.put(value)
+            except Exception as e:
+                log.warning("Pipeline stage failed on %r: %r", item, e)
+
+    gauges = [
+        METRICS.track("queue_depth", inbox.qsize, queue=name + ".in"),
+        METRICS.track("queue_depth", outbox.qsize, queue=name + ".out"),
+    ]
+    tasks = [asyncio.create_task(feed())]
+    tasks += [asyncio.create_task(work()) for _ in range(workers)]
+    try:
+        running = workers
+        while running:
+            value = await outbox.get()
+            if value is _DONE:
+                running -= 1
+            else:
+                yield value
+    finally:
+        for gauge in gauges:
+            METRICS.untrack(gauge)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await _close(source)
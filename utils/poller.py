@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import random
+import time
+
+from utils.metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+# 게시판 하나를 다시 보기까지의 최소/최대 간격(초)
+# 목록 페이지의 캐시 TTL(http_cache.TTL_OVERRIDES, 60초)보다 짧으면
+# 같은 목록을 캐시에서 다시 읽게 된다.
+MIN_INTERVAL = 60
+MAX_INTERVAL = 30 * 60
+# poll 한 번에 새 글이 이만큼 쌓여 있도록 간격을 맞춘다
+TARGET_NEW_POSTS = 10
+# 새 글이 없을 때 간격을 늘리는 배수
+BACKOFF = 2
+# 글 속도 이동평균에서 새 값의 비중
+RATE_WEIGHT = 0.3
+
+
+class AdaptiveInterval:
+    """
+    게시판 하나의 poll 간격
+    poll마다 새로 올라온 글 수로 글이 올라오는 속도(이동평균)를 구하고,
+    다음 poll까지 target개쯤 쌓이도록 간격을 정한다.
+    새 글이 없으면 간격을 BACKOFF배씩 늘린다.
+    """
+
+    __slots__ = [
+        "min_interval",
+        "max_interval",
+        "target",
+        "rate",
+        "interval",
+        "polled",
+    ]
+
+    def __init__(
+        self,
+        min_interval: float = MIN_INTERVAL,
+        max_interval: float = MAX_INTERVAL,
+        target: float = TARGET_NEW_POSTS,
+    ):
+        """
+        :param min_interval: 가장 짧은 간격(초)
+        :param max_interval: 가장 긴 간격(초)
+        :param target: poll 한 번에 쌓여 있을 새 글 수
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target = target
+        # 초당 새 글 수, 아직 모르면 None
+        self.rate = None
+        self.interval = min_interval
+        self.polled = None
+
+    def update(self, new_posts: int = None):
+        """
+        poll이 하나 끝날 때마다 부른다.
+        :param new_posts: 지난 poll 이후 새로 올라온 글 수 (모르면 None)
+        :return: 다음 poll까지 기다릴 시간(초)
+        """
+        now = time.monotonic()
+        if new_posts is not None and self.polled is not None:
+            rate = new_posts / max(now - self.polled, 1e-3)
+            if self.rate is None:
+                self.rate = rate
+            else:
+                self.rate += RATE_WEIGHT * (rate - self.rate)
+            if new_posts == 0 or not self.rate:
+                interval = self.interval * BACKOFF
+            else:
+                interval = self.target / self.rate
+            self.interval = min(
+                self.max_interval, max(self.min_interval, interval)
+            )
+        self.polled = now
+        return self.interval
+
+
+class Poller:
+    """
+    게시판마다 따로 정해진 간격으로 poll(board)를 계속 부른다.
+    poll(board)는 지난 poll 이후 새로 올라온 글 수(모르면 None)를 돌려주는
+    async 함수이고, 그 수에 맞춰 게시판 별 간격이 조절된다.
+    """
+
+    def __init__(
+        self,
+        poll,
+        name: str = "poller",
+        min_interval: float = MIN_INTERVAL,
+        max_interval: float = MAX_INTERVAL,
+        target: float = TARGET_NEW_POSTS,
+        owns=None,
+    ):
+        """
+        :param poll: 게시판 하나를 확인하는 async 함수 (board) -> 새 글 수
+        :param name: 로그와 METRICS에 붙일 이름
+        :param min_interval: 가장 짧은 간격(초)
+        :param max_interval: 가장 긴 간격(초)
+        :param target: poll 한 번에 쌓여 있을 새 글 수
+        :param owns: (board) -> 이 worker가 맡고 있는지, False면 건너뛴다
+                     (shard mode, 없으면 모든 게시판을 확인)
+        """
+        self.poll = poll
+        self.owns = owns
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target = target
+        self.intervals = {}
+        self.tasks = {}
+
+    async def watch(self, board):
+        """
+        board 하나를 취소될 때까지 반복해서 확인한다.
+        """
+        interval = self.intervals[board] = AdaptiveInterval(
+            self.min_interval, self.max_interval, self.target
+        )
+        # 게시판들이 한꺼번에 몰리지 않도록 첫 poll을 흩어둔다
+        await asyncio.sleep(random.uniform(0, self.min_interval))
+        while True:
+            if self.owns is not None and not self.owns(board):
+                # 다른 worker가 맡은 게시판은 넘겼다가 나중에 다시 본다
+                await asyncio.sleep(self.min_interval)
+                continue
+            try:
+                new_posts = await self.poll(board)
+            except Exception as e:
+                log.warning("%s: failed to poll %s: %r", self.name, board, e)
+                METRICS.inc("poll_errors_total", poller=self.name)
+                new_posts = None
+            METRICS.inc("polls_total", poller=self.name)
+            delay = interval.update(new_posts)
+            log.debug(
+                "%s: %s new posts in %s, next poll in %.0fs",
+                self.name,
+                new_posts,
+                board,
+                delay,
+            )
+            await asyncio.sleep(delay)
+
+    def update(self, boards):
+        """
+        확인할 게시판들을 바꾼다. 빠진 게시판은 멈추고 새 게시판은 시작한다.
+        """
+        boards = list(dict.fromkeys(boards))
+        for board in set(self.tasks) - set(boards):
+            self.tasks.pop(board).cancel()
+            self.intervals.pop(board, None)
+        for board in boards:
+            if board not in self.tasks:
+                self.tasks[board] = asyncio.create_task(self.watch(board))
+
+    async def run(self, boards=()):
+        """
+        boards(와 update()로 바꾼 게시판들)를 각자의 간격으로 취소될 때까지
+        확인한다.
+        """
+        self.update(boards)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            tasks = list(self.tasks.values())
+            self.tasks.clear()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
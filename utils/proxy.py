@@ -1,51 +1,229 @@
-from http_request_randomizer.requests.proxy.requestProxy import RequestProxy
-from fake_headers import Headers
-import requests
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import time
 
-class RANDOM_PROXY:
-    def __init__(self):
-        self.proxies = 
+import aiohttp
 
+from utils.limiter import TokenBucket
 
-    def proxy_create(self):
+log = logging.getLogger(__name__)
+
+# proxy가 동작하는지 확인할 때 요청할 주소 (테스트에서는 로컬 서버로 바꾼다)
+CHECK_URL = os.environ.get(
+    "ILGAMINATI_PROXY_CHECK_URL", "http://ipv4.icanhazip.com"
+)
+# 확인 요청 하나의 제한 시간(초)과 동시에 확인할 proxy 수
+CHECK_TIMEOUT = 10
+CHECK_CONCURRENCY = 32
+# proxy 하나로 보낼 초당 요청 수
+PROXY_RATE = 1.0
+PROXY_BURST = 2
+# 연속으로 이만큼 실패한 proxy는 pool에서 뺀다
+MAX_FAILURES = 3
+# latency 이동평균에서 새 값의 비중
+LATENCY_WEIGHT = 0.3
+# 에러율이 score(latency)에 주는 가중치
+ERROR_PENALTY = 10
+# pool에서 빠졌거나 처음에 동작하지 않던 후보를 다시 확인하는 간격(초)
+REVALIDATE_INTERVAL = 5 * 60
+# proxy로 보낸 요청이 실패한 것으로 보는 응답 코드
+RETRY_STATUSES = {403, 407, 429, 502, 503, 504}
+
+
+class NoProxyAvailable(Exception):
+    pass
+
+
+class Proxy:
+    """
+    proxy 하나의 상태
+    latency의 이동평균과 에러율로 score를 매기며, 낮을수록 좋다.
+    """
+
+    __slots__ = ["url", "latency", "requests", "errors", "failures", "bucket"]
+
+    def __init__(self, url: str, rate: float, burst: int):
+        self.url = url
+        self.latency = None
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0
+        self.bucket = TokenBucket(rate, burst)
+
+    @property
+    def score(self):
+        error_rate = self.errors / self.requests if self.requests else 0
+        return (self.latency or CHECK_TIMEOUT) * (
+            1 + error_rate * ERROR_PENALTY
+        )
+
+    def record(self, latency: float = None, error: bool = False):
+        self.requests += 1
+        if error:
+            self.errors += 1
+            self.failures += 1
+            return
+        self.failures = 0
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_WEIGHT * (latency - self.latency)
+
+    def __repr__(self):
+        return f"Proxy({self.url!r}, score={self.score:.3f})"
+
+
+def parse_candidates(value: str):
+    """
+    :param value: 쉼표로 구분한 proxy 주소들
+    :return: 주소의 list
+    """
+    return [url.strip() for url in value.split(",") if url.strip()]
+
+
+def candidates_from_env():
+    """
+    ILGAMINATI_PROXIES에 쉼표로 적힌 proxy 주소들
+    """
+    return parse_candidates(os.environ.get("ILGAMINATI_PROXIES", ""))
+
+
+def candidates_from_randomizer():
+    """
+    http_request_randomizer가 모아주는 공개 proxy 목록
+    (설치되어 있을 때만 사용)
+    """
+    from http_request_randomizer.requests.proxy.requestProxy import (
+        RequestProxy,
+    )
+
+    return [
+        "http://" + proxy.get_address()
+        for proxy in RequestProxy().get_proxy_list()
+    ]
+
+
+class ProxyPool:
+    """
+    동작하는 proxy들을 모아두고 요청마다 하나씩 골라주는 pool
+    후보들은 validate()에서 동시에 확인하고, 요청 결과로 score를 갱신한다.
+    연속으로 실패한 proxy는 빠지고 다음 validate()에서 다시 확인된다.
+    """
+
+    def __init__(
+        self,
+        candidates=(),
+        check_url: str = CHECK_URL,
+        rate: float = PROXY_RATE,
+        burst: int = PROXY_BURST,
+        max_failures: int = MAX_FAILURES,
+    ):
         """
-        무작위로 프록시를 생성해서 가져오는 코드
+        :param candidates: 확인할 proxy 주소들 ("http://host:port")
+        :param check_url: proxy가 동작하는지 확인할 때 요청할 주소
+        :param rate: proxy 하나로 보낼 초당 요청 수
+        :param burst: proxy 하나로 몰아서 보낼 수 있는 요청 수
+        :param max_failures: 연속으로 이만큼 실패하면 pool에서 뺀다
         """
-        self.req_proxy = RequestProxy()
-        proxy = self.test_proxy() # 잘 작동되는 프록시 선별
+        self.candidates = list(dict.fromkeys(candidates))
+        self.check_url = check_url
+        self.rate = rate
+        self.burst = burst
+        self.max_failures = max_failures
+        self.healthy = {}
+
+    def __len__(self):
+        return len(self.healthy)
+
+    async def _check(self, session, url: str):
+        proxy = Proxy(url, self.rate, self.burst)
+        start = time.monotonic()
+        try:
+            async with session.get(
+                self.check_url,
+                proxy=url,
+                timeout=aiohttp.ClientTimeout(total=CHECK_TIMEOUT),
+            ) as response:
+                await response.read()
+                if response.status != 200:
+                    return None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+        proxy.record(time.monotonic() - start)
         return proxy
 
-    def test_proxy(self):
-    	"""
-        가져온 프록시중에서 실제로 작동되는 프록시만 하나씩 가져오는 코드
-        test_url : 자신의 IP를 확인하는 코드. 여기서 변경된 IP가 나오면 성공적으로 우회가된것
-        """
-        
-        test_url = 'http://ipv4.icanhazip.com' 
-        while True: # 제대로된 프록시가 나올때까지 무한반복 
-            requests = self.req_proxy.generate_proxied_request(test_url)
-
-            if requests is not None:
-                print("\t Response: ip={0}".format(u''.join(requests.text).encode('utf-8')))
-                proxy = self.req_proxy.current_proxy
-                break
-
-            else:
-                continue
-                
-        return proxy # 잘작동된 proxy를 뽑아준다. 
-        
-    def crawling(self):
-       header = Headers(
-                    browser="chrome",  # Generate only Chrome UA
-                    os="win",  # Generate ony Windows platform
-                    headers=True  # generate misc headers
-                )
-       self.headers = header.generate() # 랜덤 유저 에이전트를 생성해주는 함수.
-       _url = 원하는 주소 
-       
-       self.proxies = {} # request.get 인자에 넣어줄 딕셔너리 생성 
-       self.proxies['http'] = 'http://%s' % self.proxy
-       
-       html = self.session.get(_url, headers=self.headers,proxies=self.proxies).content
-       # get 인자에 프록시와 헤더를 넣어주면 끝.
\ No newline at end of file
+    async def validate(
+        self, session, candidates=None, concurrency=CHECK_CONCURRENCY
+    ):
+        """
+        후보 proxy들을 동시에 확인해서 동작하는 것만 pool에 넣는다.
+        :param candidates: 확인할 주소들, 없으면 아직 pool에 없는 후보들
+        :return: pool에 있는 proxy 수
+        """
+        if candidates is not None:
+            self.candidates = list(
+                dict.fromkeys([*self.candidates, *candidates])
+            )
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def check(url):
+            async with semaphore:
+                return await self._check(session, url)
+
+        pending = [url for url in self.candidates if url not in self.healthy]
+        for proxy in await asyncio.gather(*[check(url) for url in pending]):
+            if proxy is not None:
+                self.healthy[proxy.url] = proxy
+        log.info(
+            "Proxy pool: %d/%d alive", len(self.healthy), len(self.candidates)
+        )
+        return len(self.healthy)
+
+    async def run(self, session, interval=REVALIDATE_INTERVAL):
+        """
+        interval마다 pool에 없는 후보들을 다시 확인한다. 취소될 때까지 돈다.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.validate(session)
+
+    def pick(self):
+        """
+        무작위로 두 proxy를 골라 score가 좋은 쪽을 돌려준다.
+        좋은 proxy를 주로 쓰면서도 요청이 한 곳에 몰리지 않는다.
+        """
+        if not self.healthy:
+            raise NoProxyAvailable("no healthy proxy in the pool")
+        proxies = list(self.healthy.values())
+        if len(proxies) == 1:
+            return proxies[0]
+        return min(random.sample(proxies, 2), key=lambda proxy: proxy.score)
+
+    def report(self, proxy: Proxy, latency: float = None, error=False):
+        proxy.record(latency, error)
+        if proxy.failures >= self.max_failures:
+            log.warning("Evicting %s", proxy)
+            self.healthy.pop(proxy.url, None)
+
+    @contextlib.asynccontextmanager
+    async def request(self, session, method: str, url: str, **kwargs):
+        """
+        pool에서 고른 proxy를 거쳐 session.request()를 보낸다.
+        proxy 별 rate를 지키고, 결과로 proxy의 score를 갱신한다.
+        """
+        proxy = self.pick()
+        await proxy.bucket.take()
+        start = time.monotonic()
+        try:
+            async with session.request(
+                method, url, proxy=proxy.url, **kwargs
+            ) as response:
+                failed = response.status in RETRY_STATUSES
+                self.report(proxy, time.monotonic() - start, failed)
+                yield response
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            self.report(proxy, error=True)
+            raise
@@ -0,0 +1,78 @@
+import asyncio
+import contextlib
+
+import aiohttp
+
+from utils.metrics import METRICS
+
+# 크롤러 전체에서 동시에 열어둘 최대 연결 수
+LIMIT = 64
+# host 하나에 동시에 열어둘 최대 연결 수
+LIMIT_PER_HOST = 8
+# DNS 조회 결과를 캐싱할 시간(초)
+DNS_CACHE_TTL = 600
+# 사용이 끝난 연결을 재사용을 위해 열어두는 시간(초)
+KEEPALIVE_TIMEOUT = 60
+# 요청 하나에 허용하는 최대 시간(초)
+REQUEST_TIMEOUT = 30
+
+
+def create_session(
+    headers: dict = None,
+    cookies: dict = None,
+    limit: int = LIMIT,
+    limit_per_host: int = LIMIT_PER_HOST,
+    timeout: float = REQUEST_TIMEOUT,
+    **kwargs,
+):
+    """
+    모든 크롤러가 함께 쓰는 aiohttp session을 생성한다.
+    페이지마다 session을 새로 만들지 말고 이 session 하나를 넘겨서 쓸 것.
+    :param headers: 모든 요청에 기본으로 들어갈 header
+    :param cookies: 모든 요청에 기본으로 들어갈 cookie
+    :param limit: 전체 동시 연결 수
+    :param limit_per_host: host 당 동시 연결 수
+    :param timeout: 요청 하나의 제한 시간(초)
+    :return: aiohttp.ClientSession
+    모든 요청은 METRICS에 host 별로 기록된다.
+    """
+    trace_configs = [*kwargs.pop("trace_configs", ()), METRICS.trace_config()]
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        use_dns_cache=True,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=headers,
+        cookies=cookies,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        trace_configs=trace_configs,
+        **kwargs,
+    )
+
+
+async def close_session(session: aiohttp.ClientSession):
+    """
+    session을 닫고 SSL 연결이 정리될 시간을 잠깐 준다.
+    바로 loop를 닫으면 "Unclosed connection" 경고가 남는다.
+    """
+    if session.closed:
+        return
+    await session.close()
+    await asyncio.sleep(0.25)
+
+
+@contextlib.asynccontextmanager
+async def shared_session(**kwargs):
+    """
+    create_session()으로 만든 session을 async with 블록 동안 빌려준다.
+    :param kwargs: create_session()에 그대로 넘길 인자
+    """
+    session = create_session(**kwargs)
+    try:
+        yield session
+    finally:
+        await close_session(session)
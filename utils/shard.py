@@ -0,0 +1,244 @@
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# 여러 worker가 함께 쓰는 lease 파일 (같은 디스크를 보는 프로세스/노드끼리)
+LEASE_PATH = os.environ.get("ILGAMINATI_LEASES", "leases.sqlite3")
+# 이 worker의 이름 (worker마다 달라야 한다)
+WORKER_ID = os.environ.get(
+    "ILGAMINATI_WORKER", f"{socket.gethostname()}:{os.getpid()}"
+)
+# lease와 heartbeat의 유효 시간(초)
+# 이만큼 소식이 없는 worker는 죽은 것으로 보고 그 게시판을 나눠 가진다
+LEASE_TTL = 60
+# 처음 시작할 때 함께 뜨는 worker들의 heartbeat를 기다리는 시간(초)
+SETTLE_TIME = 3
+# ring에서 worker 하나가 차지하는 점의 수 (많을수록 고르게 나뉨)
+REPLICAS = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    heartbeat_ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    board TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_ts REAL NOT NULL
+);
+"""
+
+
+def _hash(key: str):
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HashRing:
+    """
+    consistent hashing ring
+    worker가 늘거나 줄어도 대부분의 게시판은 맡던 worker에 그대로 남는다.
+    """
+
+    def __init__(self, nodes, replicas: int = REPLICAS):
+        self.points = sorted(
+            (_hash(f"{node}#{i}"), node)
+            for node in nodes
+            for i in range(replicas)
+        )
+        self._keys = [point for point, _ in self.points]
+
+    def owner(self, key: str):
+        """
+        :return: key를 맡을 node (node가 없으면 None)
+        """
+        if not self.points:
+            return None
+        i = bisect.bisect(self._keys, _hash(key)) % len(self.points)
+        return self.points[i][1]
+
+
+class Shard:
+    """
+    여러 worker(프로세스/노드)가 게시판을 나눠 맡게 하는 SQLite lease table
+    worker들은 heartbeat를 남기고, 살아 있는 worker들의 HashRing에서 자기
+    몫인 게시판의 lease를 잡는다. lease는 주기적으로 갱신하며, 죽은 worker의
+    lease가 만료되면 ring에서 그 게시판을 새로 맡게 된 worker가 가져간다.
+    잠금을 기다리는 동안 event loop가 멈추지 않도록 트랜잭션은 thread에서
+    돌리고, 연결은 self.lock을 잡은 thread 하나만 쓴다.
+    """
+
+    def __init__(
+        self,
+        worker: str = WORKER_ID,
+        path: str = LEASE_PATH,
+        ttl: float = LEASE_TTL,
+        replicas: int = REPLICAS,
+    ):
+        """
+        :param worker: 이 worker의 이름
+        :param path: lease table을 둘 SQLite 파일
+        :param ttl: lease와 heartbeat의 유효 시간(초)
+        :param replicas: ring에서 worker 하나가 차지하는 점의 수
+        """
+        self.worker = worker
+        self.ttl = ttl
+        self.replicas = replicas
+        self.boards = set()
+        self.held = set()
+        self.lock = threading.Lock()
+        # 트랜잭션은 _transaction()에서 직접 연다
+        self.conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        """
+        잡고 있던 lease를 모두 놓고 worker 목록에서 빠진다.
+        """
+        with self._transaction():
+            self.conn.execute(
+                "DELETE FROM leases WHERE owner = ?", (self.worker,)
+            )
+            self.conn.execute(
+                "DELETE FROM workers WHERE worker = ?", (self.worker,)
+            )
+        self.held.clear()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *err):
+        self.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        다른 worker와 겹치지 않도록 쓰기 잠금을 먼저 잡는 트랜잭션
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _heartbeat(self, now: float):
+        self.conn.execute(
+            "INSERT INTO workers VALUES (?, ?) ON CONFLICT (worker) "
+            "DO UPDATE SET heartbeat_ts = excluded.heartbeat_ts",
+            (self.worker, now),
+        )
+
+    def _beat(self):
+        with self._transaction():
+            self._heartbeat(time.time())
+
+    async def register(self, platform: str, boards):
+        """
+        platform에서 나눠 맡을 게시판들을 알려주고 바로 sync()한다.
+        전에 알려준 목록을 바꾸며, 빠진 게시판의 lease는 갱신하지 않는다.
+        """
+        prefix = platform + "/"
+        # thread에서 도는 sync()가 보고 있을 수 있으므로 새 set으로 바꾼다
+        self.boards = {
+            board for board in self.boards if not board.startswith(prefix)
+        } | {prefix + str(board) for board in boards}
+        await asyncio.to_thread(self.sync)
+
+    def holds(self, platform: str, board):
+        """
+        :return: 이 worker가 지금 board의 lease를 잡고 있으면 True
+        """
+        return f"{platform}/{board}" in self.held
+
+    def sync(self):
+        """
+        heartbeat를 남기고, 살아 있는 worker들의 ring에 맞춰 자기 몫의
+        lease는 잡거나 갱신하고 남의 몫이 된 lease는 놓는다.
+        잠금을 기다리며 막히므로 event loop에서는 asyncio.to_thread로 부른다.
+        :return: 잡고 있는 게시판 수
+        """
+        boards = self.boards
+        now = time.time()
+        with self._transaction():
+            self._heartbeat(now)
+            # 오래전에 죽은 worker는 지운다
+            self.conn.execute(
+                "DELETE FROM workers WHERE heartbeat_ts < ?",
+                (now - 10 * self.ttl,),
+            )
+            live = [
+                worker
+                for worker, in self.conn.execute(
+                    "SELECT worker FROM workers WHERE heartbeat_ts >= ?",
+                    (now - self.ttl,),
+                )
+            ]
+            ring = HashRing(live, self.replicas)
+            for board in boards:
+                if ring.owner(board) == self.worker:
+                    self.conn.execute(
+                        "INSERT INTO leases VALUES (?, ?, ?) "
+                        "ON CONFLICT (board) DO UPDATE SET "
+                        "owner = excluded.owner, "
+                        "expires_ts = excluded.expires_ts "
+                        "WHERE owner = excluded.owner OR expires_ts < ?",
+                        (board, self.worker, now + self.ttl, now),
+                    )
+                else:
+                    self.conn.execute(
+                        "DELETE FROM leases WHERE board = ? AND owner = ?",
+                        (board, self.worker),
+                    )
+            held = {
+                board
+                for board, in self.conn.execute(
+                    "SELECT board FROM leases "
+                    "WHERE owner = ? AND expires_ts > ?",
+                    (self.worker, now),
+                )
+            }
+        if held != self.held:
+            log.info(
+                "%s holds %d/%d boards (%d workers)",
+                self.worker,
+                len(held),
+                len(boards),
+                len(live),
+            )
+        self.held = held
+        return len(held)
+
+    async def start(self, settle: float = SETTLE_TIME):
+        """
+        heartbeat를 남기고 함께 뜨는 worker들의 heartbeat를 기다린다.
+        바로 게시판을 잡으면 먼저 뜬 worker가 전부 가져가 버린다.
+        """
+        await asyncio.to_thread(self._beat)
+        await asyncio.sleep(settle)
+        return self
+
+    async def run(self):
+        """
+        취소될 때까지 ttl의 1/3마다 sync()한다.
+        """
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await asyncio.to_thread(self.sync)
+            except sqlite3.Error as e:
+                log.warning("Failed to sync leases: %r", e)
@@ -0,0 +1,259 @@
+import logging
+import os
+import sqlite3
+import time
+
+from utils.frontier import HighWaterMarks
+
+log = logging.getLogger(__name__)
+
+STATE_PATH = os.environ.get("ILGAMINATI_STATE", "crawl_state.sqlite3")
+# 이미 올린 글의 추천/조회 수를 다시 기록하기까지의 간격(초)
+REFRESH_INTERVAL = 6 * 60 * 60
+# 이만큼 기록할 때마다 commit
+COMMIT_EVERY = 100
+# shared일 때 다른 프로세스의 쓰기 잠금을 기다리는 시간(초)
+# 이보다 오래 잡혀 있으면 event loop를 막지 않고 다음 기록 때 다시 commit한다
+SHARED_TIMEOUT = 0.1
+# 닫을 때 남은 기록을 commit하려고 잠금을 기다리는 시간(초)
+CLOSE_TIMEOUT = 30
+
+NEW = "new"
+STALE = "stale"
+FRESH = "fresh"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS boards (
+    platform TEXT NOT NULL,
+    board TEXT NOT NULL,
+    last_post_id INTEGER NOT NULL,
+    updated_ts REAL NOT NULL,
+    PRIMARY KEY (platform, board)
+);
+CREATE TABLE IF NOT EXISTS posts (
+    platform TEXT NOT NULL,
+    board TEXT NOT NULL,
+    post_id INTEGER NOT NULL,
+    crawled_ts REAL NOT NULL,
+    refreshed_ts REAL NOT NULL,
+    likes INTEGER,
+    dislikes INTEGER,
+    views INTEGER,
+    agree INTEGER,
+    PRIMARY KEY (platform, board, post_id)
+);
+CREATE TABLE IF NOT EXISTS comments (
+    platform TEXT NOT NULL,
+    board TEXT NOT NULL,
+    post_id INTEGER NOT NULL,
+    last_comment_no INTEGER NOT NULL,
+    updated_ts REAL NOT NULL,
+    PRIMARY KEY (platform, board, post_id)
+);
+"""
+
+
+def _locked(e: sqlite3.OperationalError):
+    """
+    :return: 다른 연결이 잠금을 잡고 있어서 난 에러면 True
+    """
+    return "locked" in str(e)
+
+
+class CrawlState:
+    """
+    실행 사이에 유지되는 크롤링 상태 (SQLite)
+    게시판 별 high-water mark와 이미 올린 글의 추천/조회 수를 기록해서
+    같은 글을 다시 가져오거나 올리지 않도록 한다.
+    기록은 모아 두었다가 commit하며, commit 전의 기록도 check() 등에서
+    바로 보인다.
+    """
+
+    def __init__(
+        self,
+        path: str = STATE_PATH,
+        refresh_interval=REFRESH_INTERVAL,
+        shared: bool = False,
+    ):
+        """
+        :param path: SQLite 파일 경로 (":memory:"면 실행 동안만 유지)
+        :param refresh_interval: 올린 글의 수치를 다시 기록하는 간격(초)
+        :param shared: 여러 프로세스가 같은 파일을 쓸 때 True
+                       (WAL로 열고, 쓰기 잠금을 오래 잡지 않도록 매번
+                        commit하되 잠금은 SHARED_TIMEOUT까지만 기다린다)
+        """
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.commit_every = 1 if shared else COMMIT_EVERY
+        self.conn = sqlite3.connect(
+            path, timeout=SHARED_TIMEOUT if shared else 5
+        )
+        if shared:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        # commit하지 못한 기록 [(sql, params)]
+        self._backlog = []
+        # 그 기록들이 바꾸는 값 (commit 전에도 읽을 수 있도록)
+        self._posts = {}  # (platform, board, post_id) -> refreshed_ts
+        self._comments = {}  # (platform, board, post_id) -> last_comment_no
+        self._marks = {}  # (platform, board) -> last_post_id
+
+    def close(self):
+        # 남은 기록은 잠금을 오래 기다려서라도 commit한다
+        self.conn.execute(f"PRAGMA busy_timeout = {CLOSE_TIMEOUT * 1000}")
+        if not self._flush():
+            log.warning("Dropped %d state writes", len(self._backlog))
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *err):
+        self.close()
+
+    def _write(self, sql: str, params):
+        self._backlog.append((sql, params))
+        if len(self._backlog) >= self.commit_every:
+            self._flush()
+
+    def _flush(self):
+        """
+        모아 둔 기록을 commit한다. 다른 프로세스가 쓰기 잠금을 잡고 있으면
+        되돌리고 기록을 남겨 두었다가 다음 기록 때 다시 시도한다.
+        :return: commit했으면 True
+        """
+        try:
+            for sql, params in self._backlog:
+                self.conn.execute(sql, params)
+            self.conn.commit()
+        except sqlite3.OperationalError as e:
+            self.conn.rollback()
+            if not _locked(e):
+                raise
+            log.debug("State is locked, %d writes pending", len(self._backlog))
+            return False
+        self._backlog.clear()
+        self._posts.clear()
+        self._comments.clear()
+        self._marks.clear()
+        return True
+
+    def high_water_marks(self, platform: str):
+        rows = self.conn.execute(
+            "SELECT board, last_post_id FROM boards WHERE platform = ?",
+            (platform,),
+        )
+        marks = dict(rows)
+        for (pending, board), post_id in self._marks.items():
+            if pending == platform:
+                marks[board] = max(marks.get(board, 0), post_id)
+        return HighWaterMarks(marks)
+
+    def save_marks(self, platform: str, marks: HighWaterMarks, boards=None):
+        """
+        marks에서 이번 실행을 끝까지 마친 게시판들의 mark만 저장한다.
+        :param boards: 저장할 게시판들 (없으면 전부)
+        """
+        completed = marks.completed()
+        if boards is not None:
+            completed = {
+                board: completed[board]
+                for board in boards
+                if board in completed
+            }
+        now = time.time()
+        for board, post_id in completed.items():
+            key = (platform, board)
+            self._marks[key] = max(self._marks.get(key, 0), post_id)
+            self._backlog.append(
+                (
+                    "INSERT INTO boards VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (platform, board) DO UPDATE SET "
+                    "last_post_id = MAX(last_post_id, excluded.last_post_id), "
+                    "updated_ts = excluded.updated_ts",
+                    (platform, board, post_id, now),
+                )
+            )
+        self._flush()
+
+    def check(self, platform: str, board: str, post_id: int):
+        """
+        :return: NEW(처음 본 글), STALE(수치를 다시 기록할 때가 된 글),
+                 FRESH(최근에 기록한 글) 중 하나
+        """
+        refreshed = self._posts.get((platform, board, post_id))
+        if refreshed is None:
+            row = self.conn.execute(
+                "SELECT refreshed_ts FROM posts "
+                "WHERE platform = ? AND board = ? AND post_id = ?",
+                (platform, board, post_id),
+            ).fetchone()
+            if row is None:
+                return NEW
+            refreshed = row[0]
+        if time.time() - refreshed >= self.refresh_interval:
+            return STALE
+        return FRESH
+
+    def record_post(
+        self,
+        platform: str,
+        board: str,
+        post_id: int,
+        likes=None,
+        dislikes=None,
+        views=None,
+        agree=None,
+    ):
+        """
+        가져온 글의 수치를 기록한다.
+        None인 수치는 기존 값을 유지한다.
+        """
+        now = time.time()
+        self._posts[platform, board, post_id] = now
+        self._write(
+            "INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (platform, board, post_id) DO UPDATE SET "
+            "refreshed_ts = excluded.refreshed_ts, "
+            "likes = COALESCE(excluded.likes, likes), "
+            "dislikes = COALESCE(excluded.dislikes, dislikes), "
+            "views = COALESCE(excluded.views, views), "
+            "agree = COALESCE(excluded.agree, agree)",
+            (
+                platform,
+                board,
+                post_id,
+                now,
+                now,
+                likes,
+                dislikes,
+                views,
+                agree,
+            ),
+        )
+
+    def comment_mark(self, platform: str, board: str, post_id: int):
+        """
+        :return: 지난 실행까지 가져온 가장 큰 댓글 번호 (없으면 0)
+        """
+        row = self.conn.execute(
+            "SELECT last_comment_no FROM comments "
+            "WHERE platform = ? AND board = ? AND post_id = ?",
+            (platform, board, post_id),
+        ).fetchone()
+        pending = self._comments.get((platform, board, post_id), 0)
+        return max(row[0] if row else 0, pending)
+
+    def save_comment_mark(
+        self, platform: str, board: str, post_id: int, comment_no: int
+    ):
+        key = (platform, board, post_id)
+        self._comments[key] = max(self._comments.get(key, 0), comment_no)
+        self._write(
+            "INSERT INTO comments VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (platform, board, post_id) DO UPDATE SET "
+            "last_comment_no = "
+            "MAX(last_comment_no, excluded.last_comment_no), "
+            "updated_ts = excluded.updated_ts",
+            (platform, board, post_id, comment_no, time.time()),
+        )
@@ -0,0 +1,32 @@
+import os
+import random
+
+# 요청에 붙일 User-Agent 후보 (최근 데스크톱 브라우저들)
+# fake_useragent는 import할 때 큰 목록을 읽거나 네트워크를 타서 시작이 느려진다.
+USER_AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36 Edg/124.0.0.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) "
+    "Gecko/20100101 Firefox/125.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.4.1 Safari/605.1.15",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14.4; rv:125.0) "
+    "Gecko/20100101 Firefox/125.0",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:125.0) "
+    "Gecko/20100101 Firefox/125.0",
+)
+# 있으면 후보 대신 항상 이 User-Agent를 쓴다
+USER_AGENT = os.environ.get("ILGAMINATI_USER_AGENT")
+
+
+def random_user_agent():
+    """
+    :return: USER_AGENTS 중 무작위로 고른 하나 (USER_AGENT가 있으면 그것)
+    """
+    return USER_AGENT or random.choice(USER_AGENTS)